@@ -0,0 +1,46 @@
+"""Text assets (thank-you lines, daily prompts), loaded on first use."""
+
+from collections.abc import Sequence
+
+
+class AssetLines(Sequence):
+    """Non-empty stripped lines of a text file, read the first time they are needed.
+
+    Behaves like a read-only list, so random.choice() works on it directly.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lines: list[str] | None = None
+
+    def _get(self) -> list[str]:
+        if self._lines is None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._lines = [line.strip() for line in f if line.strip()]
+        return self._lines
+
+    def reload(self) -> int:
+        """Re-read the file and swap the lines in at once. Returns their number.
+
+        An empty or unreadable file raises and keeps the previous lines.
+        """
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        if not lines:
+            raise ValueError(f"{self.path} has no lines")
+        self._lines = lines
+        return len(lines)
+
+    def __getitem__(self, index):
+        return self._get()[index]
+
+    def __len__(self) -> int:
+        return len(self._get())
+
+    def __repr__(self) -> str:
+        state = "not loaded" if self._lines is None else f"{len(self._lines)} lines"
+        return f"AssetLines({self.path!r}, {state})"
+
+
+THANKS_LINES = AssetLines("assets/thanks.txt")
+PROMPT_LINES = AssetLines("assets/daily_prompts.txt")
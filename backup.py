@@ -0,0 +1,352 @@
+"""Incremental, consistent backups of the data directories.
+
+Each backup is a manifest (backups/manifests/<name>.json) listing every
+data file with the SHA-256 of its content; the content itself is stored
+once under backups/objects/<sha[:2]>/<sha>. A file that did not change
+since the previous backup costs one manifest line: its hash is taken from
+a stat cache (storage replaces files on every write, so an unchanged
+inode, mtime and size mean unchanged content) without reading it.
+
+A directory's files are read while holding that directory's storage lock,
+so a backup never sees a half-applied multi-file commit or a file caught
+between the temporary write and the rename. SQLite files (the job store)
+are copied through SQLite itself. create, restore and prune hold
+backups/.lock, so a prune never deletes the objects of a backup whose
+manifest is not written yet.
+
+    python backup.py create
+    python backup.py list
+    python backup.py verify [NAME]
+    python backup.py restore NAME [--target DIR]
+    python backup.py prune --keep 24 --keep-days 14
+"""
+
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKUP_DIR = "backups"
+
+# Never backed up: lock, journal, temporary files, the lease and trace logs
+SKIP_NAMES = (storage.LOCK_FILE, storage.JOURNAL_FILE)
+SKIP_SUFFIXES = (".tmp", ".lease", ".jsonl")
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read(path: str) -> bytes:
+    if path.endswith(".sqlite"):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.serialize()
+        finally:
+            conn.close()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _data_files(directory: str) -> list[str]:
+    """Files of one data directory (not its subdirectories) worth backing up."""
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(directory, name) for name in names
+        if name not in SKIP_NAMES and not name.endswith(SKIP_SUFFIXES)
+        and os.path.isfile(os.path.join(directory, name))
+    ]
+
+
+def data_dirs(tenant_configs: dict | None = None) -> list[str]:
+    """DEFAULT_DATA_DIR and every directory below it, plus each chat's data_dir."""
+    dirs = []
+    for root, subdirs, _ in os.walk(storage.DEFAULT_DATA_DIR):
+        subdirs.sort()
+        dirs.append(os.path.normpath(root))
+    for tenant in (tenant_configs or {}).values():
+        path = os.path.normpath(tenant["data_dir"])
+        if path not in dirs:
+            dirs.append(path)
+    return dirs
+
+
+class BackupStore:
+    """Content-addressed objects plus one manifest per backup."""
+
+    def __init__(self, root: str = DEFAULT_BACKUP_DIR):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.manifests = os.path.join(root, "manifests")
+        self._stat_cache_path = os.path.join(root, "stat_cache.json")
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold the backup directory's lock (flock, so also across processes)."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _object_path(self, sha: str) -> str:
+        return os.path.join(self.objects, sha[:2], sha)
+
+    def _load_stat_cache(self) -> dict:
+        try:
+            with open(self._stat_cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def names(self) -> list[str]:
+        """Backup names, oldest first."""
+        try:
+            return sorted(n[:-5] for n in os.listdir(self.manifests) if n.endswith(".json"))
+        except FileNotFoundError:
+            return []
+
+    def manifest(self, name: str) -> dict:
+        with open(os.path.join(self.manifests, f"{name}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def create(self, dirs: list[str]) -> dict:
+        """Back up *dirs*. Returns the manifest plus "new_objects"/"new_bytes"/"ms"."""
+        with self.locked():
+            return self._create(dirs)
+
+    def _create(self, dirs: list[str]) -> dict:
+        started = time.perf_counter()
+        cache = self._load_stat_cache()
+        new_cache = {}
+        files = {}
+        fresh: dict[str, bytes] = {}
+        for directory in dirs:
+            # One consistent point in time per directory: no commit runs
+            # meanwhile. Only stat and read under the lock; hash afterwards.
+            read: dict[str, tuple] = {}
+            with storage.namespace(directory), storage.locked():
+                for path in _data_files(directory):
+                    st = os.stat(path)
+                    stamp = [st.st_ino, st.st_mtime_ns, st.st_size]
+                    hit = cache.get(path)
+                    if (hit and hit[:3] == stamp and not path.endswith(".sqlite")
+                            and os.path.exists(self._object_path(hit[3]))):
+                        read[path] = (stamp, hit[3], None)
+                    else:
+                        read[path] = (stamp, None, _read(path))
+            for path, (stamp, sha, data) in read.items():
+                if data is None:
+                    size = stamp[2]
+                else:
+                    sha, size = _sha256(data), len(data)
+                    fresh[sha] = data
+                files[path] = {"sha256": sha, "size": size}
+                new_cache[path] = stamp + [sha]
+
+        new_objects = new_bytes = 0
+        for sha, data in fresh.items():
+            target = self._object_path(sha)
+            if not os.path.exists(target):
+                _write_atomic(target, data)
+                new_objects += 1
+                new_bytes += len(data)
+
+        now = datetime.now(timezone.utc)
+        name = now.strftime("%Y%m%dT%H%M%S%fZ")
+        manifest = {"name": name, "created_at": now.isoformat(), "files": files}
+        _write_atomic(os.path.join(self.manifests, f"{name}.json"),
+                      json.dumps(manifest, indent=2).encode("utf-8"))
+        _write_atomic(self._stat_cache_path, json.dumps(new_cache).encode("utf-8"))
+        elapsed = (time.perf_counter() - started) * 1000
+        logger.info("Бэкап %s: файлов %d, новых объектов %d (%d байт), %.0f мс",
+                    name, len(files), new_objects, new_bytes, elapsed)
+        return {**manifest, "new_objects": new_objects, "new_bytes": new_bytes, "ms": elapsed}
+
+    def verify(self, name: str | None = None, deep: bool = True) -> list[str]:
+        """Check that every object of backup *name* (default: all) exists and matches its hash.
+
+        With deep=False only existence and size are checked, which does not
+        read the objects. Returns the problems found; empty means the backup
+        can be restored.
+        """
+        problems = []
+        checked = set()
+        for backup in [name] if name else self.names():
+            for path, entry in self.manifest(backup)["files"].items():
+                sha = entry["sha256"]
+                if sha in checked:
+                    continue
+                checked.add(sha)
+                try:
+                    if not deep:
+                        if os.path.getsize(self._object_path(sha)) != entry["size"]:
+                            problems.append(f"{backup}: {path}: object {sha[:12]} has the wrong size")
+                        continue
+                    with open(self._object_path(sha), "rb") as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    problems.append(f"{backup}: {path}: object {sha[:12]} is missing")
+                    continue
+                if _sha256(data) != sha:
+                    problems.append(f"{backup}: {path}: object {sha[:12]} is corrupt")
+                elif path.endswith(".json"):
+                    try:
+                        json.loads(data)
+                    except ValueError:
+                        problems.append(f"{backup}: {path}: not valid JSON")
+        return problems
+
+    def restore(self, name: str, target: str | None = None) -> int:
+        """Write the files of backup *name* back (below *target* if given). Returns the count.
+
+        Restore into the live data directories only while the bot is stopped.
+        With *target*, absolute directories are placed below it too, and a
+        directory that would end up outside it is refused.
+        """
+        with self.locked():
+            return self._restore(name, target)
+
+    def _restore(self, name: str, target: str | None) -> int:
+        problems = self.verify(name)
+        if problems:
+            raise ValueError("; ".join(problems))
+        files = self.manifest(name)["files"]
+        by_dir: dict[str, list[str]] = {}
+        for path in files:
+            by_dir.setdefault(os.path.dirname(path), []).append(path)
+        out_dirs = {}
+        for directory in by_dir:
+            if not target:
+                out_dirs[directory] = directory
+                continue
+            rel = os.path.normpath(os.path.splitdrive(directory)[1].lstrip(os.sep) or ".")
+            if rel == ".." or rel.startswith(".." + os.sep):
+                raise ValueError(f"{directory}: outside of {target}")
+            out_dirs[directory] = os.path.join(target, rel)
+        for directory, paths in by_dir.items():
+            out_dir = out_dirs[directory]
+            with storage.namespace(out_dir), storage.locked():
+                for path in paths:
+                    with open(self._object_path(files[path]["sha256"]), "rb") as f:
+                        _write_atomic(os.path.join(out_dir, os.path.basename(path)), f.read())
+        logger.info("Бэкап %s восстановлен в %s: файлов %d", name, target or ".", len(files))
+        return len(files)
+
+    def prune(self, keep: int = 24, keep_days: int = 14) -> tuple[int, int]:
+        """Keep the newest *keep* backups plus the last one of each of the last
+        *keep_days* days; delete the rest and objects no backup refers to.
+
+        Returns (backups removed, objects removed).
+        """
+        with self.locked():
+            return self._prune(keep, keep_days)
+
+    def _prune(self, keep: int, keep_days: int) -> tuple[int, int]:
+        names = self.names()
+        kept = set(names[-keep:]) if keep > 0 else set()
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=keep_days)).strftime("%Y%m%d")
+        last_per_day = {}
+        for name in names:
+            if name[:8] >= cutoff:
+                last_per_day[name[:8]] = name
+        kept.update(last_per_day.values())
+
+        removed = 0
+        for name in names:
+            if name not in kept:
+                os.remove(os.path.join(self.manifests, f"{name}.json"))
+                removed += 1
+
+        used = set()
+        for name in kept:
+            used.update(e["sha256"] for e in self.manifest(name)["files"].values())
+        orphans = 0
+        for root, _, object_names in os.walk(self.objects):
+            for sha in object_names:
+                if sha not in used:
+                    os.remove(os.path.join(root, sha))
+                    orphans += 1
+        if removed or orphans:
+            logger.info("Старые бэкапы удалены: %d, объектов: %d", removed, orphans)
+        return removed, orphans
+
+
+def run(config: dict, tenant_configs: dict | None = None) -> dict:
+    """Create, verify and prune with the settings from *config* (for the bot)."""
+    store = BackupStore(config.get("backup_dir", DEFAULT_BACKUP_DIR))
+    result = store.create(data_dirs(tenant_configs))
+    result["problems"] = store.verify(result["name"], deep=False)
+    store.prune(config.get("backup_keep", 24), config.get("backup_keep_days", 14))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backup-dir", default=DEFAULT_BACKUP_DIR,
+                        help="where backups are kept (default: %(default)s)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("create")
+    sub.add_parser("list")
+    verify = sub.add_parser("verify")
+    verify.add_argument("name", nargs="?")
+    restore = sub.add_parser("restore")
+    restore.add_argument("name")
+    restore.add_argument("--target", help="restore below this directory instead of in place")
+    prune = sub.add_parser("prune")
+    prune.add_argument("--keep", type=int, default=24)
+    prune.add_argument("--keep-days", type=int, default=14)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    store = BackupStore(args.backup_dir)
+    if args.command == "create":
+        tenant_configs = None
+        if os.path.exists("config.json"):
+            import tenants
+            with open("config.json", "r", encoding="utf-8") as f:
+                tenant_configs = tenants.load_tenants(json.load(f))
+        store.create(data_dirs(tenant_configs))
+    elif args.command == "list":
+        for name in store.names():
+            files = store.manifest(name)["files"]
+            size = sum(e["size"] for e in files.values())
+            print(f"{name}  {len(files)} files  {size / 1024:.1f} KB")
+    elif args.command == "verify":
+        problems = store.verify(args.name)
+        for problem in problems:
+            print(problem)
+        print("OK" if not problems else f"{len(problems)} problem(s)")
+        return 1 if problems else 0
+    elif args.command == "restore":
+        store.restore(args.name, args.target)
+    elif args.command == "prune":
+        store.prune(args.keep, args.keep_days)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,81 @@
+"""Benchmark: vectorized scoring vs. the per-poll dict loop.
+
+The PollMatrix is built once per change of poll_results.json and reused by
+every /results and weekly ranking until then, so the per-query cost is the
+window + score lines, compared against the loop that runs on every query.
+
+Usage: python bench_scoring.py [--polls N] [--options K] [--repeat R]
+"""
+
+import argparse
+import random
+import time
+import uuid
+
+import scoring
+from models import Poll, PollOption
+
+
+def make_polls(n_polls: int, n_options: int) -> list[Poll]:
+    rng = random.Random(42)
+    sids = [str(uuid.uuid4()) for _ in range(n_polls * n_options // 2 + 1)]
+    polls = []
+    for i in range(n_polls):
+        options = tuple(
+            PollOption(f"name {j}", rng.choice(sids), rng.randint(0, 30))
+            for j in range(n_options)
+        )
+        polls.append(Poll(f"p{i}", i, options, i * 1_000_000, "daily", True,
+                          rng.randint(5, 40)))
+    return polls
+
+
+def loop_scores(polls: list[Poll]) -> dict:
+    """The original aggregation: a Python dict loop over every poll option."""
+    scores: dict[str, int] = {}
+    for poll in polls:
+        if poll.type != "daily":
+            continue
+        for opt in poll.options:
+            sid = opt.suggestion_id
+            if sid:
+                scores[sid] = scores.get(sid, 0) + opt.voter_count
+    return scores
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--polls", type=int, default=5000)
+    parser.add_argument("--options", type=int, default=9)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    polls = make_polls(args.polls, args.options)
+    matrix = scoring.PollMatrix.from_polls(polls)
+
+    # Sanity check: raw scorer must match the loop
+    expected = loop_scores(polls)
+    raw = dict(zip(matrix.sids, matrix.raw().astype(int).tolist()))
+    assert raw == expected, "raw scorer disagrees with the loop"
+
+    print(f"{args.polls} polls x {args.options} options, best of {args.repeat}")
+    print(f"  dict loop (raw only)     {timed(lambda: loop_scores(polls), args.repeat):8.2f} ms")
+    print(f"  build PollMatrix (once)  {timed(lambda: scoring.PollMatrix.from_polls(polls), args.repeat):8.2f} ms")
+    week = (args.polls - 7) * 1_000_000
+    print(f"  window (last 7 polls)    {timed(lambda: matrix.since(week), args.repeat):8.2f} ms")
+    for name, scorer in scoring.SCORERS.items():
+        ms = timed(lambda: scorer(matrix), args.repeat)
+        print(f"  score {name:<18} {ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
 """Arkestrabot — main entry point."""
 
+import asyncio
+import functools
+import hashlib
 import json
 import logging
+import os
 import random
-import sys
 from datetime import datetime, timedelta, timezone
 
 import pytz
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from apscheduler.schedulers.base import STATE_RUNNING
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -16,32 +20,55 @@ from telegram.ext import (
     MessageHandler,
     PollAnswerHandler,
     PollHandler,
+    TypeHandler,
     filters,
 )
 
+import assets
+import backup
+import export
+import hotreload
+import httppool
+import leaderboard
+import lease
+import logsetup
+import loopwatch
+import ratelimit
+import scoring
+import startup
+import stats
 import storage
+import tenants
+import textindex
+import tracing
+from leaderboard import format_results
 from scheduler import (
     close_open_polls,
     create_scheduler,
     run_daily_poll,
     run_daily_prompt,
+    run_for_tenant,
+    run_job,
     run_weekly_poll,
+    suggest_url,
+    sync_tenant_jobs,
     thread_kwargs,
 )
 
 logger = logging.getLogger(__name__)
 
-# Global references set at startup
+# Global references set at startup. CONFIG is the root config; per-chat
+# settings come from tenants.current() inside handlers and jobs.
 CONFIG: dict = {}
 SCHEDULER = None
+THROTTLE: ratelimit.SuggestionThrottle | None = None
+WATCHDOG = loopwatch.LoopWatchdog()
 
-# Load sarcastic thank-you lines
-with open("assets/thanks.txt", "r", encoding="utf-8") as _f:
-    THANKS_LINES = [line.strip() for line in _f if line.strip()]
+# Sarcastic thank-you lines, read on first use
+THANKS_LINES = assets.THANKS_LINES
 
-# Load daily prompt lines
-with open("assets/daily_prompts.txt", "r", encoding="utf-8") as _f:
-    PROMPT_LINES = [line.strip() for line in _f if line.strip()]
+# Max matches listed by /search
+SEARCH_LIMIT = 30
 
 # ConversationHandler states
 AWAITING_BAND_NAME = 0
@@ -65,7 +92,90 @@ WHATS_NEW = (
 # ---------------------------------------------------------------------------
 
 def is_admin(user_id: int) -> bool:
-    return user_id in CONFIG.get("admin_user_ids", [])
+    return user_id in tenants.current().get("admin_user_ids", [])
+
+
+def _tenant_for_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> dict:
+    chat = update.effective_chat
+    if chat is not None:
+        tenant = tenants.for_chat(chat.id)
+        if tenant:
+            return tenant
+    poll_id = (update.poll.id if update.poll
+               else update.poll_answer.poll_id if update.poll_answer else None)
+    if poll_id:
+        tenant = tenants.for_poll(poll_id)
+        if tenant:
+            return tenant
+    if context.user_data is not None:
+        tenant = tenants.for_key(context.user_data.get("tenant"))
+        if tenant:
+            return tenant
+    return tenants.default()
+
+
+def with_tenant(callback):
+    """Wrap a handler so it runs with the update's chat (tenant) bound."""
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with tenants.use(_tenant_for_update(update, context)):
+            return await callback(update, context)
+
+    return wrapper
+
+
+def near_duplicate(name: str) -> str | None:
+    """Return a stored name suspiciously close to *name* (exact repeats excluded)."""
+    threshold = tenants.current().get("near_duplicate_threshold", 0.7)
+    normalized = name.strip().lower()
+    for other, _ in storage.find_similar_suggestions(name, threshold):
+        if other.strip().lower() != normalized:
+            return other
+    return None
+
+
+def near_duplicate_rejected() -> bool:
+    return tenants.current().get("near_duplicate_action", "reject") == "reject"
+
+
+def _similar_note(similar: str | None) -> str:
+    """Suffix for the "accepted" reply when a near-duplicate was only flagged."""
+    if not similar:
+        return ""
+    logger.info("Похожее название принято (флаг): похоже на %r", similar)
+    return f"\n🤨 Подозрительно похоже на \"{similar}\", но ладно."
+
+
+async def reply_accepted(message, name: str, similar: str | None):
+    """Thank the author of an accepted suggestion."""
+    thanks = random.choice(THANKS_LINES)
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton(
+            "✏️ Предложить ещё одно название",
+            url=suggest_url(tenants.current()),
+        )
+    ]])
+    await message.reply_text(
+        f"🤘 Принято: \"{name}\"{_similar_note(similar)}\n\n{thanks}",
+        reply_markup=keyboard)
+
+
+def throttle_suggestion(name: str, user) -> tuple[str, str | None]:
+    """Run a submission through THROTTLE.
+
+    Returns (verdict, reply). reply is None when the suggestion should be
+    written right away; otherwise it is the text to send back.
+    """
+    if THROTTLE is None:
+        return ratelimit.ADMIT, None
+    verdict = THROTTLE.admit(name, user.id, user.first_name)
+    if verdict == ratelimit.LIMITED:
+        return verdict, "🐢 Помедленнее. Слишком много названий подряд, подожди немного."
+    if verdict == ratelimit.FULL:
+        return verdict, "🚧 Бот захлёбывается предложениями. Попробуй через минуту."
+    if verdict == ratelimit.QUEUED:
+        return verdict, f"📥 \"{name}\" в очереди. Запишу чуть позже, если это не повтор."
+    return verdict, None
 
 
 # ---------------------------------------------------------------------------
@@ -78,7 +188,7 @@ async def cmd_suggest(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyboard = InlineKeyboardMarkup([[
             InlineKeyboardButton(
                 "✏️ Предложить название",
-                url=f"https://t.me/{CONFIG['bot_username']}?start=suggest",
+                url=suggest_url(tenants.current()),
             )
         ]])
         await update.effective_message.reply_text(
@@ -99,23 +209,25 @@ async def cmd_suggest(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Telegram ограничивает варианты в опросе до 100 символов.")
         return
 
+    similar = near_duplicate(name)
+    if similar and near_duplicate_rejected():
+        await update.effective_message.reply_text(
+            f"🔁 \"{name}\" подозрительно похоже на \"{similar}\". Уже было.")
+        return
+
     user = update.effective_user
-    result = storage.add_suggestion(name, user.id, user.first_name)
+    _, reply = throttle_suggestion(name, user)
+    if reply:
+        await update.effective_message.reply_text(reply)
+        return
+
+    result = await asyncio.to_thread(storage.add_suggestion, name, user.id, user.first_name)
 
     if result is None:
         await update.effective_message.reply_text(
             f"🔁 Название \"{name}\" уже было предложено.")
     else:
-        thanks = random.choice(THANKS_LINES)
-        keyboard = InlineKeyboardMarkup([[
-            InlineKeyboardButton(
-                "✏️ Предложить ещё одно название",
-                url=f"https://t.me/{CONFIG['bot_username']}?start=suggest",
-            )
-        ]])
-        await update.effective_message.reply_text(
-            f"🤘 Принято: \"{name}\"\n\n{thanks}",
-            reply_markup=keyboard)
+        await reply_accepted(update.effective_message, name, similar)
 
 
 async def cmd_suggestions(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -124,14 +236,14 @@ async def cmd_suggestions(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.effective_message.reply_text("🔒 Эта команда только для админов.")
         return
 
-    unused = storage.get_unused_suggestions()
+    unused = storage.snapshot().unused
     if not unused:
         await update.effective_message.reply_text("📭 Нет неиспользованных предложений.")
         return
 
     lines = ["📋 Неиспользованные предложения:\n"]
     for i, s in enumerate(unused, 1):
-        lines.append(f"{i}. {s['name']} (от {s['author_name']})")
+        lines.append(f"{i}. {s.name} (от {s.author_name})")
     await update.effective_message.reply_text("\n".join(lines))
 
 
@@ -148,7 +260,7 @@ async def cmd_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     index = int(context.args[0])
-    removed = storage.delete_suggestion(index)
+    removed = await asyncio.to_thread(storage.delete_suggestion, index)
 
     if removed is None:
         await update.effective_message.reply_text(
@@ -158,87 +270,16 @@ async def cmd_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"🗑️ Удалено: \"{removed['name']}\" (от {removed['author_name']}).")
 
 
-def format_results(config: dict) -> str | None:
-    """Build results text (current week + past championships), filtering 0-vote entries.
-
-    Returns the formatted string or None if there are no results.
-    """
-    tz = pytz.timezone(config["timezone"])
-    weekly_results = storage.get_all_weekly_results()
-
-    # --- Current week section ---
-    if weekly_results:
-        latest_created = datetime.fromisoformat(weekly_results[0]["created_at"])
-        since_utc = latest_created
-    else:
-        since = datetime.now(tz) - timedelta(days=7)
-        since_utc = since.astimezone(timezone.utc)
-
-    scores = storage.get_daily_scores_since(since_utc)
-    sections = []
-
-    if scores:
-        now = datetime.now(tz)
-        since_local = since_utc.astimezone(tz) if weekly_results else (now - timedelta(days=7))
-        date_from = since_local.strftime("%-d %b").lower()
-        date_to = now.strftime("%-d %b").lower()
-        ranked = []
-        for sid, votes in scores.items():
-            if votes <= 0:
-                continue
-            suggestion = storage.get_suggestion_by_id(sid)
-            if suggestion:
-                ranked.append((suggestion["name"], votes))
-        ranked.sort(key=lambda x: -x[1])
-        if ranked:
-            lines = [f"📊 Очередная неделя 😩 ({date_from} — {date_to}):"]
-            for i, (name, votes) in enumerate(ranked, 1):
-                lines.append(f"{i}. {name} — {votes} гол.")
-            sections.append("\n".join(lines))
-
-    # --- Past weekly championships ---
-    total_weeks = len(weekly_results)
-    for week_idx, weekly in enumerate(weekly_results):
-        poll = storage.get_poll(weekly["poll_id"])
-        final_counts = {}
-        if poll:
-            for opt in poll["options"]:
-                final_counts[opt["suggestion_id"]] = opt.get("voter_count", 0)
-
-        created = datetime.fromisoformat(weekly["created_at"]).astimezone(tz)
-        week_start = (created - timedelta(days=7)).strftime("%-d %b").lower()
-        week_end = created.strftime("%-d %b").lower()
-
-        ranked_top = sorted(
-            weekly["top"],
-            key=lambda e: final_counts.get(e["suggestion_id"], e["votes"]),
-            reverse=True,
-        )
-        ranked_top = [
-            e for e in ranked_top
-            if final_counts.get(e["suggestion_id"], e["votes"]) > 0
-        ][:4]
-        if not ranked_top:
-            continue
-        week_num = total_weeks - week_idx
-        lines = [f"{week_num}. неделя 🤮 ({week_start} — {week_end}):"]
-        medals = ["🥇", "🥈", "🥉", "🏅"]
-        for i, entry in enumerate(ranked_top):
-            votes = final_counts.get(entry["suggestion_id"], entry["votes"])
-            line = f"{medals[i]} {entry['name']} — {votes} гол."
-            if weekly.get("revealed"):
-                line += f" (автор: {entry['author_name']})"
-            lines.append(line)
-        sections.append("\n".join(lines))
-
-    if not sections:
-        return None
-    return "\n\n".join(sections)
-
-
 async def cmd_results(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /results — current week standings + past weekly championships."""
-    text = format_results(CONFIG)
+    config = tenants.current()
+    if leaderboard.enabled(config):
+        message_id = await leaderboard.ensure(context.bot, config)
+        if message_id:
+            await update.effective_message.reply_text(
+                f"📌 Таблица обновляется сама: {leaderboard.message_link(config, message_id)}")
+            return
+    text = format_results(config)
     if not text:
         await update.effective_message.reply_text(
             "😶 Нет результатов голосований за эту неделю.")
@@ -246,29 +287,54 @@ async def cmd_results(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.effective_message.reply_text(text)
 
 
+async def cmd_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /search <words> — find suggestions by word prefixes."""
+    if not context.args:
+        await update.effective_message.reply_text(
+            "🔎 Использование: /search <слова>\nИщет по началу слов в названиях.")
+        return
+
+    query = " ".join(context.args)
+    hits = storage.search_suggestions(query)
+    if not hits:
+        await update.effective_message.reply_text(
+            f"🤷 По запросу \"{query}\" ничего. Возможно, это даже оригинально.")
+        return
+
+    tz = pytz.timezone(tenants.current()["timezone"])
+    lines = [f"🔎 Найдено: {len(hits)}\n"]
+    for i, hit in enumerate(hits[:SEARCH_LIMIT], 1):
+        if hit["polled_at"]:
+            polled = datetime.fromisoformat(hit["polled_at"]).astimezone(tz)
+            when = f"опрос {polled.strftime('%-d %b %Y').lower()}"
+        else:
+            when = "ещё не голосовали"
+        lines.append(f"{i}. {hit['name']} — {hit['votes']} гол. ({when})")
+    if len(hits) > SEARCH_LIMIT:
+        lines.append(f"…и ещё {len(hits) - SEARCH_LIMIT}. Уточни запрос.")
+    await update.effective_message.reply_text("\n".join(lines))
+
+
+async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /stats — author leaderboard, activity and vote distribution."""
+    # per_day is keyed by UTC date, so "today" must be the UTC one too
+    text = stats.format_stats(storage.get_stats(), datetime.now(timezone.utc))
+    if not text:
+        await update.effective_message.reply_text("😶 Статистики пока нет.")
+        return
+    await update.effective_message.reply_text(text)
+
+
 async def cmd_view_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /view_all — all suggestions sorted by daily poll votes."""
-    suggestions = storage.get_all_suggestions()
-    if not suggestions:
+    snap = storage.snapshot()
+    if not snap.suggestions:
         await update.effective_message.reply_text("😶 Ещё нет предложений.")
         return
 
-    # Collect suggestion IDs in currently open polls
-    open_polls = storage.get_open_polls()
-    open_sids = set()
-    for poll in open_polls.values():
-        for opt in poll["options"]:
-            sid = opt.get("suggestion_id")
-            if sid:
-                open_sids.add(sid)
-
-    scores = storage.get_all_daily_scores()
-    entries = []
-    for s in suggestions:
-        if not s["used_in_daily"] or s["id"] in open_sids:
-            continue
-        votes = scores.get(s["id"], 0)
-        entries.append((s["name"], votes))
+    # Suggestions still in open polls have no final count yet
+    scores = snap.daily_scores
+    entries = [(s.name, scores.get(s.id, 0)) for s in snap.scored]
     entries.sort(key=lambda x: -x[1])
 
     if not entries:
@@ -294,13 +360,49 @@ async def cmd_view_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.effective_message.reply_text(chunk)
 
 
+async def cmd_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /export [csv|jsonl] — admin only, all suggestions with poll votes as a file."""
+    if not is_admin(update.effective_user.id):
+        await update.effective_message.reply_text("🔒 Эта команда только для админов.")
+        return
+    fmt = context.args[0].lower() if context.args else "csv"
+    if fmt not in export.FORMATS:
+        await update.effective_message.reply_text("Использование: /export [csv|jsonl]")
+        return
+
+    f, rows = await asyncio.to_thread(export.to_tempfile, fmt)
+    with f:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M")
+        await update.effective_message.reply_document(
+            document=f,
+            filename=f"arkestra-{tenants.current()['key']}-{stamp}.{fmt}",
+            caption=f"📦 Экспорт: {rows} строк.",
+        )
+
+
+async def cmd_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /backup — admin only, take a backup of all chats now."""
+    if not is_admin(update.effective_user.id):
+        await update.effective_message.reply_text("🔒 Эта команда только для админов.")
+        return
+    result = await asyncio.to_thread(backup.run, CONFIG, tenants.TENANTS)
+    if result["problems"]:
+        await update.effective_message.reply_text(
+            "⚠️ Бэкап " + result["name"] + " с ошибками:\n" + "\n".join(result["problems"][:10]))
+        return
+    await update.effective_message.reply_text(
+        f"💾 Бэкап {result['name']}: файлов {len(result['files'])}, "
+        f"новых {result['new_objects']} ({result['new_bytes'] / 1024:.1f} КБ), "
+        f"{result['ms']:.0f} мс.")
+
+
 async def cmd_forcedaily(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /forcedaily — admin only, trigger daily poll now."""
     if not is_admin(update.effective_user.id):
         await update.effective_message.reply_text("🔒 Эта команда только для админов.")
         return
     await update.effective_message.reply_text("⚡ Запускаю ежедневное голосование...")
-    await run_daily_poll(context.bot, CONFIG)
+    await run_daily_poll(context.bot, tenants.current())
 
 
 async def cmd_forceweekly(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -309,15 +411,19 @@ async def cmd_forceweekly(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.effective_message.reply_text("🔒 Эта команда только для админов.")
         return
     await update.effective_message.reply_text("⚡ Запускаю еженедельное голосование...")
-    await run_weekly_poll(context.bot, CONFIG, SCHEDULER)
+    await run_weekly_poll(context.bot, tenants.current(), SCHEDULER)
 
 
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start in private chat — deep link entry for suggest flow."""
     user = update.effective_user
-    storage.add_subscriber(user.id, user.first_name)
+    action, tenant = tenants.parse_payload(context.args[0] if context.args else "")
+    context.user_data["tenant"] = tenant["key"]
+
+    with tenants.use(tenant):
+        await asyncio.to_thread(storage.add_subscriber, user.id, user.first_name)
 
-    if context.args and context.args[0] == "suggest":
+    if action == "suggest":
         await update.effective_message.reply_text(
             "✏️ Напиши название группы. Просто текстом. Без команд.")
         return AWAITING_BAND_NAME
@@ -339,24 +445,28 @@ async def receive_band_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Максимум 100. Попробуй короче.")
         return AWAITING_BAND_NAME
 
+    similar = near_duplicate(name)
+    if similar and near_duplicate_rejected():
+        await update.effective_message.reply_text(
+            f"🔁 \"{name}\" подозрительно похоже на \"{similar}\". Попробуй другое.")
+        return AWAITING_BAND_NAME
+
     user = update.effective_user
-    result = storage.add_suggestion(name, user.id, user.first_name)
+    verdict, reply = throttle_suggestion(name, user)
+    if reply:
+        await update.effective_message.reply_text(reply)
+        if verdict == ratelimit.QUEUED:
+            return ConversationHandler.END
+        return AWAITING_BAND_NAME
+
+    result = await asyncio.to_thread(storage.add_suggestion, name, user.id, user.first_name)
 
     if result is None:
         await update.effective_message.reply_text(
             f"🔁 \"{name}\" уже предложено. Попробуй другое.")
         return AWAITING_BAND_NAME
 
-    thanks = random.choice(THANKS_LINES)
-    keyboard = InlineKeyboardMarkup([[
-        InlineKeyboardButton(
-            "✏️ Предложить ещё одно название",
-            url=f"https://t.me/{CONFIG['bot_username']}?start=suggest",
-        )
-    ]])
-    await update.effective_message.reply_text(
-        f"🤘 Принято: \"{name}\"\n\n{thanks}",
-        reply_markup=keyboard)
+    await reply_accepted(update.effective_message, name, similar)
     return ConversationHandler.END
 
 
@@ -372,7 +482,7 @@ async def cmd_forceprompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.effective_message.reply_text("🔒 Эта команда только для админов.")
         return
     await update.effective_message.reply_text("⚡ Отправляю промпт...")
-    await run_daily_prompt(context.bot, CONFIG, PROMPT_LINES)
+    await run_daily_prompt(context.bot, tenants.current())
 
 
 async def cmd_close_polls(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -387,7 +497,7 @@ async def cmd_close_polls(update: Update, context: ContextTypes.DEFAULT_TYPE):
     closed = 0
     for poll_id, poll in open_polls.items():
         try:
-            await context.bot.stop_poll(CONFIG["chat_id"], poll["message_id"])
+            await context.bot.stop_poll(tenants.current()["chat_id"], poll["message_id"])
             closed += 1
         except Exception:
             logger.exception("Не удалось закрыть опрос %s", poll_id)
@@ -414,7 +524,7 @@ async def cmd_reset_votes(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update.effective_user.id):
         await update.effective_message.reply_text("🔒 Эта команда только для админов.")
         return
-    storage.reset_all_votes()
+    await asyncio.to_thread(storage.reset_all_votes)
     _previous_answers.clear()
     await update.effective_message.reply_text(
         "🔄 Все голосования сброшены. Предложения снова доступны для опросов.")
@@ -435,6 +545,8 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "✏️ /suggest — предложить название (кнопка или /suggest <название>)",
         "📊 /results — рейтинг недели и итоги прошлых",
         "📋 /view_all — все предложения по голосам",
+        "🔎 /search <слова> — было ли уже такое название",
+        "📈 /stats — статистика авторов и голосований",
         "ℹ️ /about — как всё устроено",
         "❓ /help — этот список",
     ]
@@ -447,6 +559,8 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "⚡ /forceweekly — запустить еженедельный финал\n"
             "📢 /forceprompt — отправить промпт дня\n"
             "👥 /subscribers — список подписчиков\n"
+            "📦 /export [csv|jsonl] — выгрузить предложения и голоса файлом\n"
+            "💾 /backup — сделать бэкап данных сейчас\n"
             "🔒 /closepolls — закрыть все открытые опросы\n"
             "🔄 /resetvotes — сбросить все голосования\n"
             "📰 /whatsnew — что нового в боте"
@@ -478,148 +592,569 @@ async def cmd_about(update: Update, context: ContextTypes.DEFAULT_TYPE):
 _previous_answers: dict[tuple[int, str], list[int]] = {}
 
 
-async def on_poll_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Track votes in real time via PollAnswer updates."""
-    answer = update.poll_answer
-    poll_id = answer.poll_id
-    user_id = answer.user.id
-    new_options = answer.option_ids  # list of selected option indices
-
-    key = (user_id, poll_id)
+def _vote_change(answer) -> tuple[list[int], list[int]]:
+    """Return (added, retracted) option indices of a PollAnswer and remember it."""
+    key = (answer.user.id, answer.poll_id)
     old_options = _previous_answers.get(key, [])
+    new_options = answer.option_ids  # list of selected option indices
 
     # Retracted options: were selected, now aren't
     retracted = [o for o in old_options if o not in new_options]
     # Added options: weren't selected, now are
     added = [o for o in new_options if o not in old_options]
 
-    if retracted:
-        storage.update_poll_voter_counts(poll_id, retracted, -1)
-    if added:
-        storage.update_poll_voter_counts(poll_id, added, +1)
-
     if new_options:
         _previous_answers[key] = list(new_options)
     else:
         _previous_answers.pop(key, None)
+    return added, retracted
+
+
+async def on_poll_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Track votes in real time via PollAnswer updates.
+
+    The change is queued and written with the next flush_votes() run.
+    """
+    answer = update.poll_answer
+    poll_id = answer.poll_id
+    user_id = answer.user.id
+
+    added, retracted = _vote_change(answer)
+
+    deltas = {o: +1 for o in added}
+    deltas.update({o: -1 for o in retracted})
+    if deltas:
+        storage.queue_poll_votes(poll_id, deltas)
 
     logger.debug("PollAnswer: user=%d poll=%s added=%s retracted=%s",
                  user_id, poll_id, added, retracted)
 
 
 async def on_poll_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle Poll updates (e.g. when a poll is closed)."""
+    """Handle Poll updates: live counts of open polls and final ones on close.
+
+    The scheduler's polls are anonymous, so they get no PollAnswer updates;
+    their live counts come from here and are written by flush_votes().
+    """
     poll = update.poll
-    if poll.is_closed:
-        counts = [opt.voter_count for opt in poll.options]
-        storage.set_poll_option_counts(poll.id, counts)
-        storage.close_poll(poll.id)
-        logger.info("Опрос %s закрыт, финальные результаты сохранены.", poll.id)
+    counts = [opt.voter_count for opt in poll.options]
+    if not poll.is_closed:
+        storage.queue_poll_counts(poll.id, counts, poll.total_voter_count)
+        return
+
+    def store():
+        with storage.transaction():
+            storage.set_poll_option_counts(poll.id, counts, poll.total_voter_count)
+            storage.close_poll(poll.id)
+    await asyncio.to_thread(store)
+    logger.info("Опрос %s закрыт, финальные результаты сохранены.", poll.id)
+
+
+# ---------------------------------------------------------------------------
+# Backlog catch-up
+# ---------------------------------------------------------------------------
+
+# Updates fetched per getUpdates call while catching up
+CATCHUP_LIMIT = 100
+
+
+def _suggest_name(update: Update, bot_username: str) -> str | None:
+    """Name from a valid group "/suggest <name>" message, else None."""
+    message = update.message
+    if (message is None or not message.text or message.chat.type == "private"
+            or update.effective_user is None):
+        return None
+    parts = message.text.split(None, 1)
+    command, _, target = parts[0].partition("@")
+    if command != "/suggest" or (target and target.lower() != bot_username.lower()):
+        return None
+    name = " ".join(parts[1].split()) if len(parts) > 1 else ""
+    return name if 0 < len(name) <= 100 else None
+
+
+class _Backlog:
+    """A run of backlog updates that can be applied with batched writes.
+
+    PollAnswers are folded into one vote delta per poll, only the latest
+    Poll state per poll is kept (its counts include every earlier answer),
+    and group /suggest commands are written with one
+    storage.add_suggestions() per chat.
+    """
+
+    def __init__(self, bot_username: str):
+        self.bot_username = bot_username
+        self.answers: dict[str, list] = {}
+        self.polls: dict[str, object] = {}
+        # poll id -> number of its answers taken before its latest Poll state
+        self.counted: dict[str, int] = {}
+        self.suggestions: list[tuple[Update, str]] = []
+
+    def take(self, update: Update) -> bool:
+        """Absorb *update* if it can be batched."""
+        if update.poll_answer:
+            self.answers.setdefault(update.poll_answer.poll_id, []).append(update.poll_answer)
+            return True
+        if update.poll:
+            self.polls[update.poll.id] = update.poll
+            self.counted[update.poll.id] = len(self.answers.get(update.poll.id, ()))
+            return True
+        name = _suggest_name(update, self.bot_username)
+        if name:
+            self.suggestions.append((update, name))
+            return True
+        return False
+
+    async def apply(self):
+        by_poll_tenant: dict[str, list[str]] = {}
+        for poll_id in self.answers.keys() | self.polls.keys():
+            tenant = tenants.for_poll(poll_id)
+            if tenant is not None:
+                by_poll_tenant.setdefault(tenant["key"], []).append(poll_id)
+            else:
+                for answer in self.answers.get(poll_id, ()):
+                    _vote_change(answer)
+        for key, poll_ids in by_poll_tenant.items():
+            with tenants.use(tenants.TENANTS[key]):
+                await asyncio.to_thread(self._apply_polls, poll_ids)
+
+        by_tenant: dict[str, list] = {}
+        for update, name in self.suggestions:
+            tenant = tenants.for_chat(update.effective_chat.id) or tenants.default()
+            by_tenant.setdefault(tenant["key"], []).append((update, name))
+        for key, items in by_tenant.items():
+            with tenants.use(tenants.TENANTS[key]):
+                await self._apply_suggestions(items)
+
+    def _apply_polls(self, poll_ids: list[str]):
+        # One group commit for all of this chat's polls
+        with storage.transaction():
+            for poll_id in poll_ids:
+                self._apply_poll(poll_id)
+
+    def _apply_poll(self, poll_id: str):
+        deltas: dict[int, int] = {}
+        counted = self.counted.get(poll_id, 0)
+        for i, answer in enumerate(self.answers.get(poll_id, ())):
+            # Every answer updates the voter state; only later ones add votes
+            added, retracted = _vote_change(answer)
+            if i < counted:
+                continue
+            for o in added:
+                deltas[o] = deltas.get(o, 0) + 1
+            for o in retracted:
+                deltas[o] = deltas.get(o, 0) - 1
+        poll = self.polls.get(poll_id)
+        if poll is not None and poll.is_closed:
+            # Final counts already include every answer above
+            storage.set_poll_option_counts(
+                poll_id, [opt.voter_count for opt in poll.options],
+                poll.total_voter_count)
+            storage.close_poll(poll_id)
+            return
+        if poll is not None:
+            storage.set_poll_option_counts(
+                poll_id, [opt.voter_count for opt in poll.options],
+                poll.total_voter_count, live=True)
+        if any(deltas.values()):
+            storage.add_poll_votes(poll_id, deltas)
+
+    async def _apply_suggestions(self, items: list[tuple[Update, str]]):
+        replies = []
+        batch = []
+        for update, name in items:
+            similar = near_duplicate(name)
+            if similar and near_duplicate_rejected():
+                replies.append((update, name, similar, "rejected"))
+                continue
+            user = update.effective_user
+            batch.append((name, user.id, user.first_name))
+            replies.append((update, name, similar, "pending"))
+
+        stored = await asyncio.to_thread(storage.add_suggestions, batch)
+        added = {r["name"].strip().lower(): r for r in stored}
+        for update, name, similar, state in replies:
+            message = update.effective_message
+            try:
+                if state == "rejected":
+                    await message.reply_text(
+                        f"🔁 \"{name}\" подозрительно похоже на \"{similar}\". Уже было.")
+                elif added.pop(name.strip().lower(), None):
+                    await reply_accepted(message, name, similar)
+                else:
+                    await message.reply_text(
+                        f"🔁 Название \"{name}\" уже было предложено.")
+            except Exception:
+                logger.exception("Не удалось ответить на предложение из очереди")
+
+
+# Last fully processed update id, and the one last written by save_offset()
+_offset = {"handled": None, "saved": None}
+
+
+async def remember_offset(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Last handler group: the update is fully processed."""
+    if _offset["handled"] is None or update.update_id > _offset["handled"]:
+        _offset["handled"] = update.update_id
+
+
+async def save_offset(context: ContextTypes.DEFAULT_TYPE | None = None):
+    """Persist the offset remembered since the last save (timer and shutdown).
+
+    A save lost in a crash only means catch_up() asks for a few updates
+    again; Telegram drops those the updater already confirmed.
+    """
+    handled = _offset["handled"]
+    if handled is not None and handled != _offset["saved"]:
+        await asyncio.to_thread(storage.set_update_offset, handled)
+        _offset["saved"] = handled
+
+
+@tracing.traced(root=True)
+async def catch_up(app) -> int:
+    """Process updates that arrived while the bot was down. Returns their number.
+
+    Runs of batchable updates are applied together; anything else goes
+    through the regular handlers in order. The offset is saved after every
+    fetched chunk, so a crash mid-way resumes where it stopped.
+    """
+    offset = storage.get_update_offset()
+    total = 0
+    while True:
+        updates = await app.bot.get_updates(
+            offset=None if offset is None else offset + 1,
+            limit=CATCHUP_LIMIT, timeout=0)
+        if not updates:
+            return total
+        backlog = _Backlog(app.bot.username)
+        for update in updates:
+            if backlog.take(update):
+                continue
+            await backlog.apply()
+            backlog = _Backlog(app.bot.username)
+            await app.process_update(update)
+        await backlog.apply()
+        offset = updates[-1].update_id
+        await asyncio.to_thread(storage.set_update_offset, offset)
+        _offset["handled"] = _offset["saved"] = offset
+        total += len(updates)
 
 
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 
+async def flush_suggestion_queue(context: ContextTypes.DEFAULT_TYPE):
+    await asyncio.to_thread(THROTTLE.flush)
+
+
+async def flush_votes(context: ContextTypes.DEFAULT_TYPE):
+    await asyncio.to_thread(storage.flush_poll_votes)
+
+
+async def reconcile_open_polls(bot):
+    """Close polls left open by a previous run, a few stop_poll calls at a time."""
+    started = startup.elapsed()
+    limit = asyncio.Semaphore(CONFIG.get("startup_close_concurrency", 4))
+    await asyncio.gather(*(
+        run_for_tenant(close_open_polls, bot, tenant, None, limit)
+        for tenant in tenants.TENANTS.values()
+    ))
+    logger.info("Открытые опросы закрыты за %.0f мс.", (startup.elapsed() - started) * 1000)
+
+
+async def on_elected(app):
+    """This worker became the leader: run scheduled jobs here from now on."""
+    SCHEDULER.resume()
+    # Close any polls left open from a previous run (e.g. after restart or
+    # a leader crash) without holding up update handling
+    task = asyncio.get_running_loop().create_task(reconcile_open_polls(app.bot))
+    app.bot_data["reconcile_task"] = task
+
+
+async def on_update_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    WATCHDOG.mark_update()
+    startup.first_response()
+
+
+async def on_demoted():
+    SCHEDULER.pause()
+
+
+async def reload_config(path: str = "config.json"):
+    """Validate *path* and make it the running config, rescheduling changed jobs.
+
+    Raises on an invalid file; the running config is then left untouched.
+    """
+    global CONFIG
+    with open(path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    hotreload.validate_config(new)
+    for key in ("bot_token", "webhook_url", "job_store"):
+        if new.get(key) != CONFIG.get(key):
+            logger.warning("Изменение %s вступит в силу только после перезапуска.", key)
+    CONFIG = new
+    tenants.configure(new)
+    await asyncio.to_thread(storage.recover,
+                            [t["data_dir"] for t in tenants.TENANTS.values()])
+    changed = sync_tenant_jobs(SCHEDULER, tenants.TENANTS)
+    logger.info("Конфиг перечитан. Чатов: %d, перенесено задач: %d%s",
+                len(tenants.TENANTS), len(changed),
+                f" ({', '.join(changed)})" if changed else "")
+
+
+def reload_asset(lines: assets.AssetLines):
+    def reload(path: str):
+        logger.info("%s перечитан: %d строк.", path, lines.reload())
+    return reload
+
+
+async def backup_job(context: ContextTypes.DEFAULT_TYPE):
+    """Periodic backup, taken by the worker holding the scheduler lease."""
+    if not context.job.data.is_leader:
+        return
+    result = await asyncio.to_thread(backup.run, CONFIG, tenants.TENANTS)
+    for problem in result["problems"]:
+        logger.error("Бэкап %s: %s", result["name"], problem)
+
+
+async def wake_scheduler(context: ContextTypes.DEFAULT_TYPE):
+    if SCHEDULER.state == STATE_RUNNING:
+        SCHEDULER.wakeup()
+
+
 def main():
-    global CONFIG, SCHEDULER
+    global CONFIG, SCHEDULER, THROTTLE, WATCHDOG
 
     # Load config
     with open("config.json", "r", encoding="utf-8") as f:
         CONFIG = json.load(f)
 
-    # Logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        handlers=[
-            logging.FileHandler("bot.log", encoding="utf-8"),
-            logging.StreamHandler(sys.stderr),
-        ],
-    )
+    # Logging (file writes happen on a background listener thread)
+    logsetup.setup_logging(CONFIG)
+    tracing.configure(CONFIG)
 
     logger.info("Запуск бота...")
 
-    # Build application
-    app = Application.builder().token(CONFIG["bot_token"]).build()
+    tenants.configure(CONFIG)
+    # Fail here rather than on every /results and weekly poll
+    for tenant in tenants.TENANTS.values():
+        scoring.check_method(tenant.get("ranking_method", "raw"))
+        textindex.check_threshold(tenant.get("near_duplicate_threshold", 0.7))
+    logger.info("Чатов в конфиге: %d (%s)", len(tenants.TENANTS),
+                ", ".join(tenants.TENANTS))
+    # Readers do not take the lock: finish any commit a crash left half-applied
+    storage.recover([storage.DEFAULT_DATA_DIR]
+                    + [t["data_dir"] for t in tenants.TENANTS.values()])
+
+    THROTTLE = ratelimit.SuggestionThrottle.from_config(CONFIG)
+    WATCHDOG = loopwatch.LoopWatchdog.from_config(CONFIG)
+    startup.mark("конфиг")
+
+    # Build application. getUpdates, replies and subscriber broadcasts each
+    # get their own connection pool so a broadcast cannot starve the others.
+    app = (
+        Application.builder()
+        .token(CONFIG["bot_token"])
+        .request(httppool.from_config(CONFIG, "outbound"))
+        .get_updates_request(httppool.from_config(CONFIG, "updates"))
+        .build()
+    )
+    broadcast_request = httppool.from_config(CONFIG, "broadcast")
+    broadcast_bot = Bot(CONFIG["bot_token"], request=broadcast_request,
+                        get_updates_request=broadcast_request)
+
+    def traced(callback):
+        return tracing.trace_handler(with_tenant(callback))
 
     # Register handlers — ConversationHandler first (private /start deep link)
     conv_handler = ConversationHandler(
         entry_points=[
-            CommandHandler("start", cmd_start, filters=filters.ChatType.PRIVATE),
+            CommandHandler("start", traced(cmd_start), filters=filters.ChatType.PRIVATE),
         ],
         states={
             AWAITING_BAND_NAME: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, receive_band_name),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, traced(receive_band_name)),
             ],
         },
         fallbacks=[
-            CommandHandler("cancel", cmd_cancel),
-            CommandHandler("start", cmd_start),
+            CommandHandler("cancel", traced(cmd_cancel)),
+            CommandHandler("start", traced(cmd_start)),
         ],
         conversation_timeout=300,
     )
     app.add_handler(conv_handler)
 
-    app.add_handler(CommandHandler("suggest", cmd_suggest))
-    app.add_handler(CommandHandler("suggestions", cmd_suggestions))
-    app.add_handler(CommandHandler("delete", cmd_delete))
-    app.add_handler(CommandHandler("results", cmd_results))
-    app.add_handler(CommandHandler("view_all", cmd_view_all))
-    app.add_handler(CommandHandler("forcedaily", cmd_forcedaily))
-    app.add_handler(CommandHandler("forceweekly", cmd_forceweekly))
-    app.add_handler(CommandHandler("forceprompt", cmd_forceprompt))
-    app.add_handler(CommandHandler("subscribers", cmd_subscribers))
-    app.add_handler(CommandHandler("resetvotes", cmd_reset_votes))
-    app.add_handler(CommandHandler("closepolls", cmd_close_polls))
-    app.add_handler(CommandHandler("whatsnew", cmd_whatsnew))
-    app.add_handler(CommandHandler("help", cmd_help))
-    app.add_handler(CommandHandler("about", cmd_about))
-    app.add_handler(CommandHandler("start", cmd_about))
-    app.add_handler(PollAnswerHandler(on_poll_answer))
-    app.add_handler(PollHandler(on_poll_update))
-
-    # Close any polls left open from a previous run (e.g. after restart)
+    app.add_handler(CommandHandler("suggest", traced(cmd_suggest)))
+    app.add_handler(CommandHandler("suggestions", traced(cmd_suggestions)))
+    app.add_handler(CommandHandler("delete", traced(cmd_delete)))
+    app.add_handler(CommandHandler("results", traced(cmd_results)))
+    app.add_handler(CommandHandler("view_all", traced(cmd_view_all)))
+    app.add_handler(CommandHandler("stats", traced(cmd_stats)))
+    app.add_handler(CommandHandler("search", traced(cmd_search)))
+    app.add_handler(CommandHandler("export", traced(cmd_export)))
+    app.add_handler(CommandHandler("backup", traced(cmd_backup)))
+    app.add_handler(CommandHandler("forcedaily", traced(cmd_forcedaily)))
+    app.add_handler(CommandHandler("forceweekly", traced(cmd_forceweekly)))
+    app.add_handler(CommandHandler("forceprompt", traced(cmd_forceprompt)))
+    app.add_handler(CommandHandler("subscribers", traced(cmd_subscribers)))
+    app.add_handler(CommandHandler("resetvotes", traced(cmd_reset_votes)))
+    app.add_handler(CommandHandler("closepolls", traced(cmd_close_polls)))
+    app.add_handler(CommandHandler("whatsnew", traced(cmd_whatsnew)))
+    app.add_handler(CommandHandler("help", traced(cmd_help)))
+    app.add_handler(CommandHandler("about", traced(cmd_about)))
+    app.add_handler(CommandHandler("start", traced(cmd_about)))
+    app.add_handler(PollAnswerHandler(traced(on_poll_answer)))
+    app.add_handler(PollHandler(traced(on_poll_update)))
+    startup.mark("приложение")
+
+    # Only the worker holding the scheduler lease runs jobs; the others keep
+    # their scheduler paused and take over if the leader stops renewing.
+    keeper = lease.LeaseKeeper(
+        lease.Lease(CONFIG.get("lease_file", lease.DEFAULT_LEASE_FILE),
+                    ttl=CONFIG.get("lease_ttl_seconds", 15)),
+        on_elected=lambda: on_elected(app),
+        on_demoted=on_demoted,
+    )
+
+    polling = not CONFIG.get("webhook_url")
+    # Run after every regular handler group
+    app.add_handler(TypeHandler(Update, on_update_done), group=99)
+    if polling:
+        app.add_handler(TypeHandler(Update, remember_offset), group=100)
+        app.job_queue.run_repeating(
+            save_offset,
+            interval=CONFIG.get("offset_save_seconds", 5),
+            name="offset_save",
+        )
+
+    health = None
+    if CONFIG.get("health_port"):
+        health = loopwatch.HealthServer(
+            WATCHDOG,
+            host=CONFIG.get("health_host", "127.0.0.1"),
+            port=CONFIG["health_port"],
+            extra=lambda: {"leader": keeper.is_leader, "http": httppool.metrics()},
+        )
+
+    watcher = None
+    if CONFIG.get("hot_reload", True):
+        watcher = hotreload.FileWatcher(
+            {
+                "config.json": reload_config,
+                assets.THANKS_LINES.path: reload_asset(assets.THANKS_LINES),
+                assets.PROMPT_LINES.path: reload_asset(assets.PROMPT_LINES),
+            },
+            poll_seconds=CONFIG.get("reload_poll_seconds", 2),
+        )
+
     async def post_init(application):
-        await close_open_polls(application.bot, CONFIG)
-        logger.info("Открытые опросы закрыты при старте.")
+        startup.mark("инициализация")
+        WATCHDOG.start()
+        if health:
+            await health.start()
+        if watcher:
+            application.bot_data["reload_task"] = asyncio.get_running_loop().create_task(
+                watcher.run())
+        if polling:
+            count = await catch_up(application)
+            startup.mark("догонялка")
+            if count:
+                logger.info("Пропущенные обновления обработаны: %d.", count)
+        application.bot_data["lease_task"] = asyncio.get_running_loop().create_task(
+            keeper.run())
+        logger.info("Готов принимать обновления через %.0f мс (%s).",
+                    startup.elapsed() * 1000, startup.breakdown())
+        if health:
+            health.ready = True
+
+    async def post_stop(application):
+        for name in ("lease_task", "reconcile_task", "reload_task"):
+            task = application.bot_data.pop(name, None)
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        await asyncio.to_thread(storage.flush_poll_votes)
+        if polling:
+            await save_offset()
+        await WATCHDOG.stop()
+        if health:
+            await health.stop()
+        await broadcast_request.shutdown()
 
     app.post_init = post_init
+    app.post_stop = post_stop
+
+    # Queued suggestions live in this process, so every worker flushes its own
+    app.job_queue.run_repeating(
+        flush_suggestion_queue,
+        interval=CONFIG.get("suggest_flush_seconds", 10),
+        name="suggestion_queue_flush",
+    )
 
-    # Start scheduler
-    SCHEDULER = create_scheduler(app.bot, CONFIG, PROMPT_LINES)
+    # Live votes are written in one commit per chat per tick
+    app.job_queue.run_repeating(
+        flush_votes,
+        interval=CONFIG.get("vote_flush_seconds", 1),
+        name="vote_flush",
+    )
 
-    # One-shot: send "what's new" tomorrow before the daily prompt
-    tz = pytz.timezone(CONFIG["timezone"])
-    tomorrow_prompt = datetime.now(tz).replace(
-        hour=CONFIG.get("daily_prompt_hour", 9),
-        minute=CONFIG.get("daily_prompt_minute", 0),
-        second=0, microsecond=0,
-    ) + timedelta(days=1)
+    if CONFIG.get("backup_interval_minutes", 60):
+        app.job_queue.run_repeating(
+            backup_job,
+            interval=CONFIG.get("backup_interval_minutes", 60) * 60,
+            first=60,
+            data=keeper,
+            name="backup",
+        )
 
-    from apscheduler.triggers.date import DateTrigger
+    # Start scheduler (one for all chats, paused until the lease is ours)
+    SCHEDULER = create_scheduler(app.bot, tenants.TENANTS, CONFIG, broadcast_bot=broadcast_bot)
 
-    async def send_whats_new(bot, config):
-        for sub in storage.get_all_subscribers():
-            try:
-                await bot.send_message(chat_id=sub["user_id"], text=WHATS_NEW)
-            except Exception:
-                logger.exception("Ошибка отправки what's new подписчику %d", sub["user_id"])
-        logger.info("What's new отправлен подписчикам.")
-
-    SCHEDULER.add_job(
-        send_whats_new,
-        trigger=DateTrigger(run_date=tomorrow_prompt - timedelta(minutes=1)),
-        args=[app.bot, CONFIG],
-        id="whats_new_once",
-        replace_existing=True,
-    )
+    from apscheduler.triggers.date import DateTrigger
 
-    SCHEDULER.start()
-    logger.info("Планировщик запущен.")
+    # One-shot: send "what's new" tomorrow before each chat's daily prompt,
+    # once per version of the text
+    digest = hashlib.sha1(WHATS_NEW.encode("utf-8")).hexdigest()[:12]
+    for tenant in tenants.TENANTS.values():
+        job_id = f"{tenant['key']}:whats_new_once"
+        with tenants.use(tenant):
+            sent = storage.get_meta("whats_new_sent") == digest
+        if sent or SCHEDULER.get_job(job_id):
+            continue
+        tz = pytz.timezone(tenant["timezone"])
+        tomorrow_prompt = datetime.now(tz).replace(
+            hour=tenant.get("daily_prompt_hour", 9),
+            minute=tenant.get("daily_prompt_minute", 0),
+            second=0, microsecond=0,
+        ) + timedelta(days=1)
+        SCHEDULER.add_job(
+            run_job,
+            trigger=DateTrigger(run_date=tomorrow_prompt - timedelta(minutes=1)),
+            args=["whats_new", tenant["key"], WHATS_NEW, digest],
+            id=job_id,
+        )
 
-    # Run
-    app.run_polling(drop_pending_updates=True)
+    # Jobs added by another worker land in the shared job store; make the
+    # leader look at it regularly instead of only at its next known run time
+    app.job_queue.run_repeating(wake_scheduler, interval=60, name="scheduler_wakeup")
+
+    logger.info("Планировщик запущен (ждёт лизу).")
+    startup.mark("планировщик")
+
+    # Run. Several workers can only share the load via a webhook: Telegram
+    # hands getUpdates to a single consumer.
+    if CONFIG.get("webhook_url"):
+        port = int(os.environ.get("BOT_PORT", CONFIG.get("webhook_port", 8443)))
+        app.run_webhook(
+            listen=CONFIG.get("webhook_listen", "127.0.0.1"),
+            port=port,
+            url_path=CONFIG.get("webhook_path", ""),
+            webhook_url=CONFIG["webhook_url"],
+            secret_token=CONFIG.get("webhook_secret"),
+        )
+    else:
+        # The backlog was already drained by catch_up() in post_init
+        app.run_polling()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,22 @@
+"""The current time, as seen by jobs and storage.
+
+Everything on the job pipeline asks now() instead of datetime.now(), so a
+simulation (simulate.py) can run the schedule on a virtual clock.
+"""
+
+from datetime import datetime, timezone
+
+_source = None
+
+
+def now(tz=timezone.utc) -> datetime:
+    """Aware current time in *tz* (UTC by default)."""
+    if _source is None:
+        return datetime.now(tz)
+    return _source().astimezone(tz)
+
+
+def set_source(source):
+    """Read the time from *source()* (an aware datetime) instead; None restores the wall clock."""
+    global _source
+    _source = source
@@ -0,0 +1,117 @@
+"""Export suggestions joined with per-poll vote totals as CSV or JSONL.
+
+Rows are produced one at a time: one row per (suggestion, poll it appeared
+in), or a single row with empty poll columns for a suggestion that was
+never polled. The data files are decoded one record at a time and only a
+small suggestion_id → appearances index (one tuple per poll option) is
+built up front; the output is written as it is generated.
+
+    python export.py --format csv -o export.csv
+    python export.py --format jsonl --data-dir data/band
+"""
+
+import argparse
+import csv
+import json
+import sys
+import tempfile
+
+import storage
+
+FORMATS = ("csv", "jsonl")
+
+COLUMNS = (
+    "suggestion_id", "name", "author_id", "author_name", "submitted_at",
+    "used_in_daily", "poll_id", "poll_type", "poll_created_at", "poll_closed",
+    "votes",
+)
+
+
+def _appearances() -> dict[str, list[tuple]]:
+    """{suggestion_id: [(created_at_us, poll columns...)]} in poll creation order."""
+    index: dict[str, list[tuple]] = {}
+    for pid, poll in storage.iter_polls():
+        for opt in poll.options:
+            if opt.suggestion_id:
+                index.setdefault(opt.suggestion_id, []).append(
+                    (poll.created_at_us, pid, poll.type, poll.created_at, poll.closed,
+                     opt.voter_count))
+    for seen in index.values():
+        seen.sort(key=lambda a: a[0])
+    return index
+
+
+def iter_rows():
+    """Yield export rows (dicts keyed by COLUMNS) for the current namespace."""
+    index = _appearances()
+    for s in storage.iter_suggestions():
+        base = {
+            "suggestion_id": s.id,
+            "name": s.name,
+            "author_id": s.author_id,
+            "author_name": s.author_name,
+            "submitted_at": s.submitted_at,
+            "used_in_daily": s.used_in_daily,
+        }
+        seen = index.get(s.id)
+        if not seen:
+            yield {**base, "poll_id": None, "poll_type": None,
+                   "poll_created_at": None, "poll_closed": None, "votes": None}
+            continue
+        for _, pid, poll_type, created_at, closed, votes in seen:
+            yield {**base, "poll_id": pid, "poll_type": poll_type,
+                   "poll_created_at": created_at, "poll_closed": closed,
+                   "votes": votes}
+
+
+def write(out, fmt: str = "csv") -> int:
+    """Stream the export to text stream *out*. Returns the number of rows."""
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}")
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in iter_rows():
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in iter_rows():
+            out.write(json.dumps(row, ensure_ascii=False))
+            out.write("\n")
+            count += 1
+    return count
+
+
+def to_tempfile(fmt: str = "csv"):
+    """Write the export to a temporary file. Returns (file, rows), file rewound.
+
+    The file is opened in binary mode for uploading and removed on close.
+    """
+    f = tempfile.TemporaryFile(mode="w+b")
+    text = open(f.fileno(), "w", encoding="utf-8", newline="", closefd=False)
+    with text:
+        rows = write(text, fmt)
+    f.seek(0)
+    return f, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--data-dir", default=storage.DEFAULT_DATA_DIR,
+                        help="chat data directory (default: %(default)s)")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    with storage.namespace(args.data_dir):
+        if args.output:
+            with open(args.output, "w", encoding="utf-8", newline="") as out:
+                rows = write(out, args.format)
+        else:
+            rows = write(sys.stdout, args.format)
+    print(f"{rows} rows", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
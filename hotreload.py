@@ -0,0 +1,143 @@
+"""Pick up edits to config.json and the text assets without a restart.
+
+FileWatcher maps file paths to reload callbacks. It waits for inotify
+events on the files' directories when inotify_simple is installed and
+otherwise polls their mtime/size. Editors write a file in several steps
+(truncate, write, rename), so changes are collected for a short debounce
+delay and each callback runs once per settled change.
+
+A callback that raises leaves the old state in place: the error is logged
+and the file is retried on its next change.
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+
+import pytz
+
+import scoring
+import tenants
+import textindex
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # optional; polling works everywhere
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _check_range(tenant: dict, key: str, low: int, high: int, default=None):
+    value = tenant.get(key, default)
+    if not isinstance(value, int) or not low <= value <= high:
+        raise ValueError(f"{tenant['key']}: {key} must be {low}..{high}, got {value!r}")
+
+
+def validate_config(config: dict) -> dict[str, dict]:
+    """Check a root config the way the scheduler will use it.
+
+    Returns the tenant map it describes; raises ValueError on the first problem.
+    """
+    if not config.get("bot_token"):
+        raise ValueError("bot_token is missing")
+    tenant_map = tenants.load_tenants(config)
+    chat_ids = set()
+    for tenant in tenant_map.values():
+        if not isinstance(tenant.get("chat_id"), int):
+            raise ValueError(f"{tenant['key']}: chat_id must be a number")
+        if tenant["chat_id"] in chat_ids:
+            raise ValueError(f"{tenant['key']}: chat_id {tenant['chat_id']} is used twice")
+        chat_ids.add(tenant["chat_id"])
+        try:
+            pytz.timezone(tenant.get("timezone", ""))
+        except pytz.UnknownTimeZoneError:
+            raise ValueError(f"{tenant['key']}: unknown timezone {tenant.get('timezone')!r}")
+        for prefix in ("daily_poll", "weekly_poll"):
+            _check_range(tenant, f"{prefix}_hour", 0, 23)
+            _check_range(tenant, f"{prefix}_minute", 0, 59)
+        _check_range(tenant, "daily_prompt_hour", 0, 23, default=9)
+        _check_range(tenant, "daily_prompt_minute", 0, 59, default=0)
+        if tenant.get("weekly_poll_day") not in WEEKDAYS:
+            raise ValueError(f"{tenant['key']}: weekly_poll_day must be one of {', '.join(WEEKDAYS)}")
+        if not isinstance(tenant.get("admin_user_ids", []), list):
+            raise ValueError(f"{tenant['key']}: admin_user_ids must be a list")
+        try:
+            scoring.check_method(tenant.get("ranking_method", "raw"))
+            textindex.check_threshold(tenant.get("near_duplicate_threshold", 0.7))
+        except ValueError as e:
+            raise ValueError(f"{tenant['key']}: {e}")
+    return tenant_map
+
+
+class FileWatcher:
+    """Call handlers[path](path) whenever *path* changes on disk.
+
+    A handler may be a coroutine function; it is awaited on the loop, so it
+    must push blocking work (storage writes) to a thread itself.
+    """
+
+    def __init__(self, handlers: dict, poll_seconds: float = 2.0, debounce: float = 0.5):
+        self.handlers = dict(handlers)
+        self.poll_seconds = poll_seconds
+        self.debounce = debounce
+        self._stamps = {path: _stamp(path) for path in self.handlers}
+
+    async def check(self) -> list[str]:
+        """Run the handlers of files changed since the last check. Returns their paths."""
+        changed = []
+        for path, handler in self.handlers.items():
+            stamp = _stamp(path)
+            if stamp is None or stamp == self._stamps[path]:
+                continue
+            self._stamps[path] = stamp
+            changed.append(path)
+            try:
+                result = handler(path)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Изменение %s не применено, остаются прежние значения", path)
+        return changed
+
+    async def run(self):
+        if INotify is not None:
+            try:
+                await self._run_inotify()
+                return
+            except OSError:
+                logger.exception("inotify недоступен, проверяю файлы раз в %s с", self.poll_seconds)
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            await self.check()
+
+    async def _run_inotify(self):
+        inotify = INotify()
+        mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE
+        for directory in {os.path.dirname(path) or "." for path in self.handlers}:
+            inotify.add_watch(directory, mask)
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        loop.add_reader(inotify.fileno(), event.set)
+        try:
+            while True:
+                await event.wait()
+                # Let the editor finish, then take everything it produced at once
+                await asyncio.sleep(self.debounce)
+                event.clear()
+                inotify.read(timeout=0)
+                await self.check()
+        finally:
+            loop.remove_reader(inotify.fileno())
+            inotify.close()
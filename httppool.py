@@ -0,0 +1,135 @@
+"""Separate, tunable HTTP connection pools for the Bot API.
+
+Three pools, so one kind of traffic cannot starve another:
+
+    updates    getUpdates long polling (the updater)
+    outbound   replies and everything else the bot sends
+    broadcast  fan-out to subscribers (daily prompt, what's new)
+
+Each pool is a PooledRequest: an HTTPXRequest whose size, keep-alive and
+timeouts come from config and which counts connections in use and how long
+requests waited for a free one. The counts are served on the health
+endpoint under "http".
+"""
+
+import asyncio
+import importlib.util
+import logging
+import time
+
+import httpx
+from telegram.error import TimedOut
+
+from tracing import TracedRequest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZES = {"updates": 1, "outbound": 256, "broadcast": 16}
+
+# name -> PooledRequest, for metrics()
+POOLS: dict[str, "PooledRequest"] = {}
+
+
+class PooledRequest(TracedRequest):
+    """HTTPXRequest with a bounded pool whose usage and wait times are measured.
+
+    A semaphore of the pool size is taken before each request, so waiting
+    for a connection happens here (and is timed) rather than inside httpx;
+    pool_timeout still bounds the wait.
+    """
+
+    def __init__(self, name: str, connection_pool_size: int = 1,
+                 keepalive: int | None = None, keepalive_expiry: float = 5.0,
+                 pool_timeout: float | None = 1.0, **kwargs):
+        keepalive = connection_pool_size if keepalive is None else keepalive
+        limits = httpx.Limits(max_connections=connection_pool_size,
+                              max_keepalive_connections=keepalive,
+                              keepalive_expiry=keepalive_expiry)
+        super().__init__(connection_pool_size=connection_pool_size,
+                         pool_timeout=pool_timeout,
+                         httpx_kwargs={"limits": limits}, **kwargs)
+        self.name = name
+        self.size = connection_pool_size
+        self._pool_timeout = pool_timeout
+        self._slots = asyncio.Semaphore(connection_pool_size)
+        self.in_use = 0
+        self.peak = 0
+        self.requests = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        timeout = pool_timeout if isinstance(pool_timeout, (int, float)) else self._pool_timeout
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimedOut(f"Pool timeout: all {self.size} '{self.name}' connections busy")
+        wait = time.perf_counter() - started
+        self.requests += 1
+        if wait > 0.001:
+            self.waited += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.in_use += 1
+        self.peak = max(self.peak, self.in_use)
+        try:
+            return await super().do_request(
+                url, method,
+                request_data=request_data,
+                read_timeout=read_timeout,
+                write_timeout=write_timeout,
+                connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout,
+            )
+        finally:
+            self.in_use -= 1
+            self._slots.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "peak": self.peak,
+            "requests": self.requests,
+            "waited": self.waited,
+            "wait_ms_avg": round(self.wait_total / self.requests * 1000, 2) if self.requests else 0,
+            "wait_ms_max": round(self.wait_max * 1000, 1),
+            "timeouts": self.timeouts,
+        }
+
+
+def from_config(config: dict, name: str) -> PooledRequest:
+    """Build (and register) pool *name* from the http_* config keys.
+
+    Sizes are per pool (http_<name>_pool_size); keep-alive, timeouts and the
+    HTTP version are shared. HTTP/2 needs `pip install "httpx[http2]"`;
+    without it the pool falls back to HTTP/1.1.
+    """
+    http_version = str(config.get("http_version", "1.1"))
+    if http_version != "1.1" and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 недоступен (нет пакета h2), пул %s использует HTTP/1.1.", name)
+        http_version = "1.1"
+    size = config.get(f"http_{name}_pool_size", DEFAULT_POOL_SIZES[name])
+    request = PooledRequest(
+        name,
+        connection_pool_size=size,
+        keepalive=config.get("http_keepalive"),
+        keepalive_expiry=config.get("http_keepalive_expiry", 5.0),
+        pool_timeout=config.get("http_pool_timeout", 1.0),
+        connect_timeout=config.get("http_connect_timeout", 5.0),
+        read_timeout=config.get("http_read_timeout", 5.0),
+        write_timeout=config.get("http_write_timeout", 5.0),
+        http_version=http_version,
+    )
+    POOLS[name] = request
+    return request
+
+
+def metrics() -> dict:
+    """{pool name: usage counters} of every pool built by from_config()."""
+    return {name: pool.snapshot() for name, pool in POOLS.items()}
@@ -0,0 +1,185 @@
+"""Standings text and the live pinned leaderboard.
+
+With "live_leaderboard" enabled, each chat gets one pinned message that is
+edited in place instead of posting fresh standings before every poll. A
+scheduled job refreshes it at most once per "leaderboard_edit_seconds":
+nothing is rendered while the data files are unchanged, and nothing is
+sent when the rendered text hashes the same as the last edit. That job is
+the only thing that edits it; /results and the poll jobs use ensure(),
+which only posts the message if there is none yet. The message id and
+text hash are kept in the chat's meta.json across restarts.
+"""
+
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+
+import pytz
+from telegram.error import BadRequest
+
+import clock
+import scoring
+import storage
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+EMPTY_TEXT = "😶 Нет результатов голосований за эту неделю."
+
+# chat key -> (data version, local date) of the last render
+_rendered: dict[str, tuple] = {}
+
+
+@traced()
+def format_results(config: dict, snap: storage.Snapshot | None = None) -> str | None:
+    """Build results text (current week + past championships), filtering 0-vote entries.
+
+    Everything is read from one storage snapshot (the current one by default).
+    Returns the formatted string or None if there are no results.
+    """
+    snap = snap or storage.snapshot()
+    tz = pytz.timezone(config["timezone"])
+    weekly_results = snap.weekly
+
+    # --- Current week section ---
+    if weekly_results:
+        latest_created = datetime.fromisoformat(weekly_results[0]["created_at"])
+        since_utc = latest_created
+    else:
+        since = clock.now(tz) - timedelta(days=7)
+        since_utc = since.astimezone(timezone.utc)
+
+    ranked_all = scoring.rank_daily(config, since_utc, snap)
+    sections = []
+
+    if ranked_all:
+        now = clock.now(tz)
+        since_local = since_utc.astimezone(tz) if weekly_results else (now - timedelta(days=7))
+        date_from = since_local.strftime("%-d %b").lower()
+        date_to = now.strftime("%-d %b").lower()
+        suggestions = snap.suggestions
+        ranked = [
+            (suggestions[sid].name, votes)
+            for sid, votes, _ in ranked_all
+            if votes > 0 and sid in suggestions
+        ]
+        if ranked:
+            lines = [f"📊 Очередная неделя 😩 ({date_from} — {date_to}):"]
+            for i, (name, votes) in enumerate(ranked, 1):
+                lines.append(f"{i}. {name} — {votes} гол.")
+            sections.append("\n".join(lines))
+
+    # --- Past weekly championships ---
+    total_weeks = len(weekly_results)
+    for week_idx, weekly in enumerate(weekly_results):
+        poll = snap.polls.get(weekly["poll_id"])
+        final_counts = {}
+        if poll:
+            for opt in poll.options:
+                final_counts[opt.suggestion_id] = opt.voter_count
+
+        created = datetime.fromisoformat(weekly["created_at"]).astimezone(tz)
+        week_start = (created - timedelta(days=7)).strftime("%-d %b").lower()
+        week_end = created.strftime("%-d %b").lower()
+
+        ranked_top = sorted(
+            weekly["top"],
+            key=lambda e: final_counts.get(e["suggestion_id"], e["votes"]),
+            reverse=True,
+        )
+        ranked_top = [
+            e for e in ranked_top
+            if final_counts.get(e["suggestion_id"], e["votes"]) > 0
+        ][:4]
+        if not ranked_top:
+            continue
+        week_num = total_weeks - week_idx
+        lines = [f"{week_num}. неделя 🤮 ({week_start} — {week_end}):"]
+        medals = ["🥇", "🥈", "🥉", "🏅"]
+        for i, entry in enumerate(ranked_top):
+            votes = final_counts.get(entry["suggestion_id"], entry["votes"])
+            line = f"{medals[i]} {entry['name']} — {votes} гол."
+            if weekly.get("revealed"):
+                line += f" (автор: {entry['author_name']})"
+            lines.append(line)
+        sections.append("\n".join(lines))
+
+    if not sections:
+        return None
+    return "\n\n".join(sections)
+
+
+def enabled(config: dict) -> bool:
+    return bool(config.get("live_leaderboard"))
+
+
+def message_link(config: dict, message_id: int) -> str:
+    """t.me link to a message in the chat (works for supergroups)."""
+    chat = str(config["chat_id"]).removeprefix("-100")
+    return f"https://t.me/c/{chat}/{message_id}"
+
+
+async def _post(bot, config: dict, text: str) -> int:
+    msg = await bot.send_message(
+        chat_id=config["chat_id"],
+        text=text,
+        message_thread_id=config.get("thread_id"),
+    )
+    try:
+        await bot.pin_chat_message(chat_id=config["chat_id"], message_id=msg.message_id,
+                                   disable_notification=True)
+    except BadRequest as e:
+        logger.warning("Не удалось закрепить таблицу (%s): %s", config["key"], e)
+    await asyncio.to_thread(storage.set_meta, "leaderboard_message_id", msg.message_id)
+    logger.info("Живая таблица создана (%s): сообщение %d", config["key"], msg.message_id)
+    return msg.message_id
+
+
+async def ensure(bot, config: dict) -> int | None:
+    """Message id of the pinned leaderboard, posting it if there is none yet.
+
+    Never edits an existing message, so callers outside the refresh job
+    cannot push edits past the "leaderboard_edit_seconds" interval.
+    """
+    message_id = storage.get_meta("leaderboard_message_id")
+    if message_id:
+        return message_id
+    return await refresh(bot, config)
+
+
+@traced(root=True)
+async def refresh(bot, config: dict, force: bool = False) -> int | None:
+    """Bring the pinned leaderboard up to date. Returns its message id.
+
+    Call with the chat's tenant bound. Without *force*, returns right away
+    when neither the data files nor the date changed since the last render.
+    """
+    message_id = storage.get_meta("leaderboard_message_id")
+    today = clock.now(pytz.timezone(config["timezone"])).date()
+    version = (storage.data_version(), today)
+    if not force and message_id and _rendered.get(config["key"]) == version:
+        return message_id
+
+    text = format_results(config) or EMPTY_TEXT
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    if message_id and storage.get_meta("leaderboard_hash") == digest:
+        _rendered[config["key"]] = version
+        return message_id
+
+    if message_id:
+        try:
+            await bot.edit_message_text(chat_id=config["chat_id"],
+                                        message_id=message_id, text=text)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                # Deleted or too old to edit: start a new pinned message
+                logger.warning("Таблица %d не редактируется (%s): %s",
+                               message_id, config["key"], e)
+                message_id = await _post(bot, config, text)
+    else:
+        message_id = await _post(bot, config, text)
+    await asyncio.to_thread(storage.set_meta, "leaderboard_hash", digest)
+    # Only now: a failed send or edit is retried on the next refresh
+    _rendered[config["key"]] = version
+    return message_id
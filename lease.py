@@ -0,0 +1,189 @@
+"""File-based leader lease so only one worker runs the scheduler.
+
+Every worker process sharing a data directory runs a LeaseKeeper. The
+lease file holds {"owner", "expires"}; it is read and rewritten under an
+flock, so acquiring or renewing is atomic across processes. The holder
+renews every ttl/3 seconds. If it dies or hangs, the lease expires and
+another worker takes over within ttl (+ one retry interval).
+
+Run `python lease.py` for a local failover check: it starts several worker
+processes, kills the leader and reports how long the takeover took.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_FILE = "data/scheduler.lease"
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Lease:
+    """A renewable, expiring lease stored in a JSON file."""
+
+    def __init__(self, path: str = DEFAULT_LEASE_FILE, ttl: float = 15.0,
+                 owner: str | None = None):
+        self.path = path
+        self.ttl = ttl
+        self.owner = owner or default_owner()
+
+    def _update(self, decide) -> bool:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                try:
+                    current = json.loads(raw) if raw.strip() else {}
+                except ValueError:
+                    current = {}
+                new = decide(current, time.time())
+                if new is not None:
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(new))
+                    f.flush()
+                    os.fsync(f.fileno())
+                return new is not None and new.get("owner") == self.owner
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_acquire(self) -> bool:
+        """Take the lease if it is free or expired, or renew it if we hold it."""
+        def decide(current, now):
+            if (current.get("owner") in (None, self.owner)
+                    or current.get("expires", 0) <= now):
+                return {"owner": self.owner, "expires": now + self.ttl}
+            return None
+        return self._update(decide)
+
+    def release(self):
+        """Give the lease up immediately (no-op if someone else holds it)."""
+        def decide(current, now):
+            if current.get("owner") == self.owner:
+                return {"owner": None, "expires": 0}
+            return None
+        self._update(decide)
+
+    def holder(self) -> str | None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                current = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if current.get("expires", 0) <= time.time():
+            return None
+        return current.get("owner")
+
+
+class LeaseKeeper:
+    """Keep trying to hold a Lease and report leadership changes.
+
+    on_elected / on_demoted are coroutine functions called when this worker
+    becomes leader or loses the lease (e.g. after a stall longer than ttl).
+    """
+
+    def __init__(self, lease: Lease, on_elected, on_demoted,
+                 interval: float | None = None):
+        self.lease = lease
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.interval = interval or lease.ttl / 3
+        self.is_leader = False
+
+    async def _notify(self, callback):
+        try:
+            await callback()
+        except Exception:
+            logger.exception("Ошибка при смене лидера")
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    held = await asyncio.to_thread(self.lease.try_acquire)
+                except OSError:
+                    logger.exception("Не удалось обновить лизу %s", self.lease.path)
+                    held = False
+                if held and not self.is_leader:
+                    self.is_leader = True
+                    logger.info("Лиза планировщика получена (%s).", self.lease.owner)
+                    await self._notify(self.on_elected)
+                elif not held and self.is_leader:
+                    self.is_leader = False
+                    logger.warning("Лиза планировщика потеряна (%s).", self.lease.owner)
+                    await self._notify(self.on_demoted)
+                await asyncio.sleep(self.interval)
+        finally:
+            if self.is_leader:
+                self.lease.release()
+
+
+# ---------------------------------------------------------------------------
+# Local failover check
+# ---------------------------------------------------------------------------
+
+def _worker(path: str, ttl: float, name: str, events):
+    async def elected():
+        events.put((name, "elected", time.time()))
+
+    async def demoted():
+        events.put((name, "demoted", time.time()))
+
+    keeper = LeaseKeeper(Lease(path, ttl, owner=name), elected, demoted,
+                         interval=ttl / 5)
+    asyncio.run(keeper.run())
+
+
+def _failover_check(workers: int = 3, ttl: float = 2.0) -> int:
+    import multiprocessing
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "scheduler.lease")
+    events = multiprocessing.Queue()
+    procs = {}
+    for i in range(workers):
+        name = f"worker-{i}"
+        procs[name] = multiprocessing.Process(
+            target=_worker, args=(path, ttl, name, events), daemon=True)
+        procs[name].start()
+
+    leader, _, _ = events.get(timeout=ttl * 3)
+    print(f"leader: {leader}")
+    time.sleep(ttl)
+
+    killed_at = time.time()
+    procs[leader].kill()
+    print(f"killed {leader}")
+    new_leader, _, elected_at = events.get(timeout=ttl * 3)
+    took = elected_at - killed_at
+    print(f"new leader: {new_leader} after {took:.2f}s (ttl {ttl}s)")
+
+    time.sleep(ttl)
+    extra = []
+    while not events.empty():
+        extra.append(events.get())
+    for p in procs.values():
+        p.kill()
+
+    ok = new_leader != leader and took <= ttl * 1.5 and not extra
+    if extra:
+        print(f"unexpected leadership changes: {extra}")
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(_failover_check())
@@ -0,0 +1,138 @@
+"""Where each suggestion is in its lifecycle, kept up to date incrementally.
+
+    pending  — not yet put into a daily poll (the /suggestions list)
+    open     — used, and in a poll that is still open
+    scored   — used, with no open poll left (final counts are in)
+    deleted  — removed by an admin while pending
+
+Like the text indexes this is a plain data structure with to_dict/from_dict;
+storage persists it and applies every transition. Each state keeps its ids
+in a stable order: pending in submission order, the others in the order the
+suggestions entered the state, so 1-based positions (e.g. for /delete) do not
+shift when unrelated suggestions change.
+
+A rebuild from the data files cannot know about deletions that happened
+before it, so the deleted state only covers deletions since then.
+"""
+
+from itertools import islice
+
+PENDING = "pending"
+OPEN = "open"
+SCORED = "scored"
+DELETED = "deleted"
+STATES = (PENDING, OPEN, SCORED, DELETED)
+
+
+class LifecycleIndex:
+    def __init__(self):
+        # state -> {sid: None}, an ordered set
+        self.members: dict[str, dict[str, None]] = {state: {} for state in STATES}
+        self.state: dict[str, str] = {}
+        self.used: set[str] = set()
+        # open poll id -> suggestion ids in it, and how many open polls hold each id
+        self.open_polls: dict[str, list[str]] = {}
+        self._open_refs: dict[str, int] = {}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LifecycleIndex":
+        index = cls()
+        for state in STATES:
+            for sid in data.get(state, []):
+                index.members[state][sid] = None
+                index.state[sid] = state
+        index.used = set(index.members[OPEN]) | set(index.members[SCORED])
+        index.used.update(data.get("used_pending", []))
+        for pid, sids in data.get("open_polls", {}).items():
+            index.open_polls[pid] = list(sids)
+            for sid in sids:
+                index._open_refs[sid] = index._open_refs.get(sid, 0) + 1
+        return index
+
+    def to_dict(self) -> dict:
+        d = {state: list(self.members[state]) for state in STATES}
+        d["open_polls"] = self.open_polls
+        # Marked used before their poll was registered (transient)
+        stray = [sid for sid in self.members[PENDING] if sid in self.used]
+        if stray:
+            d["used_pending"] = stray
+        return d
+
+    def copy(self) -> "LifecycleIndex":
+        """An independent copy, so published readers never see a later change."""
+        index = LifecycleIndex()
+        index.members = {state: dict(sids) for state, sids in self.members.items()}
+        index.state = dict(self.state)
+        index.used = set(self.used)
+        index.open_polls = {pid: list(sids) for pid, sids in self.open_polls.items()}
+        index._open_refs = dict(self._open_refs)
+        return index
+
+    def _place(self, sid: str):
+        old = self.state.get(sid)
+        if old == DELETED or old is None:
+            return
+        if sid not in self.used:
+            new = PENDING
+        elif self._open_refs.get(sid):
+            new = OPEN
+        else:
+            new = SCORED
+        if new != old:
+            del self.members[old][sid]
+            self.members[new][sid] = None
+            self.state[sid] = new
+
+    def add(self, sid: str, name: str | None = None):
+        """A new suggestion (*name* is accepted for symmetry with the text indexes)."""
+        if sid not in self.state:
+            self.state[sid] = PENDING
+            self.members[PENDING][sid] = None
+
+    def remove(self, sid: str):
+        """Tombstone a deleted suggestion."""
+        old = self.state.get(sid)
+        if old is None or old == DELETED:
+            return
+        del self.members[old][sid]
+        self.members[DELETED][sid] = None
+        self.state[sid] = DELETED
+        self.used.discard(sid)
+
+    def mark_used(self, sids):
+        for sid in sids:
+            self.used.add(sid)
+            self._place(sid)
+
+    def poll_opened(self, poll_id: str, sids: list[str]):
+        if poll_id in self.open_polls:
+            return
+        self.open_polls[poll_id] = list(sids)
+        for sid in sids:
+            self._open_refs[sid] = self._open_refs.get(sid, 0) + 1
+            self._place(sid)
+
+    def poll_closed(self, poll_id: str):
+        for sid in self.open_polls.pop(poll_id, ()):
+            refs = self._open_refs.get(sid, 0) - 1
+            if refs > 0:
+                self._open_refs[sid] = refs
+            else:
+                self._open_refs.pop(sid, None)
+            self._place(sid)
+
+    def ids(self, state: str) -> list[str]:
+        """Suggestion ids in *state*, in their stable order."""
+        return list(self.members[state])
+
+    def nth(self, state: str, position: int) -> str | None:
+        """The 1-based *position*-th id in *state*, or None."""
+        if position < 1:
+            return None
+        return next(islice(self.members[state], position - 1, None), None)
+
+    def count(self, state: str) -> int:
+        return len(self.members[state])
+
+    def __contains__(self, sid: str) -> bool:
+        return sid in self.state
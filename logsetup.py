@@ -0,0 +1,74 @@
+"""Queue-based logging so handlers never do file I/O on the event loop."""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+
+FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Render each record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _file_handler(config: dict) -> logging.Handler:
+    path = config.get("log_file", "bot.log")
+    backups = config.get("log_backup_count", 5)
+    if config.get("log_rotation", "size") == "time":
+        return logging.handlers.TimedRotatingFileHandler(
+            path,
+            when=config.get("log_rotate_when", "midnight"),
+            backupCount=backups,
+            encoding="utf-8",
+        )
+    return logging.handlers.RotatingFileHandler(
+        path,
+        maxBytes=config.get("log_max_bytes", 10 * 1024 * 1024),
+        backupCount=backups,
+        encoding="utf-8",
+    )
+
+
+def setup_logging(config: dict) -> logging.handlers.QueueListener:
+    """Route all logging through a queue drained by a background listener.
+
+    The root logger only gets a QueueHandler, so a logger.info() call from a
+    handler or scheduler job is a queue put. Formatting, rotation and file
+    writes happen on the listener thread. The listener is stopped (and the
+    queue flushed) at interpreter exit.
+    """
+    file_handler = _file_handler(config)
+    if config.get("log_json"):
+        file_handler.setFormatter(JsonLinesFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(FORMAT))
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(config.get("log_level", "INFO"))
+
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,181 @@
+"""Event-loop lag watchdog and a local health/readiness endpoint.
+
+A probe task sleeps for a short interval and measures how late it wakes
+up; that is the loop lag. The probe also stamps a heartbeat on every tick.
+A helper thread checks the heartbeat: once the loop has been silent for
+longer than the threshold, the thread takes the loop thread's current
+stack with sys._current_frames() and logs the frames from this project,
+such as `storage.save_json ← storage.add_poll_votes ← bot.on_poll_answer`.
+
+HealthServer answers plain HTTP on a local port:
+
+    GET /health  → 200 with JSON (lag, last processed update, extras)
+    GET /ready   → 200 once startup finished and the loop is responsive, else 503
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _frame_name(frame: traceback.FrameSummary) -> str:
+    module = os.path.splitext(os.path.relpath(frame.filename, _ROOT))[0]
+    return f"{module.replace(os.sep, '.')}.{frame.name}"
+
+
+def blocking_chain(stack: traceback.StackSummary) -> str:
+    """'inner ← caller ← …' over this project's frames, innermost first."""
+    ours = [f for f in stack if f.filename.startswith(_ROOT + os.sep)
+            and "site-packages" not in f.filename]
+    if not ours:
+        return _frame_name(stack[-1]) if stack else "?"
+    return " ← ".join(_frame_name(f) for f in reversed(ours))
+
+
+class LoopWatchdog:
+    """Measure event-loop lag and report where the loop is stuck."""
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.last_update: datetime | None = None
+        self._beat = time.monotonic()
+        self._reported = None
+        self._loop_thread: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, config: dict) -> "LoopWatchdog":
+        return cls(
+            threshold=config.get("watchdog_threshold_ms", 250) / 1000,
+            interval=config.get("watchdog_interval_ms", 100) / 1000,
+        )
+
+    def mark_update(self):
+        """Record that an update has just been processed."""
+        self.last_update = datetime.now(timezone.utc)
+
+    def start(self):
+        """Start the probe on the running loop and the helper thread."""
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._probe())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _probe(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(0.0, now - before - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            if self._reported == self._beat:
+                logger.warning("Цикл событий разблокирован через %.0f мс.",
+                               (now - self._beat) * 1000)
+            self._beat = now
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold + self.interval or self._reported == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._reported = beat
+            self.stalls += 1
+            stack = traceback.extract_stack(frame)
+            del frame
+            logger.warning(
+                "Цикл событий заблокирован уже %.0f мс: %s\n%s",
+                stalled * 1000, blocking_chain(stack),
+                "".join(traceback.format_list(stack[-12:])).rstrip(),
+            )
+
+    def snapshot(self) -> dict:
+        last = self.last_update
+        return {
+            "lag_ms": round(self.lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stalls,
+            "last_update_at": last.isoformat() if last else None,
+            "last_update_age_s": (
+                round((datetime.now(timezone.utc) - last).total_seconds(), 1)
+                if last else None),
+        }
+
+
+class HealthServer:
+    """Minimal HTTP server for liveness/readiness probes, served on the bot's loop.
+
+    Being on the same loop is the point: if the loop is blocked, the probe
+    times out as well.
+    """
+
+    def __init__(self, watchdog: LoopWatchdog, host: str = "127.0.0.1",
+                 port: int = 8080, extra=None):
+        self.watchdog = watchdog
+        self.host = host
+        self.port = port
+        self.extra = extra or dict
+        self.ready = False
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("Health-эндпоинт: http://%s:%d/health", self.host, self.port)
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _status(self) -> tuple[int, dict]:
+        body = {**self.watchdog.snapshot(), **self.extra(), "ready": self.ready}
+        ok = self.ready and self.watchdog.lag < self.watchdog.threshold
+        return (200 if ok else 503), body
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            parts = request.decode("latin-1").split()
+            path = parts[1] if len(parts) > 1 else "/"
+            if path == "/health":
+                code, body = 200, self._status()[1]
+            elif path == "/ready":
+                code, body = self._status()
+            else:
+                code, body = 404, {"error": "not found"}
+            payload = json.dumps(body).encode("utf-8")
+            reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}[code]
+            writer.write(
+                f"HTTP/1.1 {code} {reason}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n".encode("latin-1") + payload)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,129 @@
+"""Compact in-memory records for suggestions and polls.
+
+The JSON files stay the source of truth; these classes are what storage
+hands to read paths. They use __slots__, intern repeated strings (author
+names, suggestion ids shared between suggestions and poll options) and
+keep timestamps as integer microseconds since the epoch, so queries
+compare ints instead of re-parsing ISO strings.
+"""
+
+import sys
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def iso_to_us(value: str) -> int:
+    """Parse an ISO-8601 timestamp to integer microseconds since the epoch."""
+    delta = datetime.fromisoformat(value) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def dt_to_us(value: datetime) -> int:
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def us_to_iso(value: int) -> str:
+    """Inverse of iso_to_us (UTC)."""
+    return (EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Suggestion:
+    __slots__ = ("id", "name", "author_id", "author_name", "submitted_at_us",
+                 "used_in_daily")
+
+    def __init__(self, id: str, name: str, author_id: int, author_name: str,
+                 submitted_at_us: int, used_in_daily: bool):
+        self.id = _intern(id)
+        self.name = name
+        self.author_id = author_id
+        self.author_name = _intern(author_name)
+        self.submitted_at_us = submitted_at_us
+        self.used_in_daily = used_in_daily
+
+    @property
+    def submitted_at(self) -> str:
+        return us_to_iso(self.submitted_at_us)
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Suggestion":
+        return cls(d["id"], d["name"], d["author_id"], d["author_name"],
+                   iso_to_us(d["submitted_at"]), d["used_in_daily"])
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "author_id": self.author_id,
+            "author_name": self.author_name,
+            "submitted_at": self.submitted_at,
+            "used_in_daily": self.used_in_daily,
+        }
+
+
+class PollOption:
+    __slots__ = ("text", "suggestion_id", "voter_count")
+
+    def __init__(self, text: str, suggestion_id: str | None, voter_count: int):
+        self.text = text
+        self.suggestion_id = _intern(suggestion_id)
+        self.voter_count = voter_count
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "PollOption":
+        return cls(d["text"], d.get("suggestion_id"), d.get("voter_count", 0))
+
+    def to_dict(self) -> dict:
+        d = {"text": self.text, "voter_count": self.voter_count}
+        if self.suggestion_id is not None:
+            d["suggestion_id"] = self.suggestion_id
+        return d
+
+
+class Poll:
+    __slots__ = ("poll_id", "message_id", "options", "created_at_us", "type",
+                 "closed", "total_voters")
+
+    def __init__(self, poll_id: str, message_id: int, options: tuple,
+                 created_at_us: int, type: str, closed: bool,
+                 total_voters: int | None = None):
+        self.poll_id = poll_id
+        self.message_id = message_id
+        self.options = options
+        self.created_at_us = created_at_us
+        self.type = _intern(type)
+        self.closed = closed
+        self.total_voters = total_voters
+
+    @property
+    def created_at(self) -> str:
+        return us_to_iso(self.created_at_us)
+
+    @classmethod
+    def from_dict(cls, poll_id: str, d: dict) -> "Poll":
+        return cls(
+            poll_id,
+            d["message_id"],
+            tuple(PollOption.from_dict(o) for o in d["options"]),
+            iso_to_us(d["created_at"]),
+            d["type"],
+            d.get("closed", False),
+            d.get("total_voters"),
+        )
+
+    def to_dict(self) -> dict:
+        d = {
+            "message_id": self.message_id,
+            "options": [o.to_dict() for o in self.options],
+            "created_at": self.created_at,
+            "type": self.type,
+            "closed": self.closed,
+        }
+        if self.total_voters is not None:
+            d["total_voters"] = self.total_voters
+        return d
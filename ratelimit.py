@@ -0,0 +1,142 @@
+"""Token-bucket throttling for the suggestion ingest path."""
+
+import logging
+import time
+from collections import deque
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+# Result codes returned by SuggestionThrottle.admit()
+ADMIT = "admit"      # write immediately
+QUEUED = "queued"    # global write budget exhausted, written with the next batch
+LIMITED = "limited"  # this user is over their own budget
+FULL = "full"        # global budget exhausted and the queue is full
+
+
+class TokenBucket:
+    """Classic token bucket: *rate* tokens per second, at most *burst* stored."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float | None = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def peek(self, now: float | None = None) -> bool:
+        """Return True if a token is available, without consuming it."""
+        self._refill(time.monotonic() if now is None else now)
+        return self.tokens >= 1
+
+    def take(self, now: float | None = None) -> bool:
+        """Consume one token if available."""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class SuggestionThrottle:
+    """Per-user and global rate limiting in front of storage.add_suggestion.
+
+    Per-user buckets live in memory and are evicted once they have been idle
+    long enough to be full again. When only the global write budget is
+    exhausted, submissions are parked in a bounded queue which flush()
+    writes in a single storage batch.
+    """
+
+    def __init__(self, user_rate: float = 0.2, user_burst: int = 5,
+                 global_rate: float = 2.0, global_burst: int = 20,
+                 idle_seconds: float = 600, queue_size: int = 200):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.idle_seconds = idle_seconds
+        self.queue_size = queue_size
+        self._global = TokenBucket(global_rate, global_burst)
+        self._users: dict[int, TokenBucket] = {}
+        # (storage namespace, name, author_id, author_name)
+        self._queue: deque[tuple[str, str, int, str]] = deque()
+        self._last_evict = time.monotonic()
+
+    @classmethod
+    def from_config(cls, config: dict) -> "SuggestionThrottle":
+        return cls(
+            user_rate=config.get("suggest_user_rate", 0.2),
+            user_burst=config.get("suggest_user_burst", 5),
+            global_rate=config.get("suggest_global_rate", 2.0),
+            global_burst=config.get("suggest_global_burst", 20),
+            idle_seconds=config.get("suggest_idle_seconds", 600),
+            queue_size=config.get("suggest_queue_size", 200),
+        )
+
+    def _evict_idle(self, now: float):
+        if now - self._last_evict < self.idle_seconds:
+            return
+        cutoff = now - self.idle_seconds
+        stale = [uid for uid, b in self._users.items() if b.updated < cutoff]
+        for uid in stale:
+            del self._users[uid]
+        self._last_evict = now
+
+    def admit(self, name: str, author_id: int, author_name: str) -> str:
+        """Decide what to do with a submission. Returns one of the result codes."""
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        bucket = self._users.get(author_id)
+        if bucket is None:
+            bucket = self._users[author_id] = TokenBucket(
+                self.user_rate, self.user_burst, now)
+        if not bucket.peek(now):
+            return LIMITED
+
+        # The user's token is only spent once the submission is taken
+        if self._global.take(now):
+            bucket.take(now)
+            return ADMIT
+        if len(self._queue) >= self.queue_size:
+            return FULL
+        bucket.take(now)
+        self._queue.append((storage.current_namespace(), name, author_id, author_name))
+        return QUEUED
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def flush(self) -> list:
+        """Write queued submissions, one batch per namespace. Returns the stored records.
+
+        Entries leave the queue only once their batch is stored; a namespace
+        whose write fails keeps its entries for the next flush.
+        """
+        if not self._queue:
+            return []
+        batches: dict[str, list] = {}
+        for entry in list(self._queue):
+            batches.setdefault(entry[0], []).append(entry)
+        total = 0
+        added = []
+        for ns, entries in batches.items():
+            try:
+                with storage.namespace(ns):
+                    added.extend(storage.add_suggestions([e[1:] for e in entries]))
+            except Exception:
+                logger.exception("Очередь предложений для %s не записана, повторю позже.", ns)
+                continue
+            for entry in entries:
+                self._queue.remove(entry)
+            total += len(entries)
+        if total:
+            logger.info("Очередь предложений записана: %d из %d (остальное — дубли).",
+                        len(added), total)
+        return added
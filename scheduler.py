@@ -1,20 +1,31 @@
 """APScheduler cron/date jobs for daily and weekly polls."""
 
+import asyncio
 import logging
+import os
 import random
-from datetime import datetime, timedelta, timezone
+from datetime import timedelta, timezone
 
 import pytz
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest, Forbidden, TimedOut, NetworkError
 
+import assets
+import clock
+import leaderboard
+import scoring
 import storage
+import tenants
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_JOB_STORE = "data/jobs.sqlite"
+
 # Telegram limits polls to 10 options; reserve 1 for the joke option
 MAX_POLL_OPTIONS = 10
 JOKE_OPTION = "Всё это отвратительно. Дайте посмотреть результаты"
@@ -26,41 +37,77 @@ def thread_kwargs(config: dict) -> dict:
     return {"message_thread_id": tid} if tid else {}
 
 
+def suggest_url(config: dict) -> str:
+    """Deep link that opens the private suggest flow for this chat."""
+    payload = tenants.start_payload(config, "suggest")
+    return f"https://t.me/{config['bot_username']}?start={payload}"
+
+
+def broadcast_bot(bot):
+    """Bot to fan messages out to subscribers with (its own connection pool if set up)."""
+    return _runtime.get("broadcast_bot") or bot
+
+
+async def run_for_tenant(func, bot, config: dict, *args):
+    """Run a job coroutine with *config*'s tenant (and storage namespace) bound."""
+    with tenants.use(config):
+        await func(bot, config, *args)
+
+
 # ---------------------------------------------------------------------------
 # Close open polls
 # ---------------------------------------------------------------------------
 
-async def close_open_polls(bot, config: dict, poll_type: str | None = None):
-    """Close all open polls (optionally filtered by type) and capture final votes."""
-    open_polls = storage.get_open_polls()
-    for poll_id, poll in open_polls.items():
-        if poll_type and poll.get("type") != poll_type:
-            continue
-        try:
-            final = await bot.stop_poll(
-                chat_id=config["chat_id"],
-                message_id=poll["message_id"],
-            )
-            counts = [opt.voter_count for opt in final.options]
-            storage.set_poll_option_counts(poll_id, counts)
-            storage.close_poll(poll_id)
-            logger.info("Опрос %s закрыт, голоса: %s", poll_id, counts)
-        except BadRequest as e:
-            logger.warning("Не удалось закрыть опрос %s: %s", poll_id, e)
-            storage.close_poll(poll_id)
-        except (TimedOut, NetworkError) as e:
-            logger.warning("Таймаут/сеть при закрытии опроса %s: %s", poll_id, e)
+@traced()
+async def close_open_polls(bot, config: dict, poll_type: str | None = None,
+                           limit: asyncio.Semaphore | None = None):
+    """Close all open polls (optionally filtered by type) and capture final votes.
+
+    Polls are stopped concurrently, at most *limit* at a time (one by one
+    when no semaphore is given).
+    """
+    limit = limit or asyncio.Semaphore(1)
+
+    async def close(poll_id: str, poll: dict):
+        async with limit:
+            try:
+                final = await bot.stop_poll(
+                    chat_id=config["chat_id"],
+                    message_id=poll["message_id"],
+                )
+                counts = [opt.voter_count for opt in final.options]
+
+                def store():
+                    with storage.transaction():
+                        storage.set_poll_option_counts(poll_id, counts, final.total_voter_count)
+                        storage.close_poll(poll_id)
+                await asyncio.to_thread(store)
+                logger.info("Опрос %s закрыт, голоса: %s", poll_id, counts)
+            except BadRequest as e:
+                logger.warning("Не удалось закрыть опрос %s: %s", poll_id, e)
+                await asyncio.to_thread(storage.close_poll, poll_id)
+            except (TimedOut, NetworkError) as e:
+                logger.warning("Таймаут/сеть при закрытии опроса %s: %s", poll_id, e)
+
+    await asyncio.gather(*(
+        close(poll_id, poll)
+        for poll_id, poll in storage.get_open_polls().items()
+        if not poll_type or poll.get("type") == poll_type
+    ))
 
 
 # ---------------------------------------------------------------------------
 # Daily poll
 # ---------------------------------------------------------------------------
 
+@traced()
 async def _post_results(bot, config: dict):
-    """Post current standings to the group (lazy-imports format_results to avoid circular dep)."""
-    from bot import format_results
+    """Post current standings to the group, unless the live leaderboard shows them."""
+    if leaderboard.enabled(config):
+        await leaderboard.ensure(bot, config)
+        return
 
-    text = format_results(config)
+    text = leaderboard.format_results(config)
     if text:
         await bot.send_message(
             chat_id=config["chat_id"],
@@ -69,6 +116,13 @@ async def _post_results(bot, config: dict):
         )
 
 
+def _store_daily_poll(msg, poll_options: list):
+    with storage.transaction():
+        storage.save_poll(msg.poll.id, msg.message_id, poll_options, "daily")
+        storage.mark_suggestions_used([o["suggestion_id"] for o in poll_options])
+
+
+@traced(root=True)
 async def run_daily_poll(bot, config: dict):
     """Send daily poll(s) with unused suggestions."""
     await close_open_polls(bot, config)
@@ -108,8 +162,7 @@ async def run_daily_poll(bot, config: dict):
             }
             for s in chunk
         ]
-        storage.save_poll(msg.poll.id, msg.message_id, poll_options, "daily")
-        storage.mark_suggestions_used([s["id"] for s in chunk])
+        await asyncio.to_thread(_store_daily_poll, msg, poll_options)
 
         logger.info("Ежедневный опрос отправлен: %s (%d вариантов)",
                      title, len(options))
@@ -119,36 +172,35 @@ async def run_daily_poll(bot, config: dict):
 # Weekly poll
 # ---------------------------------------------------------------------------
 
-async def run_weekly_poll(bot, config: dict, scheduler: AsyncIOScheduler):
+@traced(root=True)
+async def run_weekly_poll(bot, config: dict, scheduler: AsyncIOScheduler | None = None):
     """Send weekly championship poll with top 10 names from the past week."""
+    scheduler = scheduler or _runtime["scheduler"]
     await close_open_polls(bot, config)
     await _post_results(bot, config)
 
     tz = pytz.timezone(config["timezone"])
-    since = datetime.now(tz) - timedelta(days=7)
+    since = clock.now(tz) - timedelta(days=7)
     since_utc = since.astimezone(timezone.utc)
-    scores = storage.get_daily_scores_since(since_utc)
+    ranked = scoring.rank_daily(config, since_utc)
 
-    if not scores:
+    if not ranked:
         logger.info("Нет результатов ежедневных голосований за неделю.")
         return
 
-    # Build list with suggestion details, sort by votes desc then recency
-    ranked = []
-    for sid, votes in scores.items():
-        suggestion = storage.get_suggestion_by_id(sid)
-        if suggestion:
-            ranked.append({
-                "suggestion_id": sid,
-                "name": suggestion["name"],
-                "author_id": suggestion["author_id"],
-                "author_name": suggestion["author_name"],
-                "votes": votes,
-                "submitted_at": suggestion["submitted_at"],
-            })
-
-    ranked.sort(key=lambda x: (-x["votes"], x["submitted_at"]))
-    top = ranked[:10]
+    suggestions = storage.get_suggestion_models()
+    top = [
+        {
+            "suggestion_id": sid,
+            "name": suggestions[sid].name,
+            "author_id": suggestions[sid].author_id,
+            "author_name": suggestions[sid].author_name,
+            "votes": votes,
+            "submitted_at": suggestions[sid].submitted_at,
+        }
+        for sid, votes, _ in ranked
+        if sid in suggestions
+    ][:10]
 
     if not top:
         return
@@ -172,24 +224,25 @@ async def run_weekly_poll(bot, config: dict, scheduler: AsyncIOScheduler):
         }
         for entry in top
     ]
-    storage.save_poll(msg.poll.id, msg.message_id, poll_options, "weekly")
+    await asyncio.to_thread(storage.save_poll, msg.poll.id, msg.message_id,
+                            poll_options, "weekly")
 
     # Save weekly result (revealed later)
     weekly_result = {
         "poll_id": msg.poll.id,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": clock.now(timezone.utc).isoformat(),
         "top": top,
         "revealed": False,
     }
-    storage.add_weekly_result(weekly_result)
+    await asyncio.to_thread(storage.add_weekly_result, weekly_result)
 
     # Schedule author reveal
     reveal_hours = config.get("reveal_delay_hours", 6)
-    reveal_time = datetime.now(tz) + timedelta(hours=reveal_hours)
+    reveal_time = clock.now(tz) + timedelta(hours=reveal_hours)
     scheduler.add_job(
-        run_author_reveal,
+        run_job,
         trigger=DateTrigger(run_date=reveal_time, timezone=tz),
-        args=[bot, config],
+        args=["author_reveal", config["key"]],
         id=f"reveal_{msg.poll.id}",
         replace_existing=True,
     )
@@ -201,6 +254,7 @@ async def run_weekly_poll(bot, config: dict, scheduler: AsyncIOScheduler):
 # Author reveal
 # ---------------------------------------------------------------------------
 
+@traced(root=True)
 async def run_author_reveal(bot, config: dict):
     """Announce weekly results with author names revealed."""
     weekly = storage.get_latest_weekly()
@@ -232,7 +286,7 @@ async def run_author_reveal(bot, config: dict):
         text="\n".join(lines),
         **thread_kwargs(config),
     )
-    storage.mark_weekly_revealed()
+    await asyncio.to_thread(storage.mark_weekly_revealed)
     logger.info("Авторы еженедельного голосования раскрыты.")
 
 
@@ -240,13 +294,16 @@ async def run_author_reveal(bot, config: dict):
 # Daily prompt
 # ---------------------------------------------------------------------------
 
-async def run_daily_prompt(bot, config: dict, prompt_lines: list[str]):
+@traced(root=True)
+async def run_daily_prompt(bot, config: dict, prompt_lines=None):
     """Send a creative prompt to the group and to all subscribers."""
+    if prompt_lines is None:
+        prompt_lines = assets.PROMPT_LINES
     prompt_text = random.choice(prompt_lines)
     keyboard = InlineKeyboardMarkup([[
         InlineKeyboardButton(
             "✏️ Предложить название",
-            url=f"https://t.me/{config['bot_username']}?start=suggest",
+            url=suggest_url(config),
         )
     ]])
 
@@ -257,66 +314,179 @@ async def run_daily_prompt(bot, config: dict, prompt_lines: list[str]):
         **thread_kwargs(config),
     )
 
-    for sub in storage.get_all_subscribers():
-        try:
-            await bot.send_message(
-                chat_id=sub["user_id"],
-                text=prompt_text,
-                reply_markup=keyboard,
-            )
-        except Forbidden:
-            storage.remove_subscriber(sub["user_id"])
-            logger.info("Подписчик %d заблокировал бота, удалён.", sub["user_id"])
-        except Exception:
-            logger.exception("Ошибка отправки промпта подписчику %d", sub["user_id"])
+    blocked = []
+    fanout = broadcast_bot(bot)
+    for page in storage.subscribers().iter_pages():
+        for sub in page:
+            try:
+                await fanout.send_message(
+                    chat_id=sub["user_id"],
+                    text=prompt_text,
+                    reply_markup=keyboard,
+                )
+            except Forbidden:
+                blocked.append(sub["user_id"])
+                logger.info("Подписчик %d заблокировал бота.", sub["user_id"])
+            except Exception:
+                logger.exception("Ошибка отправки промпта подписчику %d", sub["user_id"])
+
+    if blocked:
+        removed = await asyncio.to_thread(storage.subscribers().remove_many, blocked)
+        logger.info("Удалено подписчиков, заблокировавших бота: %d", removed)
 
     logger.info("Ежедневный промпт отправлен.")
 
 
+# ---------------------------------------------------------------------------
+# What's new
+# ---------------------------------------------------------------------------
+
+@traced(root=True)
+async def run_whats_new(bot, config: dict, text: str, digest: str):
+    """Send the "what's new" note to subscribers once per text version."""
+    if storage.get_meta("whats_new_sent") == digest:
+        return
+    for page in storage.subscribers().iter_pages():
+        for sub in page:
+            try:
+                await broadcast_bot(bot).send_message(chat_id=sub["user_id"], text=text)
+            except Exception:
+                logger.exception("Ошибка отправки what's new подписчику %d", sub["user_id"])
+    await asyncio.to_thread(storage.set_meta, "whats_new_sent", digest)
+    logger.info("What's new отправлен подписчикам (%s).", config["key"])
+
+
 # ---------------------------------------------------------------------------
 # Scheduler setup
 # ---------------------------------------------------------------------------
 
-def create_scheduler(bot, config: dict, prompt_lines: list[str]) -> AsyncIOScheduler:
-    """Create and return an AsyncIOScheduler with daily & weekly cron jobs."""
-    tz = pytz.timezone(config["timezone"])
-    scheduler = AsyncIOScheduler(timezone=tz)
+# Objects jobs need but the job store cannot pickle; set by create_scheduler()
+_runtime: dict = {}
+
+# Job name -> coroutine(bot, config, *args). Stored jobs refer to these by name.
+JOBS = {
+    "daily_poll": run_daily_poll,
+    "weekly_poll": run_weekly_poll,
+    "author_reveal": run_author_reveal,
+    "daily_prompt": run_daily_prompt,
+    "whats_new": run_whats_new,
+    "leaderboard": leaderboard.refresh,
+}
+
+
+async def run_job(name: str, tenant_key: str, *args):
+    """Entry point of every stored job: resolve the chat and bot at run time."""
+    config = tenants.for_key(tenant_key)
+    if config is None:
+        logger.warning("Задача %s для неизвестного чата %s пропущена.", name, tenant_key)
+        return
+    await run_for_tenant(JOBS[name], _runtime["bot"], config, *args)
 
-    scheduler.add_job(
-        run_daily_poll,
-        trigger=CronTrigger(
+
+def _same_trigger(a, b) -> bool:
+    if isinstance(a, IntervalTrigger) and isinstance(b, IntervalTrigger):
+        # repr() includes the start date, which moves on every call
+        return a.interval == b.interval and str(a.timezone) == str(b.timezone)
+    return repr(a) == repr(b)
+
+
+def ensure_job(scheduler: AsyncIOScheduler, job_id: str, trigger, args: list) -> bool:
+    """Add a job unless an identical one is already stored. Returns True if it changed.
+
+    Keeping the stored job keeps its next run time, so a run that fell into
+    downtime is still caught up (within misfire_grace_time) after a restart.
+    """
+    job = scheduler.get_job(job_id)
+    if job is not None and _same_trigger(job.trigger, trigger) and list(job.args) == args:
+        return False
+    scheduler.add_job(run_job, trigger=trigger, args=args, id=job_id,
+                      replace_existing=True)
+    return True
+
+
+def add_tenant_jobs(scheduler: AsyncIOScheduler, config: dict) -> list[str]:
+    """Register (or update) the cron jobs of one chat, ids prefixed by its key.
+
+    Returns the ids of jobs that were added, rescheduled or removed.
+    """
+    tz = pytz.timezone(config["timezone"])
+    key = config["key"]
+    jobs = {
+        f"{key}:daily_poll": (CronTrigger(
             hour=config["daily_poll_hour"],
             minute=config["daily_poll_minute"],
             timezone=tz,
-        ),
-        args=[bot, config],
-        id="daily_poll",
-        replace_existing=True,
-    )
-
-    scheduler.add_job(
-        run_weekly_poll,
-        trigger=CronTrigger(
+        ), ["daily_poll", key]),
+        f"{key}:weekly_poll": (CronTrigger(
             day_of_week=config["weekly_poll_day"],
             hour=config["weekly_poll_hour"],
             minute=config["weekly_poll_minute"],
             timezone=tz,
-        ),
-        args=[bot, config, scheduler],
-        id="weekly_poll",
-        replace_existing=True,
-    )
-
-    scheduler.add_job(
-        run_daily_prompt,
-        trigger=CronTrigger(
+        ), ["weekly_poll", key]),
+        f"{key}:daily_prompt": (CronTrigger(
             hour=config.get("daily_prompt_hour", 9),
             minute=config.get("daily_prompt_minute", 0),
             timezone=tz,
-        ),
-        args=[bot, config, prompt_lines],
-        id="daily_prompt",
-        replace_existing=True,
+        ), ["daily_prompt", key]),
+    }
+    if leaderboard.enabled(config):
+        jobs[f"{key}:leaderboard"] = (IntervalTrigger(
+            seconds=config.get("leaderboard_edit_seconds", 30),
+            timezone=tz,
+        ), ["leaderboard", key])
+
+    changed = [job_id for job_id, (trigger, args) in jobs.items()
+               if ensure_job(scheduler, job_id, trigger, args)]
+    if f"{key}:leaderboard" not in jobs and scheduler.get_job(f"{key}:leaderboard"):
+        scheduler.remove_job(f"{key}:leaderboard")
+        changed.append(f"{key}:leaderboard")
+    return changed
+
+
+def sync_tenant_jobs(scheduler: AsyncIOScheduler, tenant_configs: dict[str, dict]) -> list[str]:
+    """Make the stored jobs match *tenant_configs*. Returns the ids that changed."""
+    changed = []
+    for job in scheduler.get_jobs():
+        if len(job.args) > 1 and job.args[1] not in tenant_configs:
+            logger.info("Задача %s удалена: чата %s больше нет в конфиге.", job.id, job.args[1])
+            job.remove()
+            changed.append(job.id)
+    for tenant in tenant_configs.values():
+        changed.extend(add_tenant_jobs(scheduler, tenant))
+    return changed
+
+
+def create_scheduler(bot, tenant_configs: dict[str, dict],
+                     config: dict | None = None, broadcast_bot=None) -> AsyncIOScheduler:
+    """Create and start (paused) one scheduler with the cron jobs of every chat.
+
+    Jobs live in a SQLite job store (config "job_store", default
+    data/jobs.sqlite; null keeps them in memory), so one-off jobs such as
+    author reveals survive restarts. *broadcast_bot*, if given, sends the
+    messages to subscribers.
+    """
+    config = config or {}
+    jobstores = {}
+    path = config.get("job_store", DEFAULT_JOB_STORE)
+    if path:
+        from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        jobstores["default"] = SQLAlchemyJobStore(url=f"sqlite:///{path}")
+
+    scheduler = AsyncIOScheduler(
+        timezone=pytz.utc,
+        jobstores=jobstores,
+        job_defaults={
+            "misfire_grace_time": config.get("misfire_grace_time", 3600),
+            "coalesce": config.get("coalesce", True),
+            "max_instances": 1,
+        },
     )
+    _runtime["bot"] = bot
+    _runtime["broadcast_bot"] = broadcast_bot
+    _runtime["scheduler"] = scheduler
+    # Started paused: jobs only run once this worker holds the scheduler lease
+    scheduler.start(paused=True)
 
+    sync_tenant_jobs(scheduler, tenant_configs)
     return scheduler
@@ -0,0 +1,177 @@
+"""Vectorized suggestion scoring over per-poll option counts.
+
+All daily polls in a window are flattened into parallel NumPy arrays (one
+entry per poll option), and every scorer is a handful of bincount calls
+over those arrays, so ranking cost does not grow with a Python loop over
+polls.
+
+Scorers:
+    raw    — summed voter_count (the original ranking)
+    share  — summed per-poll vote share, count / turnout, so a name in a
+             small poll can compete with one in a big poll
+    bayes  — Bayesian average of the per-poll share, shrunk towards the
+             global mean for names that appeared in few polls
+"""
+
+import logging
+
+import numpy as np
+
+import storage
+from models import dt_to_us
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+
+class PollMatrix:
+    """Flattened (suggestion, count, turnout, poll time) rows for a set of polls."""
+
+    __slots__ = ("sids", "sid_idx", "counts", "turnout", "created")
+
+    def __init__(self, sids: list[str], sid_idx: np.ndarray, counts: np.ndarray,
+                 turnout: np.ndarray, created: np.ndarray):
+        self.sids = sids
+        self.sid_idx = sid_idx
+        self.counts = counts
+        self.turnout = turnout
+        self.created = created
+
+    @classmethod
+    def from_polls(cls, polls, poll_type: str = "daily") -> "PollMatrix":
+        positions: dict[str, int] = {}
+        sid_idx, counts, turnout, created = [], [], [], []
+        for poll in polls:
+            if poll.type != poll_type:
+                continue
+            opts = [o for o in poll.options if o.suggestion_id]
+            if not opts:
+                continue
+            # Unique voters when Telegram reported it, else the vote sum
+            total = poll.total_voters or sum(o.voter_count for o in opts)
+            for o in opts:
+                sid_idx.append(positions.setdefault(o.suggestion_id, len(positions)))
+                counts.append(o.voter_count)
+                turnout.append(total)
+                created.append(poll.created_at_us)
+        return cls(
+            list(positions),
+            np.asarray(sid_idx, dtype=np.intp),
+            np.asarray(counts, dtype=np.float64),
+            np.asarray(turnout, dtype=np.float64),
+            np.asarray(created, dtype=np.int64),
+        )
+
+    def since(self, since_us: int | None) -> "PollMatrix":
+        """Rows of polls created at or after *since_us* (same suggestion axis)."""
+        if since_us is None:
+            return self
+        mask = self.created >= since_us
+        return PollMatrix(self.sids, self.sid_idx[mask], self.counts[mask],
+                          self.turnout[mask], self.created[mask])
+
+    def __len__(self) -> int:
+        return len(self.sid_idx)
+
+    def _sum(self, weights: np.ndarray) -> np.ndarray:
+        return np.bincount(self.sid_idx, weights=weights, minlength=len(self.sids))
+
+    def appearances(self) -> np.ndarray:
+        return np.bincount(self.sid_idx, minlength=len(self.sids))
+
+    def raw(self) -> np.ndarray:
+        return self._sum(self.counts)
+
+    def shares(self) -> np.ndarray:
+        """Per-row vote share; rows of polls with no votes get 0."""
+        return np.divide(self.counts, self.turnout,
+                         out=np.zeros_like(self.counts), where=self.turnout > 0)
+
+
+# namespace -> (poll models dict the matrix was built from, matrix). storage
+# hands out a new dict only when poll_results.json changes, so identity is
+# the key.
+_matrix_cache: dict[str, tuple] = {}
+
+
+def daily_matrix(polls: dict | None = None) -> PollMatrix:
+    """PollMatrix of all daily polls, rebuilt only when the poll file changes."""
+    if polls is None:
+        polls = storage.get_poll_models()
+    ns = storage.current_namespace()
+    hit = _matrix_cache.get(ns)
+    if hit is None or hit[0] is not polls:
+        hit = _matrix_cache[ns] = (polls, PollMatrix.from_polls(polls.values()))
+    return hit[1]
+
+
+def score_raw(m: PollMatrix, **_) -> np.ndarray:
+    return m.raw()
+
+
+def score_share(m: PollMatrix, **_) -> np.ndarray:
+    return m._sum(m.shares())
+
+
+def score_bayes(m: PollMatrix, prior_weight: float = 2.0, **_) -> np.ndarray:
+    shares = m.shares()
+    share_sum = m._sum(shares)
+    appearances = m.appearances()
+    prior_mean = shares.mean() if len(shares) else 0.0
+    return (prior_weight * prior_mean + share_sum) / (prior_weight + appearances)
+
+
+SCORERS = {
+    "raw": score_raw,
+    "share": score_share,
+    "bayes": score_bayes,
+}
+
+# Unknown ranking_method values already warned about
+_warned: set = set()
+
+
+def check_method(method) -> None:
+    """Raise ValueError unless *method* names a scorer."""
+    if method not in SCORERS:
+        raise ValueError(f"ranking_method must be one of {', '.join(SCORERS)}, got {method!r}")
+
+
+def _scorer(method):
+    scorer = SCORERS.get(method)
+    if scorer is None:
+        if method not in _warned:
+            _warned.add(method)
+            logger.warning("Неизвестный ranking_method %r, считаю по голосам (raw).", method)
+        scorer = score_raw
+    return scorer
+
+
+@traced()
+def rank_daily(config: dict, since_dt=None, snap=None) -> list[tuple[str, int, float]]:
+    """Rank suggestions from daily polls since *since_dt* (all polls if None).
+
+    The scorer is chosen by config["ranking_method"] (default "raw"; an
+    unknown name falls back to "raw" with a warning). Reads
+    from the storage.Snapshot *snap* when given, else the current files.
+    Returns [(suggestion_id, raw_votes, score)] sorted by score descending,
+    ties broken by raw votes and then by submission time.
+    """
+    scorer = _scorer(config.get("ranking_method", "raw"))
+    since_us = dt_to_us(since_dt) if since_dt is not None else None
+    m = daily_matrix(snap.polls if snap else None).since(since_us)
+    if not len(m):
+        return []
+
+    raw = m.raw()
+    scores = scorer(m, prior_weight=config.get("bayes_prior_weight", 2.0))
+    suggestions = snap.suggestions if snap else storage.get_suggestion_models()
+    submitted = np.asarray(
+        [suggestions[sid].submitted_at_us if sid in suggestions else 0
+         for sid in m.sids],
+        dtype=np.int64,
+    )
+    # lexsort: last key is primary; skip suggestions with no polls in window
+    order = np.lexsort((submitted, -raw, -scores))
+    order = order[m.appearances()[order] > 0]
+    return [(m.sids[i], int(raw[i]), float(scores[i])) for i in order]
@@ -0,0 +1,352 @@
+"""Run weeks of the job schedule in seconds on a virtual clock.
+
+The real scheduler (create_scheduler, in-memory job store) is driven by
+hand: the clock jumps to the next due job, the job runs, and its next run
+time is taken from its trigger, as APScheduler would. Between jobs a
+synthetic crowd submits suggestions (through storage, like /suggest) and
+votes in the open polls of a recording fake bot, whose stop_poll returns
+the tallies. Data goes to a temporary directory.
+
+Reports, per job: runs, duration, bytes written to data files and Telegram
+API calls. The run is deterministic for a given seed, so byte and call
+counts can be compared exactly between commits:
+
+    python simulate.py --weeks 4 --json sim.json
+    python simulate.py --weeks 4 --baseline sim.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from apscheduler.triggers.interval import IntervalTrigger
+
+import clock
+import scheduler
+import storage
+import tenants
+
+DEFAULT_CONFIG = {
+    "bot_token": "simulated",
+    "bot_username": "SimulatedBot",
+    "chat_id": -1001234567890,
+    "thread_id": None,
+    "admin_user_ids": [1],
+    "daily_poll_hour": 21,
+    "daily_poll_minute": 0,
+    "weekly_poll_day": "fri",
+    "weekly_poll_hour": 18,
+    "weekly_poll_minute": 0,
+    "daily_prompt_hour": 9,
+    "daily_prompt_minute": 0,
+    "timezone": "Europe/Berlin",
+    "job_store": None,
+}
+
+WORDS = (
+    "Solar", "Velvet", "Cosmic", "Iron", "Paper", "Electric", "Silent", "Atomic",
+    "Lunar", "Neon", "Broken", "Golden", "Arkestra", "Tigers", "Saturn", "Machines",
+    "Orchestra", "Ghosts", "Rivers", "Drums", "Kites", "Engines", "Comets", "Owls",
+)
+
+
+class FakeBot:
+    """Records every Bot API call and keeps the tallies of the polls it sent."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.polls: dict[int, dict] = {}  # message_id -> poll state
+        self._next_id = 0
+
+    def _message_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls["send_message"] += 1
+        return SimpleNamespace(message_id=self._message_id(), chat_id=chat_id)
+
+    async def send_poll(self, chat_id, question, options, **kwargs):
+        self.calls["send_poll"] += 1
+        message_id = self._message_id()
+        poll = {"id": f"sim-poll-{message_id}", "counts": [0] * len(options),
+                "voters": set(), "closed": False}
+        self.polls[message_id] = poll
+        return SimpleNamespace(message_id=message_id, chat_id=chat_id,
+                               poll=SimpleNamespace(id=poll["id"]))
+
+    async def stop_poll(self, chat_id, message_id, **kwargs):
+        self.calls["stop_poll"] += 1
+        poll = self.polls[message_id]
+        poll["closed"] = True
+        return SimpleNamespace(
+            id=poll["id"],
+            options=[SimpleNamespace(voter_count=c) for c in poll["counts"]],
+            total_voter_count=len(poll["voters"]),
+        )
+
+    async def pin_chat_message(self, chat_id, message_id, **kwargs):
+        self.calls["pin_chat_message"] += 1
+        return True
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        self.calls["edit_message_text"] += 1
+        return SimpleNamespace(message_id=message_id, chat_id=chat_id)
+
+    def open_polls(self):
+        return [p for p in self.polls.values() if not p["closed"]]
+
+
+class Crowd:
+    """Synthetic chat members: suggest names at a steady rate and vote in open polls."""
+
+    def __init__(self, rng: random.Random, bot: FakeBot, voters: int,
+                 suggestions_per_day: float, turnout: float):
+        self.rng = rng
+        self.bot = bot
+        self.voters = voters
+        self.suggestions_per_day = suggestions_per_day
+        self.turnout = turnout
+        self._serial = 0
+
+    def _name(self) -> str:
+        self._serial += 1
+        return f"{self.rng.choice(WORDS)} {self.rng.choice(WORDS)} {self._serial}"
+
+    def act(self, start: datetime, end: datetime, vclock: "VirtualClock"):
+        """Everything the crowd does between *start* and *end*, in time order."""
+        span = (end - start).total_seconds()
+        if span <= 0:
+            return
+        expected = self.suggestions_per_day * span / 86400
+        count = int(expected) + (self.rng.random() < expected - int(expected))
+        events = sorted(self.rng.uniform(0, span) for _ in range(count))
+        for offset in events:
+            vclock.set(start + timedelta(seconds=offset))
+            tenant = self.rng.choice(list(tenants.TENANTS.values()))
+            author = self.rng.randrange(self.voters) + 1000
+            with tenants.use(tenant):
+                storage.add_suggestion(self._name(), author, f"Участник {author}")
+        vclock.set(end)
+
+        for poll in self.bot.open_polls():
+            for voter in range(self.voters):
+                if voter in poll["voters"] or self.rng.random() >= self.turnout * min(1, span / 3600):
+                    continue
+                poll["voters"].add(voter)
+                picks = self.rng.sample(range(len(poll["counts"])),
+                                        k=min(len(poll["counts"]), self.rng.randint(1, 3)))
+                for i in picks:
+                    poll["counts"][i] += 1
+
+
+class VirtualClock:
+    def __init__(self, start: datetime):
+        self.now = start
+
+    def set(self, when: datetime):
+        self.now = when
+
+    def __enter__(self):
+        clock.set_source(lambda: self.now)
+        return self
+
+    def __exit__(self, *exc):
+        clock.set_source(None)
+
+
+class Report:
+    def __init__(self):
+        self.jobs: dict[str, dict] = {}
+
+    def add(self, name: str, seconds: float, written: int, calls: int):
+        row = self.jobs.setdefault(name, {"runs": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                          "bytes": 0, "api_calls": 0})
+        ms = seconds * 1000
+        row["runs"] += 1
+        row["total_ms"] += ms
+        row["max_ms"] = max(row["max_ms"], ms)
+        row["bytes"] += written
+        row["api_calls"] += calls
+
+    def print(self, out=sys.stdout):
+        print(f"{'job':<16}{'runs':>6}{'mean ms':>10}{'max ms':>10}{'total ms':>11}"
+              f"{'KB written':>12}{'API calls':>11}", file=out)
+        for name, row in sorted(self.jobs.items()):
+            print(f"{name:<16}{row['runs']:>6}{row['total_ms'] / row['runs']:>10.2f}"
+                  f"{row['max_ms']:>10.2f}{row['total_ms']:>11.1f}"
+                  f"{row['bytes'] / 1024:>12.1f}{row['api_calls']:>11}", file=out)
+
+
+class Simulation:
+    def __init__(self, config: dict, start: datetime, rng: random.Random,
+                 voters: int, suggestions_per_day: float, turnout: float):
+        self.config = config
+        self.clock = VirtualClock(start)
+        self.bot = FakeBot()
+        self.crowd = Crowd(rng, self.bot, voters, suggestions_per_day, turnout)
+        self.report = Report()
+        self.scheduler = None
+
+    def _measure(self):
+        return time.perf_counter(), storage.bytes_written, sum(self.bot.calls.values())
+
+    def _record(self, name: str, before):
+        t0, written, calls = before
+        self.report.add(name, time.perf_counter() - t0, storage.bytes_written - written,
+                        sum(self.bot.calls.values()) - calls)
+
+    async def run(self, until: datetime):
+        start = self.clock.now
+        self.scheduler = scheduler.create_scheduler(self.bot, tenants.TENANTS, self.config)
+        # Jobs were added against the wall clock; count from the virtual start instead
+        for job in self.scheduler.get_jobs():
+            if isinstance(job.trigger, IntervalTrigger):
+                job.modify(next_run_time=start + job.trigger.interval)
+            else:
+                job.modify(next_run_time=job.trigger.get_next_fire_time(None, start))
+
+        try:
+            while True:
+                due = next((j for j in self.scheduler.get_jobs() if j.next_run_time), None)
+                if due is None or due.next_run_time > until:
+                    break
+                when = due.next_run_time
+                before = self._measure()
+                self.crowd.act(self.clock.now, when, self.clock)
+                self._record("(crowd)", before)
+
+                # Move the job on first, as APScheduler does before submitting the run
+                following = due.trigger.get_next_fire_time(when, when)
+                if following:
+                    due.modify(next_run_time=following)
+                else:
+                    due.remove()
+                before = self._measure()
+                await due.func(*due.args, **due.kwargs)
+                self._record(due.args[0], before)
+            self.crowd.act(self.clock.now, until, self.clock)
+        finally:
+            self.scheduler.shutdown(wait=False)
+
+
+# Deterministic for a given seed, so safe to fail on; durations are wall-clock
+# and only reported
+GATED_METRICS = ("bytes", "api_calls")
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions of *report* against *baseline*: gated counts beyond the tolerance."""
+    problems = []
+    for name, base in baseline["jobs"].items():
+        row = report["jobs"].get(name)
+        if row is None:
+            problems.append(f"{name}: did not run")
+            continue
+        for metric in GATED_METRICS:
+            if row[metric] > base[metric] * (1 + tolerance) and row[metric] > 0:
+                problems.append(f"{name}: {metric} {base[metric]:.0f} -> {row[metric]:.0f}")
+    return problems
+
+
+def timing_changes(report: dict, baseline: dict) -> list[str]:
+    """total_ms per job against *baseline*, for information only."""
+    lines = []
+    for name, base in baseline["jobs"].items():
+        row = report["jobs"].get(name)
+        if row is not None and base["total_ms"]:
+            change = (row["total_ms"] / base["total_ms"] - 1) * 100
+            lines.append(f"{name}: {base['total_ms']:.0f} -> {row['total_ms']:.0f} ms ({change:+.0f}%)")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weeks", type=float, default=4)
+    parser.add_argument("--start", default="2024-01-01",
+                        help="virtual start date, UTC (default: %(default)s)")
+    parser.add_argument("--config", help="take chats and schedule from this config.json")
+    parser.add_argument("--chats", type=int, default=1,
+                        help="number of simulated chats without --config")
+    parser.add_argument("--voters", type=int, default=30)
+    parser.add_argument("--suggestions-per-day", type=float, default=12)
+    parser.add_argument("--turnout", type=float, default=0.6,
+                        help="share of voters voting in a poll open for an hour or more")
+    parser.add_argument("--subscribers", type=int, default=50)
+    parser.add_argument("--live-leaderboard", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="fail if bytes written or API calls regress "
+                                           "against this report (timings are only shown)")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed growth against --baseline (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = {**json.load(f), "job_store": None}
+    else:
+        config = dict(DEFAULT_CONFIG)
+        if args.chats > 1:
+            config["chats"] = [{"key": f"chat{i}", "chat_id": DEFAULT_CONFIG["chat_id"] - i}
+                               for i in range(args.chats)]
+    if args.live_leaderboard:
+        config["live_leaderboard"] = True
+
+    data_dir = tempfile.mkdtemp(prefix="sim-")
+    tenants.configure(config)
+    for tenant in tenants.TENANTS.values():
+        tenant["data_dir"] = os.path.join(data_dir, tenant["key"])
+
+    start = datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc)
+    until = start + timedelta(weeks=args.weeks)
+    sim = Simulation(config, start, rng, args.voters, args.suggestions_per_day, args.turnout)
+    wall = time.perf_counter()
+    try:
+        with sim.clock:
+            for tenant in tenants.TENANTS.values():
+                with tenants.use(tenant):
+                    storage.subscribers().add_many(
+                        [(10_000 + i, f"Подписчик {i}") for i in range(args.subscribers)])
+            asyncio.run(sim.run(until))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    wall = time.perf_counter() - wall
+
+    sim.report.print()
+    calls = ", ".join(f"{name} {n}" for name, n in sorted(sim.bot.calls.items()))
+    print(f"\n{args.weeks:g} weeks, {len(tenants.TENANTS)} chat(s) simulated in {wall:.1f} s")
+    print(f"API calls: {calls}")
+
+    report = {"args": vars(args), "jobs": sim.report.jobs, "api_calls": dict(sim.bot.calls)}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.tolerance)
+        for line in timing_changes(report, baseline):
+            print(f"timing {line}")
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,42 @@
+"""Startup timing breakdown.
+
+main() marks the end of each startup stage; the breakdown is logged once,
+together with the time to the first handled update.
+"""
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_started = time.perf_counter()
+_last = _started
+_stages: list[tuple[str, float]] = []
+_reported = False
+
+
+def mark(stage: str):
+    """Record that *stage* has just finished."""
+    global _last
+    now = time.perf_counter()
+    _stages.append((stage, now - _last))
+    _last = now
+
+
+def elapsed() -> float:
+    """Seconds since the process started its startup sequence."""
+    return time.perf_counter() - _started
+
+
+def breakdown() -> str:
+    return ", ".join(f"{name} {sec * 1000:.0f} мс" for name, sec in _stages)
+
+
+def first_response():
+    """Log the breakdown and time-to-first-response (only the first call does)."""
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    logger.info("Первое обновление обработано через %.0f мс после старта (%s).",
+                elapsed() * 1000, breakdown())
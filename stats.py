@@ -0,0 +1,137 @@
+"""Incrementally maintained analytics rollups and /stats rendering.
+
+The rollup document (data/stats.json) is updated by storage on every
+mutation that affects it, so /stats never rescans history:
+
+    {
+      "authors": {"<author_id>": {"name", "suggestions", "votes",
+                                  "finals", "wins"}},
+      "per_day": {"YYYY-MM-DD": suggestions submitted that day (UTC)},
+      "vote_hist": {"<votes>": number of daily poll options with that count}
+    }
+
+Functions here only transform the document; storage owns loading/saving.
+"""
+
+from datetime import datetime, timedelta
+
+
+def empty() -> dict:
+    return {"authors": {}, "per_day": {}, "vote_hist": {}}
+
+
+def _author(rollups: dict, author_id, name: str | None = None) -> dict:
+    entry = rollups["authors"].setdefault(str(author_id), {
+        "name": name or str(author_id),
+        "suggestions": 0,
+        "votes": 0,
+        "finals": 0,
+        "wins": 0,
+    })
+    if name:
+        entry["name"] = name
+    return entry
+
+
+def _bump(counter: dict, key: str, delta: int):
+    value = counter.get(key, 0) + delta
+    if value:
+        counter[key] = value
+    else:
+        counter.pop(key, None)
+
+
+def add_suggestions(rollups: dict, records: list[dict], delta: int = 1):
+    """Count (delta=1) or uncount (delta=-1) submitted suggestion records."""
+    for r in records:
+        _author(rollups, r["author_id"], r["author_name"])["suggestions"] += delta
+        _bump(rollups["per_day"], r["submitted_at"][:10], delta)
+
+
+def add_poll_options(rollups: dict, counts: list[int], delta: int = 1):
+    """Register (or drop) daily poll options with their current counts."""
+    for c in counts:
+        _bump(rollups["vote_hist"], str(c), delta)
+
+
+def apply_vote_changes(rollups: dict, changes: list[tuple]):
+    """Apply (author_id, old_count, new_count) changes of daily poll options.
+
+    author_id may be None when the suggestion no longer exists; only the
+    histogram is updated then.
+    """
+    for author_id, old, new in changes:
+        if old == new:
+            continue
+        _bump(rollups["vote_hist"], str(old), -1)
+        _bump(rollups["vote_hist"], str(new), 1)
+        if author_id is not None:
+            _author(rollups, author_id)["votes"] += new - old
+
+
+def add_final(rollups: dict, top: list[dict]):
+    """Count an appearance in a weekly final for every author in *top*."""
+    for entry in top:
+        _author(rollups, entry["author_id"], entry["author_name"])["finals"] += 1
+
+
+def add_win(rollups: dict, entry: dict):
+    _author(rollups, entry["author_id"], entry["author_name"])["wins"] += 1
+
+
+def reset_votes(rollups: dict):
+    """Forget everything derived from polls; keep suggestion counts."""
+    rollups["vote_hist"] = {}
+    for a in rollups["authors"].values():
+        a["votes"] = a["finals"] = a["wins"] = 0
+
+
+# ---------------------------------------------------------------------------
+# Rendering
+# ---------------------------------------------------------------------------
+
+def _bar(value: int, peak: int, width: int = 12) -> str:
+    if peak <= 0:
+        return ""
+    return "▇" * max(1, round(value / peak * width)) if value else ""
+
+
+def format_stats(rollups: dict, today: datetime, days: int = 14,
+                 top_authors: int = 10) -> str | None:
+    """Render the /stats message from the rollup document alone.
+
+    *today* must be a UTC time: the per-day buckets are UTC dates.
+    """
+    authors = rollups["authors"].values()
+    if not authors:
+        return None
+
+    sections = []
+
+    leaders = sorted(authors, key=lambda a: (-a["votes"], -a["suggestions"]))
+    lines = ["🏆 Авторы (голоса · предложения · победы/финалы):"]
+    for i, a in enumerate(leaders[:top_authors], 1):
+        rate = f"{a['wins'] / a['finals']:.0%}" if a["finals"] else "—"
+        lines.append(f"{i}. {a['name']} — {a['votes']} гол. · {a['suggestions']} · "
+                     f"{a['wins']}/{a['finals']} ({rate})")
+    sections.append("\n".join(lines))
+
+    per_day = rollups["per_day"]
+    dates = [(today - timedelta(days=d)).strftime("%Y-%m-%d")
+             for d in range(days - 1, -1, -1)]
+    counts = [per_day.get(d, 0) for d in dates]
+    peak = max(counts)
+    lines = [f"📅 Предложения за {days} дн. (по UTC):"]
+    for d, c in zip(dates, counts):
+        lines.append(f"{d[5:]} {c:>3} {_bar(c, peak)}")
+    sections.append("\n".join(lines))
+
+    hist = {int(k): v for k, v in rollups["vote_hist"].items()}
+    if hist:
+        peak = max(hist.values())
+        lines = ["🗳️ Распределение голосов (голосов → вариантов):"]
+        for votes in sorted(hist):
+            lines.append(f"{votes:>3} → {hist[votes]:>4} {_bar(hist[votes], peak)}")
+        sections.append("\n".join(lines))
+
+    return "\n\n".join(sections)
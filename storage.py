@@ -1,108 +1,611 @@
 """Atomic JSON storage helpers and data queries."""
 
+import fcntl
+import functools
 import json
+import logging
 import os
+import threading
 import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timezone
 
+import clock
+import lifecycle
+import stats
+from models import Poll, Suggestion, dt_to_us
+from lifecycle import LifecycleIndex
+from textindex import TokenIndex, TrigramIndex
+from tracing import traced
 
-SUGGESTIONS_FILE = "data/suggestions.json"
-POLL_RESULTS_FILE = "data/poll_results.json"
-WEEKLY_RESULTS_FILE = "data/weekly_results.json"
-SUBSCRIBERS_FILE = "data/subscribers.json"
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_DIR = "data"
+
+# File names inside a namespace's data directory
+SUGGESTIONS_FILE = "suggestions.json"
+POLL_RESULTS_FILE = "poll_results.json"
+WEEKLY_RESULTS_FILE = "weekly_results.json"
+SUBSCRIBERS_FILE = "subscribers.json"
+STATS_FILE = "stats.json"
+TRIGRAM_FILE = "trigrams.json"
+SEARCH_INDEX_FILE = "search_index.json"
+LIFECYCLE_FILE = "lifecycle.json"
+LOCK_FILE = ".lock"
+JOURNAL_FILE = "journal.json"
+META_FILE = "meta.json"
+# Bot-wide (not per chat), kept in DEFAULT_DATA_DIR
+UPDATE_OFFSET_FILE = "update_offset.json"
+
+_LIST_FILES = (SUGGESTIONS_FILE, WEEKLY_RESULTS_FILE, SUBSCRIBERS_FILE)
+# Rebuilt from the data files when missing, so commits do not journal them
+_DERIVED_FILES = (STATS_FILE, TRIGRAM_FILE, SEARCH_INDEX_FILE, LIFECYCLE_FILE)
+
+# Data directory of the chat (tenant) served by the current task
+_data_dir: ContextVar[str] = ContextVar("data_dir", default=DEFAULT_DATA_DIR)
+
+# Writes staged by the open transaction: path -> (data, cached model or None)
+_pending: ContextVar[dict | None] = ContextVar("pending_writes", default=None)
+
+# Vote changes of the open transaction, rolled up into stats.json once at its end
+_vote_rollup: ContextVar[list | None] = ContextVar("vote_rollup", default=None)
+
+# Bytes written to data files (and the journal) by this process
+bytes_written = 0
+
+
+# ---------------------------------------------------------------------------
+# Namespaces
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def namespace(data_dir: str):
+    """Route every storage call inside the block to *data_dir*."""
+    token = _data_dir.set(data_dir)
+    try:
+        yield
+    finally:
+        _data_dir.reset(token)
+
+
+def current_namespace() -> str:
+    return _data_dir.get()
+
+
+def _p(name: str) -> str:
+    """Path of data file *name* in the current namespace."""
+    return os.path.join(_data_dir.get(), name)
+
+
+# ---------------------------------------------------------------------------
+# Cross-process write lock
+# ---------------------------------------------------------------------------
+
+# data_dir -> [RLock, flock'ed file or None, depth]
+_locks: dict[str, list] = {}
+_locks_guard = threading.Lock()
+
+
+@contextmanager
+def locked():
+    """Hold the current namespace's write lock (reentrant).
+
+    Several worker processes may share a data directory, so every
+    read-modify-write runs under an flock on data_dir/.lock in addition to
+    an in-process RLock. Waiting for it blocks the calling thread: async
+    code runs writers through asyncio.to_thread, so another worker's commit
+    or a backup never stalls the event loop.
+    """
+    data_dir = _data_dir.get()
+    with _locks_guard:
+        entry = _locks.setdefault(data_dir, [threading.RLock(), None, 0])
+    with entry[0]:
+        if entry[2] == 0:
+            os.makedirs(data_dir, exist_ok=True)
+            f = open(os.path.join(data_dir, LOCK_FILE), "a")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            entry[1] = f
+            _recover(data_dir)
+        entry[2] += 1
+        try:
+            yield
+        finally:
+            entry[2] -= 1
+            if entry[2] == 0:
+                fcntl.flock(entry[1], fcntl.LOCK_UN)
+                entry[1].close()
+                entry[1] = None
+
+
+def _exclusive(func):
+    """Run *func* as one transaction() (and so under locked())."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with transaction():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+# ---------------------------------------------------------------------------
+# Transactions and the write-ahead journal
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def transaction():
+    """Commit every save_json() in the block together, or none of them.
+
+    Writes are staged in memory and serialized once, when the block exits;
+    an exception discards them. Reads inside the block see staged data
+    (load_json returns the staged object itself, so only mutate what you
+    save again). A commit touching several files first writes one entry to
+    data_dir/journal.json with a single fsync: the full text of the data
+    files when there are several, and only the names of the derived
+    indexes (stats, trigrams, search, lifecycle). It then replaces the
+    files and empties the journal. If the process dies in between, the
+    next lock holder replays the data files and deletes the listed
+    indexes, which are rebuilt from the data on next use, so the files
+    never disagree. Data files and the directory are fsynced before the
+    journal is emptied, so this also holds after a power loss. A nested
+    transaction joins the outer one. Only write to the current namespace
+    inside a transaction, and never await in it. Vote changes recorded in
+    the block update the rollups once, just before the commit.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    with locked():
+        writes: dict = {}
+        token = _pending.set(writes)
+        rollup_token = _vote_rollup.set([])
+        try:
+            yield
+            _flush_vote_rollup()
+        except BaseException:
+            _evict(writes)
+            raise
+        finally:
+            _vote_rollup.reset(rollup_token)
+            _pending.reset(token)
+        try:
+            _commit(writes)
+        except BaseException:
+            _evict(writes)
+            raise
+
+
+def _evict(writes: dict):
+    """Forget cached models of a transaction that did not commit."""
+    for path in writes:
+        _model_cache.pop(path, None)
+
+
+def in_transaction() -> bool:
+    return _pending.get() is not None
+
+
+def _write_file(path: str, text: str, sync: bool = False):
+    global bytes_written
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        bytes_written += f.tell()
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _fsync_dir(directory: str):
+    """Make renames and new files in *directory* durable."""
+    fd = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _is_derived(path: str) -> bool:
+    return os.path.basename(path) in _DERIVED_FILES
+
+
+def _apply_journaled(texts: dict, journal: str):
+    """Replace the files of a journaled commit, then empty the journal.
+
+    Only data files are fsynced; a derived index lost to a power loss is
+    either missing or still listed in a journal and so gets rebuilt.
+    """
+    for path, text in texts.items():
+        _write_file(path, text, sync=not _is_derived(path))
+    # The new files must be on disk before the journal stops covering them
+    for directory in {os.path.dirname(path) for path in texts}:
+        _fsync_dir(directory)
+    os.truncate(journal, 0)
+
+
+@traced()
+def _commit(writes: dict):
+    global bytes_written
+    if not writes:
+        return
+    texts = {path: json.dumps(data, ensure_ascii=False, indent=2)
+             for path, (data, _) in writes.items()}
+    if len(texts) > 1:
+        data_texts = {p: t for p, t in texts.items() if not _is_derived(p)}
+        entry = {
+            # A single data file is replaced atomically on its own
+            "files": data_texts if len(data_texts) > 1 else {},
+            "derived": [p for p in texts if _is_derived(p)],
+        }
+        journal = _p(JOURNAL_FILE)
+        created = not os.path.exists(journal)
+        with open(journal, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+            bytes_written += f.tell()
+        if created:
+            _fsync_dir(os.path.dirname(journal))
+        _apply_journaled(texts, journal)
+    else:
+        for path, text in texts.items():
+            _write_file(path, text)
+    for path, (_, value) in writes.items():
+        if value is not None:
+            _model_cache[path] = (_file_stamp(path), value)
+        else:
+            _model_cache.pop(path, None)
+
+
+def recover(data_dirs):
+    """Finish commits left half-applied in *data_dirs*.
+
+    Writers do this whenever they take the lock; call it at startup too, so
+    lock-free readers never see the files of a half-applied commit.
+    """
+    for data_dir in dict.fromkeys(data_dirs):
+        if os.path.isdir(data_dir):
+            with namespace(data_dir), locked():
+                pass
+
+
+def _recover(data_dir: str):
+    """Finish a commit that a crashed process left in *data_dir*'s journal."""
+    journal = os.path.join(data_dir, JOURNAL_FILE)
+    try:
+        if os.path.getsize(journal) == 0:
+            return
+        with open(journal, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return
+    except ValueError:
+        # Torn journal write: that commit never started applying
+        entry = {}
+    if "files" not in entry:
+        # Written by an older version: every file in full
+        entry = {"files": entry, "derived": []}
+    for path in entry["derived"]:
+        _model_cache.pop(path, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    for path in entry["files"]:
+        _model_cache.pop(path, None)
+    _apply_journaled(entry["files"], journal)
+    logger.warning("Журнал %s воспроизведён: файлов %d, индексов к перестройке %d.",
+                   journal, len(entry["files"]), len(entry["derived"]))
 
 
 # ---------------------------------------------------------------------------
 # Low-level I/O
 # ---------------------------------------------------------------------------
 
+@traced()
 def load_json(path: str):
     """Load JSON from *path*, returning [] or {} if file is missing."""
+    pending = _pending.get()
+    if pending and path in pending:
+        return pending[path][0]
     if not os.path.exists(path):
-        return [] if path in (SUGGESTIONS_FILE, WEEKLY_RESULTS_FILE, SUBSCRIBERS_FILE) else {}
+        return [] if os.path.basename(path) in _LIST_FILES else {}
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
-def save_json(path: str, data):
-    """Atomically write *data* as JSON to *path*."""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, path)
+@traced()
+def save_json(path: str, data, _value=None):
+    """Atomically write *data* as JSON to *path* (staged inside a transaction)."""
+    pending = _pending.get()
+    if pending is not None:
+        pending[path] = (data, _value)
+        return
+    _write_file(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+
+def iter_json(path: str, chunk_size: int = 1 << 16):
+    """Yield the items of the JSON array (or (key, value) pairs of the object) in *path*.
+
+    The file is decoded one element at a time, so memory stays bounded by
+    the largest element instead of the whole file. Staged writes of the
+    open transaction are seen as with load_json.
+    """
+    pending = _pending.get()
+    if pending and path in pending:
+        data = pending[path][0]
+        yield from data.items() if isinstance(data, dict) else data
+        return
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+        return not eof
+
+    def skip(chars: str) -> str:
+        """Skip whitespace and *chars*; return the next character ("" at the end)."""
+        nonlocal pos
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] in chars):
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not more():
+                return ""
+
+    def value():
+        nonlocal pos
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if not more():
+                    raise
+                continue
+            # A number cut at the edge of the buffer ("1.5e" of "1.5e10") may
+            # go on in the next chunk: only trust it once a delimiter follows
+            if (end == len(buf) or not (buf[end].isspace() or buf[end] in ",:]}")) \
+                    and not eof and more():
+                continue
+            pos = end
+            return item
+
+    with f:
+        opening = skip("")
+        if not opening:
+            return
+        if opening not in "[{":
+            raise ValueError(f"{path}: not a JSON array or object")
+        pos += 1
+        while True:
+            c = skip(",")
+            if c in ("]", "}"):
+                return
+            if not c:
+                raise ValueError(f"{path}: truncated JSON")
+            if opening == "{":
+                key = value()
+                skip(":")
+                yield key, value()
+            else:
+                yield value()
+
+
+def _exists(path: str) -> bool:
+    pending = _pending.get()
+    return bool(pending and path in pending) or os.path.exists(path)
+
+
+def _file_stamp(path: str):
+    """Return (mtime_ns, size, inode, device) for *path*, or None if it does not exist.
+
+    Every write replaces the file, so the inode changes even when a rewrite
+    keeps the size within the mtime granularity (a vote count going 3 -> 4).
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino, st.st_dev
+
+
+_model_cache: dict[str, tuple] = {}
+
+
+def _cached(path: str, build):
+    """Return build(load_json(path)), re-running it only when the file changes."""
+    pending = _pending.get()
+    if pending and path in pending:
+        value = pending[path][1]
+        return value if value is not None else build(load_json(path))
+    stamp = _file_stamp(path)
+    hit = _model_cache.get(path)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+    value = build(load_json(path))
+    _model_cache[path] = (stamp, value)
+    return value
+
+
+def _store_cached(path: str, value, data):
+    """save_json(path, data) and remember *value* as the cached model for it."""
+    save_json(path, data, _value=value)
+    if not in_transaction():
+        _model_cache[path] = (_file_stamp(path), value)
+
+
+def _update_index(path: str, load, rebuild, apply):
+    """Apply an incremental change to a derived index file.
+
+    The change is made to a copy of the cached index, so neither a rollback
+    nor a concurrent reader ever sees it before the commit. If the index
+    does not exist yet it is rebuilt instead; the rebuild reads the data
+    files that were just saved, so it already includes the change.
+    """
+    if not _exists(path):
+        rebuild()
+        return
+    index = load().copy()
+    apply(index)
+    _store_cached(path, index, index.to_dict())
+
+
+def _build_suggestions(raw: list) -> dict[str, Suggestion]:
+    return {d["id"]: Suggestion.from_dict(d) for d in raw}
+
+
+def _build_polls(raw: dict) -> dict[str, Poll]:
+    return {pid: Poll.from_dict(pid, d) for pid, d in raw.items()}
+
+
+@traced()
+def get_suggestion_models() -> dict[str, Suggestion]:
+    """Return {suggestion_id: Suggestion} in submission order. Do not mutate."""
+    return _cached(_p(SUGGESTIONS_FILE), _build_suggestions)
+
+
+@traced()
+def get_poll_models() -> dict[str, Poll]:
+    """Return {telegram_poll_id: Poll} for every poll. Do not mutate."""
+    return _cached(_p(POLL_RESULTS_FILE), _build_polls)
+
+
+def iter_suggestions():
+    """Yield every Suggestion, read from disk one at a time (nothing is cached)."""
+    for d in iter_json(_p(SUGGESTIONS_FILE)):
+        yield Suggestion.from_dict(d)
+
+
+def iter_polls():
+    """Yield (telegram_poll_id, Poll) pairs, read from disk one at a time."""
+    for pid, d in iter_json(_p(POLL_RESULTS_FILE)):
+        yield pid, Poll.from_dict(pid, d)
 
 
 # ---------------------------------------------------------------------------
 # Suggestions
 # ---------------------------------------------------------------------------
 
-def add_suggestion(name: str, author_id: int, author_name: str):
-    """Add a suggestion. Returns the new record, or None if duplicate."""
-    suggestions = load_json(SUGGESTIONS_FILE)
-    normalized = name.strip().lower()
-    for s in suggestions:
-        if s["name"].strip().lower() == normalized:
-            return None
-    record = {
+def _new_suggestion(name: str, author_id: int, author_name: str) -> dict:
+    return {
         "id": str(uuid.uuid4()),
         "name": name.strip(),
         "author_id": author_id,
         "author_name": author_name,
-        "submitted_at": datetime.now(timezone.utc).isoformat(),
+        "submitted_at": clock.now(timezone.utc).isoformat(),
         "used_in_daily": False,
     }
+
+
+@traced()
+@_exclusive
+def add_suggestion(name: str, author_id: int, author_name: str):
+    """Add a suggestion. Returns the new record, or None if duplicate."""
+    suggestions = load_json(_p(SUGGESTIONS_FILE))
+    normalized = name.strip().lower()
+    for s in suggestions:
+        if s["name"].strip().lower() == normalized:
+            return None
+    record = _new_suggestion(name, author_id, author_name)
     suggestions.append(record)
-    save_json(SUGGESTIONS_FILE, suggestions)
+    save_json(_p(SUGGESTIONS_FILE), suggestions)
+    _update_stats(stats.add_suggestions, [record])
+    _index_added([record])
     return record
 
 
+@traced()
+@_exclusive
+def add_suggestions(batch: list[tuple[str, int, str]]) -> list:
+    """Add many (name, author_id, author_name) suggestions with a single write.
+
+    Duplicates (against stored names and within the batch) are skipped.
+    Returns the records that were actually added.
+    """
+    suggestions = load_json(_p(SUGGESTIONS_FILE))
+    seen = {s["name"].strip().lower() for s in suggestions}
+    added = []
+    for name, author_id, author_name in batch:
+        normalized = name.strip().lower()
+        if not normalized or normalized in seen:
+            continue
+        seen.add(normalized)
+        added.append(_new_suggestion(name, author_id, author_name))
+    if added:
+        suggestions.extend(added)
+        save_json(_p(SUGGESTIONS_FILE), suggestions)
+        _update_stats(stats.add_suggestions, added)
+        _index_added(added)
+    return added
+
+
+@traced()
 def get_unused_suggestions() -> list:
     """Return suggestions that haven't been included in a daily poll yet."""
-    suggestions = load_json(SUGGESTIONS_FILE)
-    return [s for s in suggestions if not s["used_in_daily"]]
+    suggestions = get_suggestion_models()
+    return [suggestions[sid].to_dict()
+            for sid in _lifecycle_index().ids(lifecycle.PENDING) if sid in suggestions]
 
 
+@traced()
+@_exclusive
 def mark_suggestions_used(ids: list[str]):
     """Flag suggestions by id as used in a daily poll."""
     id_set = set(ids)
-    suggestions = load_json(SUGGESTIONS_FILE)
+    suggestions = load_json(_p(SUGGESTIONS_FILE))
     for s in suggestions:
         if s["id"] in id_set:
             s["used_in_daily"] = True
-    save_json(SUGGESTIONS_FILE, suggestions)
+    save_json(_p(SUGGESTIONS_FILE), suggestions)
+    _update_lifecycle(lambda index: index.mark_used(ids))
 
 
+@traced()
+@_exclusive
 def reset_all_votes():
     """Clear all poll results and mark every suggestion as unused."""
-    save_json(POLL_RESULTS_FILE, {})
-    save_json(WEEKLY_RESULTS_FILE, [])
-    suggestions = load_json(SUGGESTIONS_FILE)
+    save_json(_p(POLL_RESULTS_FILE), {})
+    save_json(_p(WEEKLY_RESULTS_FILE), [])
+    suggestions = load_json(_p(SUGGESTIONS_FILE))
     for s in suggestions:
         s["used_in_daily"] = False
-    save_json(SUGGESTIONS_FILE, suggestions)
+    save_json(_p(SUGGESTIONS_FILE), suggestions)
+    _update_stats(stats.reset_votes)
+    _update_index(_p(SEARCH_INDEX_FILE), _search_index, _rebuild_search_index,
+                  TokenIndex.reset_polled)
+    _rebuild_lifecycle()
 
 
+@traced()
 def get_all_suggestions() -> list:
     """Return every suggestion ever submitted."""
-    return load_json(SUGGESTIONS_FILE)
+    return load_json(_p(SUGGESTIONS_FILE))
 
 
+@traced()
 def get_suggestion_by_id(suggestion_id: str):
     """Look up a single suggestion by its UUID."""
-    for s in load_json(SUGGESTIONS_FILE):
-        if s["id"] == suggestion_id:
-            return s
-    return None
+    model = get_suggestion_models().get(suggestion_id)
+    return model.to_dict() if model else None
 
 
+@traced()
+@_exclusive
 def delete_suggestion(index: int) -> dict | None:
     """Delete an unused suggestion by 1-based index. Returns the removed record, or None."""
-    unused = [s for s in load_json(SUGGESTIONS_FILE) if not s["used_in_daily"]]
-    if index < 1 or index > len(unused):
+    target_id = _lifecycle_index().nth(lifecycle.PENDING, index)
+    if target_id is None:
         return None
-    target_id = unused[index - 1]["id"]
-    suggestions = load_json(SUGGESTIONS_FILE)
+    suggestions = load_json(_p(SUGGESTIONS_FILE))
     removed = None
     new_list = []
     for s in suggestions:
@@ -110,170 +613,798 @@ def delete_suggestion(index: int) -> dict | None:
             removed = s
         else:
             new_list.append(s)
-    save_json(SUGGESTIONS_FILE, new_list)
+    save_json(_p(SUGGESTIONS_FILE), new_list)
+    if removed:
+        _update_stats(stats.add_suggestions, [removed], -1)
+        _index_removed([removed["id"]])
     return removed
 
 
+# ---------------------------------------------------------------------------
+# Near-duplicate detection
+# ---------------------------------------------------------------------------
+
+def _build_trigrams() -> TrigramIndex:
+    index = TrigramIndex()
+    for s in get_suggestion_models().values():
+        index.add(s.id, s.name)
+    return index
+
+
+@_exclusive
+def _rebuild_trigrams() -> TrigramIndex:
+    index = _build_trigrams()
+    _store_cached(_p(TRIGRAM_FILE), index, index.to_dict())
+    return index
+
+
+def _trigram_index() -> TrigramIndex:
+    return _derived_index(TRIGRAM_FILE, TrigramIndex.from_dict,
+                          _build_trigrams, _rebuild_trigrams)
+
+
+def _index_added(records: list[dict]):
+    def add(index):
+        for r in records:
+            index.add(r["id"], r["name"])
+    _update_index(_p(TRIGRAM_FILE), _trigram_index, _rebuild_trigrams, add)
+    _update_index(_p(SEARCH_INDEX_FILE), _search_index, _rebuild_search_index, add)
+    _update_lifecycle(add)
+
+
+def _index_removed(sids: list[str]):
+    def remove(index):
+        for sid in sids:
+            index.remove(sid)
+    _update_index(_p(TRIGRAM_FILE), _trigram_index, _rebuild_trigrams, remove)
+    _update_index(_p(SEARCH_INDEX_FILE), _search_index, _rebuild_search_index, remove)
+    _update_lifecycle(remove)
+
+
+@traced()
+def find_similar_suggestions(name: str, threshold: float = 0.7) -> list:
+    """Return [(suggestion_name, similarity)] of stored names close to *name*."""
+    suggestions = get_suggestion_models()
+    return [
+        (suggestions[sid].name, score)
+        for sid, score in _trigram_index().similar(name, threshold)
+        if sid in suggestions
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Derived indexes
+# ---------------------------------------------------------------------------
+
+# (data_dir, file name) -> (data file stamps, index) built by readers while
+# the index file is missing
+_unsaved_indexes: dict[tuple, tuple] = {}
+
+
+def _derived_index(name: str, from_dict, build, rebuild):
+    """Derived index *name*, loaded from its file; built from the data if missing.
+
+    Only writers (inside a transaction) save a rebuild. A reader builds it
+    in memory, so reading never takes the write lock; the next write that
+    touches the index saves it.
+    """
+    if _exists(_p(name)):
+        return _cached(_p(name), from_dict)
+    if in_transaction():
+        return rebuild()
+    key = (current_namespace(), name)
+    stamps = data_version()
+    hit = _unsaved_indexes.get(key)
+    if hit is None or hit[0] != stamps:
+        hit = _unsaved_indexes[key] = (stamps, build())
+    return hit[1]
+
+
+# ---------------------------------------------------------------------------
+# Suggestion lifecycle
+# ---------------------------------------------------------------------------
+
+def _build_lifecycle() -> LifecycleIndex:
+    index = LifecycleIndex()
+    suggestions = get_suggestion_models()
+    for sid in suggestions:
+        index.add(sid)
+    for pid, poll in get_poll_models().items():
+        if not poll.closed:
+            index.poll_opened(pid, [o.suggestion_id for o in poll.options if o.suggestion_id])
+    index.mark_used([s.id for s in suggestions.values() if s.used_in_daily])
+    return index
+
+
+@_exclusive
+def _rebuild_lifecycle() -> LifecycleIndex:
+    index = _build_lifecycle()
+    _store_cached(_p(LIFECYCLE_FILE), index, index.to_dict())
+    return index
+
+
+def _lifecycle_index() -> LifecycleIndex:
+    return _derived_index(LIFECYCLE_FILE, LifecycleIndex.from_dict,
+                          _build_lifecycle, _rebuild_lifecycle)
+
+
+def _update_lifecycle(apply):
+    # _update_index changes a copy, so published snapshots keep their index
+    _update_index(_p(LIFECYCLE_FILE), _lifecycle_index, _rebuild_lifecycle, apply)
+
+
+# ---------------------------------------------------------------------------
+# Search
+# ---------------------------------------------------------------------------
+
+def _build_search_index() -> TokenIndex:
+    index = TokenIndex()
+    for s in get_suggestion_models().values():
+        index.add(s.id, s.name)
+    daily = [p for p in get_poll_models().values() if p.type == "daily"]
+    daily.sort(key=lambda p: p.created_at_us)
+    for poll in daily:
+        for opt in poll.options:
+            if opt.suggestion_id:
+                index.mark_polled(opt.suggestion_id, poll.created_at)
+    return index
+
+
+@_exclusive
+def _rebuild_search_index() -> TokenIndex:
+    index = _build_search_index()
+    _store_cached(_p(SEARCH_INDEX_FILE), index, index.to_dict())
+    return index
+
+
+def _search_index() -> TokenIndex:
+    return _derived_index(SEARCH_INDEX_FILE, TokenIndex.from_dict,
+                          _build_search_index, _rebuild_search_index)
+
+
+@traced()
+def search_suggestions(query: str) -> list[dict]:
+    """Find suggestions whose words start with every word of *query*.
+
+    Returns [{"name", "votes", "polled_at"}] sorted by votes, best first.
+    Votes come from the current read snapshot, so voting never rewrites
+    the index.
+    """
+    scores = snapshot().daily_scores
+    hits = [{**doc, "votes": scores.get(sid, 0)}
+            for sid, doc in _search_index().search(query)]
+    hits.sort(key=lambda d: (-d["votes"], d["name"].lower()))
+    return hits
+
+
 # ---------------------------------------------------------------------------
 # Poll results
 # ---------------------------------------------------------------------------
 
+@traced()
+@_exclusive
 def save_poll(telegram_poll_id: str, message_id: int, options: list,
               poll_type: str):
     """Register a new poll (daily or weekly)."""
-    results = load_json(POLL_RESULTS_FILE)
+    results = load_json(_p(POLL_RESULTS_FILE))
+    created_at = clock.now(timezone.utc).isoformat()
     results[telegram_poll_id] = {
         "message_id": message_id,
         "options": options,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": created_at,
         "type": poll_type,
         "closed": False,
     }
-    save_json(POLL_RESULTS_FILE, results)
+    save_json(_p(POLL_RESULTS_FILE), results)
+    if poll_type == "daily":
+        _update_stats(stats.add_poll_options,
+                      [o.get("voter_count", 0) for o in options])
+
+        def mark(index):
+            for o in options:
+                if o.get("suggestion_id"):
+                    index.mark_polled(o["suggestion_id"], created_at)
+        _update_index(_p(SEARCH_INDEX_FILE), _search_index, _rebuild_search_index, mark)
+    sids = [o["suggestion_id"] for o in options if o.get("suggestion_id")]
+    _update_lifecycle(lambda index: index.poll_opened(telegram_poll_id, sids))
 
 
+@traced()
 def update_poll_voter_counts(telegram_poll_id: str, option_ids: list[int],
                               delta: int):
     """Increment/decrement voter_count for the given option indices."""
-    results = load_json(POLL_RESULTS_FILE)
+    add_poll_votes(telegram_poll_id, {idx: delta for idx in option_ids})
+
+
+@traced()
+@_exclusive
+def add_poll_votes(telegram_poll_id: str, deltas: dict[int, int]):
+    """Apply {option_index: delta} voter_count changes with a single write.
+
+    Closed polls are left alone: their final counts are already stored.
+    """
+    results = load_json(_p(POLL_RESULTS_FILE))
     poll = results.get(telegram_poll_id)
-    if not poll:
+    if not poll or poll.get("closed"):
         return
-    for idx in option_ids:
-        if 0 <= idx < len(poll["options"]):
+    before = _option_counts(poll)
+    for idx, delta in deltas.items():
+        if 0 <= idx < len(poll["options"]) and delta:
             poll["options"][idx]["voter_count"] = (
                 poll["options"][idx].get("voter_count", 0) + delta
             )
-    save_json(POLL_RESULTS_FILE, results)
+    save_json(_p(POLL_RESULTS_FILE), results)
+    _record_vote_changes(poll, before)
+
 
+@traced()
+@_exclusive
+def set_poll_option_counts(telegram_poll_id: str, counts: list[int],
+                           total_voters: int | None = None, live: bool = False):
+    """Set absolute voter_count for each option (from Poll update).
 
-def set_poll_option_counts(telegram_poll_id: str, counts: list[int]):
-    """Set absolute voter_count for each option (from Poll update)."""
-    results = load_json(POLL_RESULTS_FILE)
+    *total_voters* is the poll's unique voter count, used for turnout-based
+    ranking; it is stored when known. Queued live votes of the poll are
+    dropped: the absolute counts already include them. *live* counts come
+    from an open poll and are ignored once the poll is closed, so a late
+    write never replaces the final counts.
+    """
+    if not live:
+        _discard_queued_votes(telegram_poll_id)
+    results = load_json(_p(POLL_RESULTS_FILE))
     poll = results.get(telegram_poll_id)
-    if not poll:
+    if not poll or (live and poll.get("closed")):
         return
+    before = _option_counts(poll)
     for i, count in enumerate(counts):
         if i < len(poll["options"]):
             poll["options"][i]["voter_count"] = count
-    save_json(POLL_RESULTS_FILE, results)
+    if total_voters is not None:
+        poll["total_voters"] = total_voters
+    save_json(_p(POLL_RESULTS_FILE), results)
+    _record_vote_changes(poll, before)
 
 
+@traced()
+@_exclusive
 def close_poll(telegram_poll_id: str):
     """Mark a poll as closed."""
-    results = load_json(POLL_RESULTS_FILE)
+    results = load_json(_p(POLL_RESULTS_FILE))
     if telegram_poll_id in results:
         results[telegram_poll_id]["closed"] = True
-        save_json(POLL_RESULTS_FILE, results)
+        save_json(_p(POLL_RESULTS_FILE), results)
+        _update_lifecycle(lambda index: index.poll_closed(telegram_poll_id))
 
 
-def get_daily_scores_since(since_dt: datetime) -> dict:
-    """Aggregate votes per suggestion_id from daily polls since *since_dt*.
+# ---------------------------------------------------------------------------
+# Live vote queue
+# ---------------------------------------------------------------------------
 
-    Returns {suggestion_id: total_votes}.
+# data_dir -> poll id -> {option_index: delta}, written by flush_poll_votes()
+_vote_queue: dict[str, dict[str, dict[int, int]]] = {}
+# data_dir -> poll id -> (counts, total_voters) from the latest Poll update
+_count_queue: dict[str, dict[str, tuple]] = {}
+_vote_guard = threading.Lock()
+
+
+def queue_poll_votes(telegram_poll_id: str, deltas: dict[int, int]):
+    """Queue {option_index: delta} changes for the next flush_poll_votes().
+
+    Live votes arrive one PollAnswer at a time; queueing them turns a burst
+    of votes into one commit per chat instead of one commit per vote. While
+    absolute counts of the poll are queued the deltas are dropped: the next
+    Poll update carries them too.
+    """
+    with _vote_guard:
+        ns = current_namespace()
+        if telegram_poll_id in _count_queue.get(ns, {}):
+            return
+        poll = _vote_queue.setdefault(ns, {}).setdefault(telegram_poll_id, {})
+        for idx, delta in deltas.items():
+            poll[idx] = poll.get(idx, 0) + delta
+
+
+def queue_poll_counts(telegram_poll_id: str, counts: list[int],
+                      total_voters: int | None = None):
+    """Queue the absolute counts of an open poll for the next flush_poll_votes().
+
+    Telegram sends PollAnswer only for non-anonymous polls, but a Poll
+    update with the new counts on every change of a poll the bot sent, so
+    anonymous polls are counted live through this. Only the latest counts
+    of a poll are kept, and they replace its queued deltas.
+    """
+    with _vote_guard:
+        ns = current_namespace()
+        _count_queue.setdefault(ns, {})[telegram_poll_id] = (list(counts), total_voters)
+        _vote_queue.get(ns, {}).pop(telegram_poll_id, None)
+
+
+def _discard_queued_votes(telegram_poll_id: str):
+    with _vote_guard:
+        _vote_queue.get(current_namespace(), {}).pop(telegram_poll_id, None)
+        _count_queue.get(current_namespace(), {}).pop(telegram_poll_id, None)
+
+
+def queued_votes() -> int:
+    """Number of polls with queued, not yet written votes."""
+    with _vote_guard:
+        return (sum(len(polls) for polls in _vote_queue.values())
+                + sum(len(polls) for polls in _count_queue.values()))
+
+
+@traced()
+def flush_poll_votes() -> int:
+    """Write every queued vote, one transaction per namespace. Returns the polls written.
+
+    A namespace whose commit fails keeps its votes for the next flush.
     """
-    results = load_json(POLL_RESULTS_FILE)
+    with _vote_guard:
+        queued = dict(_vote_queue)
+        counted = dict(_count_queue)
+        _vote_queue.clear()
+        _count_queue.clear()
+    written = 0
+    for ns in queued.keys() | counted.keys():
+        polls = {pid: deltas for pid, deltas in queued.get(ns, {}).items()
+                 if any(deltas.values())}
+        counts = counted.get(ns, {})
+        if not polls and not counts:
+            continue
+        try:
+            with namespace(ns), transaction():
+                for pid, (option_counts, total) in counts.items():
+                    set_poll_option_counts(pid, option_counts, total, live=True)
+                for pid, deltas in polls.items():
+                    add_poll_votes(pid, deltas)
+        except Exception:
+            logger.exception("Голоса для %s не записаны, повторю позже.", ns)
+            with _vote_guard:
+                recount = _count_queue.setdefault(ns, {})
+                for pid, entry in counts.items():
+                    recount.setdefault(pid, entry)
+                requeue = _vote_queue.setdefault(ns, {})
+                for pid, deltas in polls.items():
+                    if pid in recount:
+                        continue
+                    merged = requeue.setdefault(pid, {})
+                    for idx, delta in deltas.items():
+                        merged[idx] = merged.get(idx, 0) + delta
+            continue
+        written += len(polls) + len(counts)
+    return written
+
+
+def _sum_daily_scores(polls: dict[str, Poll], since_us: int | None) -> dict:
     scores: dict[str, int] = {}
-    for poll in results.values():
-        if poll["type"] != "daily":
+    for poll in polls.values():
+        if poll.type != "daily":
             continue
-        created = datetime.fromisoformat(poll["created_at"])
-        if created < since_dt:
+        if since_us is not None and poll.created_at_us < since_us:
             continue
-        for opt in poll["options"]:
-            sid = opt.get("suggestion_id")
+        for opt in poll.options:
+            sid = opt.suggestion_id
             if sid:
-                scores[sid] = scores.get(sid, 0) + opt.get("voter_count", 0)
+                scores[sid] = scores.get(sid, 0) + opt.voter_count
     return scores
 
 
+@traced()
+def get_daily_scores_since(since_dt: datetime) -> dict:
+    """Aggregate votes per suggestion_id from daily polls since *since_dt*.
+
+    Returns {suggestion_id: total_votes}.
+    """
+    return _sum_daily_scores(get_poll_models(), dt_to_us(since_dt))
+
+
+@traced()
 def get_all_daily_scores() -> dict:
     """Aggregate votes per suggestion_id from ALL daily polls.
 
     Returns {suggestion_id: total_votes}.
     """
-    results = load_json(POLL_RESULTS_FILE)
-    scores: dict[str, int] = {}
-    for poll in results.values():
-        if poll["type"] != "daily":
-            continue
-        for opt in poll["options"]:
-            sid = opt.get("suggestion_id")
-            if sid:
-                scores[sid] = scores.get(sid, 0) + opt.get("voter_count", 0)
-    return scores
+    return _sum_daily_scores(get_poll_models(), None)
 
 
+@traced()
 def get_open_polls() -> dict:
     """Return {telegram_poll_id: poll_record} for all non-closed polls."""
-    results = load_json(POLL_RESULTS_FILE)
+    results = load_json(_p(POLL_RESULTS_FILE))
     return {pid: poll for pid, poll in results.items() if not poll.get("closed")}
 
 
+@traced()
 def get_poll(telegram_poll_id: str):
     """Return a single poll record or None."""
-    return load_json(POLL_RESULTS_FILE).get(telegram_poll_id)
+    return load_json(_p(POLL_RESULTS_FILE)).get(telegram_poll_id)
 
 
 # ---------------------------------------------------------------------------
 # Weekly results
 # ---------------------------------------------------------------------------
 
+@traced()
+@_exclusive
 def add_weekly_result(result: dict):
     """Append a weekly result summary."""
-    results = load_json(WEEKLY_RESULTS_FILE)
+    results = load_json(_p(WEEKLY_RESULTS_FILE))
     results.append(result)
-    save_json(WEEKLY_RESULTS_FILE, results)
+    save_json(_p(WEEKLY_RESULTS_FILE), results)
+    _update_stats(stats.add_final, result["top"])
 
 
+@traced()
 def get_latest_weekly():
     """Return the most recent weekly result, or None."""
-    results = load_json(WEEKLY_RESULTS_FILE)
+    results = load_json(_p(WEEKLY_RESULTS_FILE))
     return results[-1] if results else None
 
 
+@traced()
 def get_all_weekly_results() -> list:
     """Return all weekly results, newest first."""
-    results = load_json(WEEKLY_RESULTS_FILE)
-    results.reverse()
-    return results
+    return load_json(_p(WEEKLY_RESULTS_FILE))[::-1]
 
 
+@traced()
+@_exclusive
 def mark_weekly_revealed(index: int = -1):
     """Set revealed=True on a weekly result (default: latest)."""
-    results = load_json(WEEKLY_RESULTS_FILE)
-    if results:
+    results = load_json(_p(WEEKLY_RESULTS_FILE))
+    if results and not results[index].get("revealed"):
         results[index]["revealed"] = True
-        save_json(WEEKLY_RESULTS_FILE, results)
+        save_json(_p(WEEKLY_RESULTS_FILE), results)
+        winner = weekly_winner(results[index], get_poll(results[index]["poll_id"]))
+        if winner:
+            _update_stats(stats.add_win, winner)
+
+
+def weekly_winner(weekly: dict, poll: dict | None):
+    """Return the top entry of a weekly result by final vote count, or None."""
+    final_counts = {}
+    if poll:
+        for opt in poll["options"]:
+            final_counts[opt.get("suggestion_id")] = opt.get("voter_count", 0)
+    best = None
+    for entry in weekly["top"]:
+        votes = final_counts.get(entry["suggestion_id"], entry["votes"])
+        if votes > 0 and (best is None or votes > best[0]):
+            best = (votes, entry)
+    return best[1] if best else None
+
+
+# ---------------------------------------------------------------------------
+# Analytics rollups
+# ---------------------------------------------------------------------------
+
+def _option_counts(poll: dict) -> list[int]:
+    return [o.get("voter_count", 0) for o in poll["options"]]
+
+
+def _record_vote_changes(poll: dict, before: list[int]):
+    """Queue per-option count changes of a daily poll for the transaction's rollup."""
+    if poll["type"] != "daily":
+        return
+    suggestions = get_suggestion_models()
+    _vote_rollup.get().extend(
+        (suggestions[sid].author_id if sid in suggestions else None, old, new)
+        for sid, old, new in (
+            (opt.get("suggestion_id"), old, opt.get("voter_count", 0))
+            for opt, old in zip(poll["options"], before)
+        )
+        if new != old
+    )
+
+
+def _flush_vote_rollup():
+    """One stats.json update for all vote changes of the open transaction."""
+    changes = _vote_rollup.get()
+    if changes:
+        _update_stats(stats.apply_vote_changes, list(changes))
+        changes.clear()
+
+
+def _update_stats(fn, *args):
+    if not _exists(_p(STATS_FILE)):
+        # A fresh rebuild already reflects the change that was just saved
+        rebuild_stats()
+        return
+    rollups = load_json(_p(STATS_FILE))
+    fn(rollups, *args)
+    save_json(_p(STATS_FILE), rollups)
+
+
+@traced()
+def get_stats() -> dict:
+    """Return the rollup document, building it from history if it is missing."""
+    return _derived_index(STATS_FILE, lambda data: data, _build_stats, rebuild_stats)
+
+
+def _build_stats() -> dict:
+    rollups = stats.empty()
+    suggestions = load_json(_p(SUGGESTIONS_FILE))
+    stats.add_suggestions(rollups, suggestions)
+    authors = {s["id"]: s["author_id"] for s in suggestions}
+    polls = load_json(_p(POLL_RESULTS_FILE))
+    for poll in polls.values():
+        if poll["type"] != "daily":
+            continue
+        counts = _option_counts(poll)
+        stats.add_poll_options(rollups, [0] * len(counts))
+        stats.apply_vote_changes(rollups, [
+            (authors.get(opt.get("suggestion_id")), 0, c)
+            for opt, c in zip(poll["options"], counts)
+        ])
+    for weekly in load_json(_p(WEEKLY_RESULTS_FILE)):
+        stats.add_final(rollups, weekly["top"])
+        if weekly.get("revealed"):
+            winner = weekly_winner(weekly, polls.get(weekly["poll_id"]))
+            if winner:
+                stats.add_win(rollups, winner)
+    return rollups
+
+
+@traced()
+@_exclusive
+def rebuild_stats() -> dict:
+    """Recompute the rollups from scratch and save them."""
+    # The staged poll counts already include the transaction's vote changes
+    _vote_rollup.get().clear()
+    rollups = _build_stats()
+    save_json(_p(STATS_FILE), rollups)
+    return rollups
+
+
+@traced()
+def data_version() -> tuple:
+    """Cheap token that changes whenever suggestions, polls or weekly results do."""
+    return tuple(_file_stamp(_p(name)) for name in
+                 (SUGGESTIONS_FILE, POLL_RESULTS_FILE, WEEKLY_RESULTS_FILE))
+
+
+# ---------------------------------------------------------------------------
+# Read snapshots
+# ---------------------------------------------------------------------------
+
+class Snapshot:
+    """A consistent, read-only view of a chat's suggestions, polls and weekly results.
+
+    A snapshot never changes once handed out; treat its contents as frozen.
+    Derived values (unused suggestions, scores...) are computed once per
+    snapshot. A newer version shares every part whose file did not change.
+    """
+
+    __slots__ = ("version", "stamps", "suggestions", "polls", "weekly", "lifecycle",
+                 "_derived")
+
+    def __init__(self, version: int, stamps: tuple | None,
+                 suggestions: dict[str, Suggestion], polls: dict[str, Poll],
+                 weekly: tuple[dict, ...], lifecycle: LifecycleIndex):
+        self.version = version
+        self.stamps = stamps
+        self.suggestions = suggestions
+        self.polls = polls
+        self.weekly = weekly  # newest first
+        self.lifecycle = lifecycle
+        self._derived: dict = {}
+
+    def _derive(self, name: str, build):
+        if name not in self._derived:
+            self._derived[name] = build()
+        return self._derived[name]
+
+    def _in_state(self, state: str) -> tuple[Suggestion, ...]:
+        return self._derive(state, lambda: tuple(
+            self.suggestions[sid] for sid in self.lifecycle.ids(state)
+            if sid in self.suggestions))
+
+    @property
+    def unused(self) -> tuple[Suggestion, ...]:
+        """Suggestions not yet put into a daily poll, in submission order."""
+        return self._in_state(lifecycle.PENDING)
+
+    @property
+    def scored(self) -> tuple[Suggestion, ...]:
+        """Polled suggestions whose polls are all closed."""
+        return self._in_state(lifecycle.SCORED)
+
+    @property
+    def daily_scores(self) -> dict:
+        """{suggestion_id: votes} summed over all daily polls."""
+        return self._derive("daily_scores", lambda: _sum_daily_scores(self.polls, None))
+
+
+# data_dir -> latest published Snapshot
+_snapshots: dict[str, Snapshot] = {}
+
+
+def _build_weekly(raw: list) -> tuple:
+    return tuple(reversed(raw))
+
+
+def _snapshot_stamps() -> tuple:
+    return data_version() + (_file_stamp(_p(LIFECYCLE_FILE)),)
+
+
+def _read_snapshot(prev: Snapshot | None, stamps: tuple | None) -> Snapshot:
+    def part(i, name, build, previous):
+        if prev is not None and stamps is not None and prev.stamps[i] == stamps[i]:
+            return previous
+        if name == LIFECYCLE_FILE:
+            return _lifecycle_index()
+        return _cached(_p(name), build)
+
+    return Snapshot(
+        (prev.version + 1) if prev else 1,
+        stamps,
+        part(0, SUGGESTIONS_FILE, _build_suggestions, prev and prev.suggestions),
+        part(1, POLL_RESULTS_FILE, _build_polls, prev and prev.polls),
+        part(2, WEEKLY_RESULTS_FILE, _build_weekly, prev and prev.weekly),
+        part(3, LIFECYCLE_FILE, None, prev and prev.lifecycle),
+    )
+
+
+@traced()
+def snapshot() -> Snapshot:
+    """The current read snapshot of the chat bound to this task.
+
+    Readers never take the write lock. Files are read only when they changed
+    since the last published version; while another commit is half-applied
+    (its journal is not empty) the previous version is returned instead.
+    Inside a transaction the view includes the staged writes and is not
+    published.
+    """
+    if in_transaction():
+        return _read_snapshot(None, None)
+    ns = current_namespace()
+    prev = _snapshots.get(ns)
+    for _ in range(3):
+        stamps = _snapshot_stamps()
+        if prev is not None and prev.stamps == stamps:
+            return prev
+        journal = _file_stamp(_p(JOURNAL_FILE))
+        if journal and journal[1] and prev is not None:
+            return prev
+        snap = _read_snapshot(prev, stamps)
+        # A writer that slipped in while the parts were read: try again
+        if _snapshot_stamps() == stamps:
+            _snapshots[ns] = snap
+            return snap
+    return prev or snap
+
+
+# ---------------------------------------------------------------------------
+# Chat metadata
+# ---------------------------------------------------------------------------
+
+def get_meta(key: str, default=None):
+    """Small per-chat bookkeeping values (e.g. what was already announced)."""
+    return load_json(_p(META_FILE)).get(key, default)
+
+
+@_exclusive
+def set_meta(key: str, value):
+    meta = load_json(_p(META_FILE))
+    meta[key] = value
+    save_json(_p(META_FILE), meta)
+
+
+# ---------------------------------------------------------------------------
+# Update offset
+# ---------------------------------------------------------------------------
+
+def _offset_path() -> str:
+    return os.path.join(DEFAULT_DATA_DIR, UPDATE_OFFSET_FILE)
+
+
+def get_update_offset() -> int | None:
+    """Id of the last fully processed Telegram update, or None if unknown."""
+    return load_json(_offset_path()).get("update_id")
+
+
+def set_update_offset(update_id: int):
+    save_json(_offset_path(), {"update_id": update_id})
 
 
 # ---------------------------------------------------------------------------
 # Subscribers
 # ---------------------------------------------------------------------------
 
+class SubscriberStore:
+    """Subscribers keyed by user_id, mirrored to a JSON list on disk.
+
+    The mapping is replaced (never mutated in place) on every change, so a
+    page iterator started before a change keeps walking a consistent view.
+    Changes made by another process are picked up via the file's mtime.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._by_id: dict[int, dict] = {}
+        self._stamp = None
+
+    def _current(self) -> dict[int, dict]:
+        stamp = _file_stamp(self.path)
+        if stamp != self._stamp:
+            self._by_id = {s["user_id"]: s for s in load_json(self.path)}
+            self._stamp = stamp
+        return self._by_id
+
+    def _commit(self, by_id: dict[int, dict]):
+        save_json(self.path, list(by_id.values()))
+        self._by_id = by_id
+        # Inside a transaction the file only changes on commit: re-read it then
+        self._stamp = None if in_transaction() else _file_stamp(self.path)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._current()
+
+    def __len__(self) -> int:
+        return len(self._current())
+
+    @_exclusive
+    def add_many(self, users: list[tuple[int, str]]) -> int:
+        """Add (user_id, first_name) pairs with one write. Returns how many were new."""
+        current = self._current()
+        now = clock.now(timezone.utc).isoformat()
+        fresh = {}
+        for user_id, first_name in users:
+            if user_id not in current and user_id not in fresh:
+                fresh[user_id] = {
+                    "user_id": user_id,
+                    "first_name": first_name,
+                    "subscribed_at": now,
+                }
+        if fresh:
+            self._commit({**current, **fresh})
+        return len(fresh)
+
+    @_exclusive
+    def remove_many(self, user_ids) -> int:
+        """Remove subscribers with one write. Returns how many were removed."""
+        current = self._current()
+        drop = {uid for uid in user_ids if uid in current}
+        if drop:
+            self._commit({uid: s for uid, s in current.items() if uid not in drop})
+        return len(drop)
+
+    def iter_pages(self, page_size: int = 100):
+        """Yield subscribers in lists of at most *page_size* records."""
+        page = []
+        for sub in self._current().values():
+            page.append(sub)
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+
+_subscriber_stores: dict[str, SubscriberStore] = {}
+
+
+def subscribers() -> SubscriberStore:
+    """Subscriber store of the current namespace."""
+    path = _p(SUBSCRIBERS_FILE)
+    store = _subscriber_stores.get(path)
+    if store is None:
+        store = _subscriber_stores[path] = SubscriberStore(path)
+    return store
+
+
+@traced()
 def add_subscriber(user_id: int, first_name: str):
     """Idempotently add a subscriber. Returns True if new, False if already present."""
-    subscribers = load_json(SUBSCRIBERS_FILE)
-    for s in subscribers:
-        if s["user_id"] == user_id:
-            return False
-    subscribers.append({
-        "user_id": user_id,
-        "first_name": first_name,
-        "subscribed_at": datetime.now(timezone.utc).isoformat(),
-    })
-    save_json(SUBSCRIBERS_FILE, subscribers)
-    return True
+    return subscribers().add_many([(user_id, first_name)]) == 1
 
 
+@traced()
 def remove_subscriber(user_id: int):
     """Remove a subscriber by user_id."""
-    subscribers = load_json(SUBSCRIBERS_FILE)
-    new_list = [s for s in subscribers if s["user_id"] != user_id]
-    if len(new_list) != len(subscribers):
-        save_json(SUBSCRIBERS_FILE, new_list)
+    subscribers().remove_many([user_id])
 
 
+@traced()
 def get_all_subscribers() -> list:
     """Return all subscribers."""
-    return load_json(SUBSCRIBERS_FILE)
+    return [sub for page in subscribers().iter_pages() for sub in page]
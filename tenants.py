@@ -0,0 +1,120 @@
+"""Several group chats (tenants) served from one process.
+
+config.json either describes a single chat at the top level (the original
+layout) or lists chats under "chats". Each chat entry overrides the
+top-level values, so shared settings (token, admins, schedule defaults)
+are written once:
+
+    {
+      "bot_token": "...",
+      "timezone": "Europe/Berlin",
+      "chats": [
+        {"key": "band", "chat_id": -100111, "daily_poll_hour": 21},
+        {"key": "choir", "chat_id": -100222, "timezone": "Asia/Tbilisi"}
+      ]
+    }
+
+A tenant config is the merged dict plus "key" and "data_dir". While an
+update or a job is handled, the tenant is bound with use(), which also
+switches the storage namespace.
+"""
+
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import storage
+
+_current: ContextVar[dict | None] = ContextVar("tenant", default=None)
+
+# Populated by configure()
+TENANTS: dict[str, dict] = {}
+_by_chat: dict[int, dict] = {}
+_poll_owner: dict[str, str] = {}
+
+
+def load_tenants(config: dict) -> dict[str, dict]:
+    """Return {key: tenant_config} built from the root config."""
+    chats = config.get("chats")
+    if not chats:
+        single = dict(config)
+        single.setdefault("key", "main")
+        single.setdefault("data_dir", storage.DEFAULT_DATA_DIR)
+        return {single["key"]: single}
+
+    base = {k: v for k, v in config.items() if k != "chats"}
+    tenants = {}
+    for chat in chats:
+        tenant = {**base, **chat}
+        key = str(chat.get("key") or chat["chat_id"])
+        tenant["key"] = key
+        tenant.setdefault("data_dir", os.path.join(storage.DEFAULT_DATA_DIR, key))
+        if key in tenants:
+            raise ValueError(f"duplicate chat key {key!r} in config")
+        tenants[key] = tenant
+    return tenants
+
+
+def configure(config: dict) -> dict[str, dict]:
+    """Load tenants from *config* and make them the active set."""
+    TENANTS.clear()
+    TENANTS.update(load_tenants(config))
+    _by_chat.clear()
+    _by_chat.update({t["chat_id"]: t for t in TENANTS.values()})
+    _poll_owner.clear()
+    return TENANTS
+
+
+def default() -> dict:
+    """The first configured chat; serves private chats without a tenant hint."""
+    return next(iter(TENANTS.values()))
+
+
+def current() -> dict:
+    """Tenant bound to the running update/job (the default one if none is)."""
+    return _current.get() or default()
+
+
+def for_chat(chat_id: int | None) -> dict | None:
+    return _by_chat.get(chat_id)
+
+
+def for_key(key: str | None) -> dict | None:
+    return TENANTS.get(key) if key else None
+
+
+def for_poll(poll_id: str) -> dict | None:
+    """Find the tenant that owns *poll_id* (poll updates carry no chat)."""
+    key = _poll_owner.get(poll_id)
+    if key in TENANTS:
+        return TENANTS[key]
+    for tenant in TENANTS.values():
+        with storage.namespace(tenant["data_dir"]):
+            if poll_id in storage.get_poll_models():
+                _poll_owner[poll_id] = tenant["key"]
+                return tenant
+    return None
+
+
+@contextmanager
+def use(tenant: dict):
+    """Bind *tenant* (and its storage namespace) for the duration of the block."""
+    token = _current.set(tenant)
+    try:
+        with storage.namespace(tenant["data_dir"]):
+            yield tenant
+    finally:
+        _current.reset(token)
+
+
+def start_payload(tenant: dict, action: str) -> str:
+    """Deep-link payload for *action*, tagged with the tenant when there are several."""
+    if len(TENANTS) <= 1 or tenant["key"] == default()["key"]:
+        return action
+    return f"{action}_{tenant['key']}"
+
+
+def parse_payload(payload: str) -> tuple[str, dict]:
+    """Split a /start payload into (action, tenant)."""
+    action, _, key = payload.partition("_")
+    return action, for_key(key) or default()
@@ -0,0 +1,230 @@
+"""In-memory text indexes over suggestion names.
+
+Classes here are plain data structures with to_dict/from_dict; storage
+owns persisting them next to the data files and keeping them in sync
+with every mutation. Storage changes a copy() and swaps it in on commit.
+A copy shares the posting sets and docs of the original and copies a set
+or doc only when it first changes it, so copying stays cheap and the
+original is never touched.
+"""
+
+import bisect
+import math
+import unicodedata
+
+
+def normalize_name(name: str) -> str:
+    """Casefold, fold ё→е, drop punctuation/symbols and collapse whitespace."""
+    text = name.casefold().replace("ё", "е")
+    chars = [
+        " " if unicodedata.category(ch)[0] in "PSZC" else ch
+        for ch in text
+    ]
+    return " ".join("".join(chars).split())
+
+
+def trigrams(normalized: str) -> set[str]:
+    """Character trigrams of a normalized name, padded so word edges count."""
+    if not normalized:
+        return set()
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def check_threshold(threshold) -> None:
+    """Raise ValueError unless *threshold* is a usable similarity in (0, 1]."""
+    if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) \
+            or not 0 < threshold <= 1:
+        raise ValueError(f"near_duplicate_threshold must be in (0, 1], got {threshold!r}")
+
+
+class TrigramIndex:
+    """Inverted index trigram → suggestion ids, queried by Dice similarity.
+
+    A query only touches the posting lists of its rarest trigrams: any name
+    reaching the threshold must share at least one of them, and candidates
+    outside the feasible length range are skipped before scoring. Only the
+    normalized names are persisted; the postings are derived on load, since
+    they are several times larger than the names and every add would
+    rewrite them.
+    """
+
+    def __init__(self):
+        self.names: dict[str, str] = {}       # sid -> normalized name
+        self.grams: dict[str, set[str]] = {}  # trigram -> sids
+        # Trigrams whose posting set this copy owns (None: all of them)
+        self._owned: set[str] | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TrigramIndex":
+        index = cls()
+        index.names = dict(data.get("names", {}))
+        for sid, normalized in index.names.items():
+            for g in trigrams(normalized):
+                index.grams.setdefault(g, set()).add(sid)
+        return index
+
+    def to_dict(self) -> dict:
+        return {"names": self.names}
+
+    def copy(self) -> "TrigramIndex":
+        index = TrigramIndex()
+        index.names = dict(self.names)
+        index.grams = dict(self.grams)
+        index._owned = set()
+        return index
+
+    def _posting(self, g: str) -> set[str]:
+        """Posting set of *g* that may be changed in place."""
+        posting = self.grams.get(g)
+        if posting is None or (self._owned is not None and g not in self._owned):
+            posting = self.grams[g] = set(posting or ())
+            if self._owned is not None:
+                self._owned.add(g)
+        return posting
+
+    def add(self, sid: str, name: str):
+        normalized = normalize_name(name)
+        self.names[sid] = normalized
+        for g in trigrams(normalized):
+            self._posting(g).add(sid)
+
+    def remove(self, sid: str):
+        normalized = self.names.pop(sid, None)
+        if normalized is None:
+            return
+        for g in trigrams(normalized):
+            if g in self.grams:
+                posting = self._posting(g)
+                posting.discard(sid)
+                if not posting:
+                    del self.grams[g]
+
+    def similar(self, name: str, threshold: float) -> list[tuple[str, float]]:
+        """Return [(sid, similarity)] with Dice similarity >= threshold, best first."""
+        query = trigrams(normalize_name(name))
+        if not query:
+            return []
+        q = len(query)
+        # Dice >= t implies the overlap is at least t*q/(2-t) trigrams, so
+        # every match shares one of the (q - min_overlap + 1) rarest ones.
+        min_overlap = max(1, math.ceil(threshold * q / (2 - threshold)))
+        probe = sorted(query, key=lambda g: len(self.grams.get(g, ())))
+        candidates = set()
+        for g in probe[:q - min_overlap + 1]:
+            candidates.update(self.grams.get(g, ()))
+
+        lo, hi = q * threshold / (2 - threshold), q * (2 - threshold) / threshold
+        matches = []
+        for sid in candidates:
+            other = trigrams(self.names[sid])
+            if not lo <= len(other) <= hi:
+                continue
+            score = 2 * len(query & other) / (q + len(other))
+            if score >= threshold:
+                matches.append((sid, score))
+        matches.sort(key=lambda m: -m[1])
+        return matches
+
+
+class TokenIndex:
+    """Word inverted index with prefix lookup.
+
+    docs maps suggestion id → {"name", "polled_at"} where polled_at is the
+    ISO time of the latest daily poll the name appeared in (None if never
+    polled). Vote totals are not kept here: they change with every vote and
+    are read from the poll results instead. Only docs are persisted;
+    postings are derived when the index is loaded.
+    """
+
+    def __init__(self):
+        self.docs: dict[str, dict] = {}
+        self.postings: dict[str, set[str]] = {}
+        self._sorted_tokens: list[str] = []
+        # Tokens whose posting set this copy owns (None: all of them)
+        self._owned: set[str] | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TokenIndex":
+        index = cls()
+        for sid, doc in data.get("docs", {}).items():
+            index.docs[sid] = {"name": doc["name"], "polled_at": doc.get("polled_at")}
+            for token in normalize_name(doc["name"]).split():
+                index.postings.setdefault(token, set()).add(sid)
+        # One sort instead of an insort per token
+        index._sorted_tokens = sorted(index.postings)
+        return index
+
+    def to_dict(self) -> dict:
+        return {"docs": self.docs}
+
+    def copy(self) -> "TokenIndex":
+        index = TokenIndex()
+        index.docs = dict(self.docs)
+        index.postings = dict(self.postings)
+        index._sorted_tokens = list(self._sorted_tokens)
+        index._owned = set()
+        return index
+
+    def _posting(self, token: str) -> set[str]:
+        """Posting set of *token* that may be changed in place."""
+        posting = self.postings.get(token)
+        if posting is None or (self._owned is not None and token not in self._owned):
+            if posting is None:
+                bisect.insort(self._sorted_tokens, token)
+            posting = self.postings[token] = set(posting or ())
+            if self._owned is not None:
+                self._owned.add(token)
+        return posting
+
+    def _index(self, sid: str, doc: dict):
+        self.docs[sid] = doc
+        for token in normalize_name(doc["name"]).split():
+            self._posting(token).add(sid)
+
+    def add(self, sid: str, name: str):
+        self._index(sid, {"name": name, "polled_at": None})
+
+    def remove(self, sid: str):
+        doc = self.docs.pop(sid, None)
+        if doc is None:
+            return
+        for token in normalize_name(doc["name"]).split():
+            if token not in self.postings:
+                continue
+            posting = self._posting(token)
+            posting.discard(sid)
+            if not posting:
+                del self.postings[token]
+                i = bisect.bisect_left(self._sorted_tokens, token)
+                del self._sorted_tokens[i]
+
+    def mark_polled(self, sid: str, when: str):
+        doc = self.docs.get(sid)
+        if doc is not None:
+            self.docs[sid] = {**doc, "polled_at": when}
+
+    def reset_polled(self):
+        self.docs = {sid: {**doc, "polled_at": None} for sid, doc in self.docs.items()}
+
+    def _prefix(self, prefix: str) -> set[str]:
+        matched = set()
+        i = bisect.bisect_left(self._sorted_tokens, prefix)
+        while i < len(self._sorted_tokens) and self._sorted_tokens[i].startswith(prefix):
+            matched |= self.postings[self._sorted_tokens[i]]
+            i += 1
+        return matched
+
+    def search(self, query: str) -> list[tuple[str, dict]]:
+        """Return [(sid, doc)] whose names contain a word starting with every query word."""
+        words = normalize_name(query).split()
+        if not words:
+            return []
+        # Start from the most selective word
+        hits = None
+        for word in sorted(words, key=len, reverse=True):
+            matched = self._prefix(word)
+            hits = matched if hits is None else hits & matched
+            if not hits:
+                return []
+        return [(sid, self.docs[sid]) for sid in hits]
@@ -0,0 +1,82 @@
+"""Summarize a traces JSONL file: slowest traces and their critical paths.
+
+Usage: python trace_report.py [data/traces.jsonl] [--top N] [--name PREFIX]
+"""
+
+import argparse
+import json
+from collections import defaultdict
+
+
+def load_traces(path: str) -> dict[str, list[dict]]:
+    """Group span records by trace_id."""
+    traces: dict[str, list[dict]] = defaultdict(list)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                span = json.loads(line)
+                traces[span["trace_id"]].append(span)
+    return traces
+
+
+def critical_path(spans: list[dict]) -> list[dict]:
+    """Follow, from the root, the child that finishes last at every level.
+
+    That child is what the parent was waiting on, so the chain is the
+    sequence of spans that determined the trace's end-to-end duration.
+    """
+    children: dict[str | None, list[dict]] = defaultdict(list)
+    for s in spans:
+        children[s["parent_id"]].append(s)
+    roots = children.get(None)
+    if not roots:
+        return []
+    path = [roots[0]]
+    while children.get(path[-1]["span_id"]):
+        path.append(max(children[path[-1]["span_id"]],
+                        key=lambda s: s["start"] + s["duration_ms"] / 1000))
+    return path
+
+
+def self_times(spans: list[dict]) -> dict[str, float]:
+    """Total time per span name minus time spent in its direct children."""
+    child_ms: dict[str, float] = defaultdict(float)
+    for s in spans:
+        if s["parent_id"]:
+            child_ms[s["parent_id"]] += s["duration_ms"]
+    totals: dict[str, float] = defaultdict(float)
+    for s in spans:
+        totals[s["name"]] += max(0.0, s["duration_ms"] - child_ms[s["span_id"]])
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", default="data/traces.jsonl")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--name", help="only traces whose root name starts with this")
+    args = parser.parse_args()
+
+    ranked = []
+    for trace_id, spans in load_traces(args.path).items():
+        root = next((s for s in spans if s["parent_id"] is None), None)
+        if root is None:
+            continue
+        if args.name and not root["name"].startswith(args.name):
+            continue
+        ranked.append((root["duration_ms"], trace_id, root, spans))
+    ranked.sort(key=lambda r: -r[0])
+
+    print(f"Traces: {len(ranked)}\n")
+    for duration, trace_id, root, spans in ranked[:args.top]:
+        print(f"{duration:9.1f} ms  {root['name']}  trace={trace_id}  spans={len(spans)}")
+        for depth, s in enumerate(critical_path(spans)[1:], 1):
+            print(f"{'':13}{'  ' * depth}└ {s['name']} {s['duration_ms']:.1f} ms")
+        hot = sorted(self_times(spans).items(), key=lambda kv: -kv[1])[:3]
+        print(f"{'':13}self time: " + ", ".join(f"{n} {ms:.1f} ms" for n, ms in hot))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Lightweight per-update / per-job tracing exported as JSON lines.
+
+A trace is started for each update handler and each scheduler job run;
+storage calls, rendering and outbound Telegram requests made inside it
+become nested spans. Spans are buffered per trace and written by a
+background thread once the root span ends, so the event loop never does
+the file I/O. Use trace_report.py to summarize the output.
+"""
+
+import atexit
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar["_Span | None"] = ContextVar("trace_span", default=None)
+
+# Configured by configure(); tracing is off until then.
+_enabled = False
+_sample_rate = 0.0
+_slow_ms = None
+_exporter: "_Exporter | None" = None
+
+
+class _Trace:
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.spans: list[dict] = []
+
+
+class _Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attrs", "start", "t0")
+
+    def __init__(self, trace: _Trace, name: str, parent_id: str | None, attrs: dict):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.t0 = time.perf_counter()
+
+    def finish(self, error: BaseException | None):
+        record = {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round((time.perf_counter() - self.t0) * 1000, 3),
+        }
+        if self.attrs:
+            record["attrs"] = self.attrs
+        if error is not None:
+            record["error"] = type(error).__name__
+        self.trace.spans.append(record)
+        return record
+
+
+class _Exporter:
+    """Append finished traces to a JSONL file from a daemon thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter",
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, spans: list[dict]):
+        self._queue.put(spans)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        while True:
+            spans = self._queue.get()
+            if spans is None:
+                return
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for span in spans:
+                        f.write(json.dumps(span, ensure_ascii=False) + "\n")
+            except OSError:
+                logger.exception("Не удалось записать трейс в %s", self.path)
+
+
+def configure(config: dict):
+    """Enable tracing according to config.
+
+    trace_sample_rate — fraction of traces kept (0 disables tracing).
+    trace_slow_ms — traces slower than this are kept regardless of sampling.
+    trace_file — output path (default data/traces.jsonl).
+    """
+    global _enabled, _sample_rate, _slow_ms, _exporter
+    _sample_rate = float(config.get("trace_sample_rate", 0.0))
+    _slow_ms = config.get("trace_slow_ms")
+    _enabled = _sample_rate > 0 or _slow_ms is not None
+    if _enabled and _exporter is None:
+        _exporter = _Exporter(config.get("trace_file", "data/traces.jsonl"))
+        atexit.register(_exporter.close)
+
+
+def current_trace_id() -> str | None:
+    span = _current.get()
+    return span.trace.trace_id if span else None
+
+
+@contextmanager
+def span(name: str, root: bool = False, **attrs):
+    """Record a span named *name*.
+
+    Inside an active trace this is a child of the current span. Outside one
+    it is a no-op, unless *root* is set, in which case a new trace starts.
+    """
+    parent = _current.get()
+    if parent is None and not (root and _enabled):
+        yield
+        return
+
+    if parent is None:
+        sp = _Span(_Trace(), name, None, attrs)
+    else:
+        sp = _Span(parent.trace, name, parent.span_id, attrs)
+    token = _current.set(sp)
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        record = sp.finish(error)
+        if parent is None:
+            _end_trace(sp.trace, record["duration_ms"])
+
+
+def _end_trace(trace: _Trace, duration_ms: float):
+    keep = random.random() < _sample_rate
+    if not keep and _slow_ms is not None and duration_ms >= _slow_ms:
+        keep = True
+    if keep and _exporter is not None:
+        _exporter.submit(trace.spans)
+
+
+def traced(name: str | None = None, root: bool = False):
+    """Decorator form of span() for sync and async functions."""
+    def decorate(func):
+        span_name = name or f"{func.__module__}.{func.__name__}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, root=root):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, root=root):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def trace_handler(callback):
+    """Wrap a PTB handler callback so every update gets its own trace."""
+    span_name = f"handler.{callback.__name__}"
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        with span(span_name, root=True, update_id=update.update_id):
+            return await callback(update, context)
+
+    return wrapper
+
+
+class TracedRequest(HTTPXRequest):
+    """HTTPXRequest that records each Bot API call as a span."""
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        with span("telegram." + url.rsplit("/", 1)[-1]):
+            return await super().do_request(
+                url, method,
+                request_data=request_data,
+                read_timeout=read_timeout,
+                write_timeout=write_timeout,
+                connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout,
+            )